@@ -1,7 +1,11 @@
 import os
+import re
 import google.generativeai as genai
 from dotenv import load_dotenv
-from typing import Optional
+from typing import Dict, List, Optional
+from llm_client import generate_content
+from content_pool import ContentPool, chunk_counts, parse_batch
+from prompts import render_prompt
 
 # Load environment variables
 load_dotenv()
@@ -18,6 +22,15 @@ generation_config = {
     "max_output_tokens": 100,
 }
 
+# Most affirmations requested in one batched Gemini call
+AFFIRMATION_BATCH_MAX_ITEMS = int(os.getenv("AFFIRMATION_BATCH_MAX_ITEMS", "50"))
+
+# Affirmations longer than this are discarded
+AFFIRMATION_MAX_CHARS = 120
+
+# Output tokens budgeted per affirmation in a batch (text plus JSON syntax)
+BATCH_TOKENS_PER_AFFIRMATION = 40
+
 # Emotion-specific prompts for better context
 EMOTION_PROMPTS = {
     "happy": "Create an affirmation that celebrates and reinforces positive feelings",
@@ -48,25 +61,15 @@ def generate_affirmation(emotion: str) -> Optional[str]:
         emotion_prompt = EMOTION_PROMPTS.get(emotion, EMOTION_PROMPTS["neutral"])
         
         # Construct the full prompt
-        prompt = f"""As an empathetic AI therapist, {emotion_prompt}.
-        The affirmation should be:
-        - Short (one sentence, max 100 characters)
-        - Personal (using "I" or "my")
-        - Present tense
-        - Positive and empowering
-        - Specific to someone feeling {emotion}
-        
-        Return only the affirmation text, nothing else."""
+        prompt = render_prompt('affirmation', instruction=emotion_prompt, emotion=emotion)
         
-        # Create Gemini model with appropriate configuration
-        model = genai.GenerativeModel(
-            model_name="models/gemini-1.5-flash",
-            generation_config=generation_config
+        # Generate the affirmation with the shared model instance
+        response = generate_content(
+            prompt,
+            generation_config=generation_config,
+            route='affirmation'
         )
         
-        # Generate the affirmation
-        response = model.generate_content(prompt)
-        
         # Extract and clean the affirmation
         if response and hasattr(response, 'text'):
             affirmation = response.text.strip()
@@ -80,6 +83,80 @@ def generate_affirmation(emotion: str) -> Optional[str]:
         print(f"Error generating affirmation: {str(e)}")
         return None
 
+_FIRST_PERSON_RE = re.compile(r"\b(i|i'm|i am|my|me|myself)\b", re.IGNORECASE)
+
+def clean_affirmation(text) -> Optional[str]:
+    """
+    Validates one generated affirmation.
+
+    Returns:
+        str: The affirmation without surrounding quotes, or None if it isn't a
+            short, single-line, first-person statement
+    """
+    if not isinstance(text, str):
+        return None
+    text = text.strip().strip('"\'').strip()
+    if not text or '\n' in text or len(text) > AFFIRMATION_MAX_CHARS:
+        return None
+    if not _FIRST_PERSON_RE.search(text):
+        return None
+    return text
+
+def _request_affirmation_batch(counts: Dict[str, int]) -> Dict[str, List[str]]:
+    """One Gemini call returning {emotion: [affirmations]} as JSON"""
+    wanted = '\n'.join(
+        f'- "{emotion}": {count} affirmations. {EMOTION_PROMPTS[emotion]}.'
+        for emotion, count in counts.items()
+    )
+    prompt = render_prompt('affirmation_batch', wanted=wanted)
+
+    batch_config = dict(generation_config)
+    batch_config["max_output_tokens"] = BATCH_TOKENS_PER_AFFIRMATION * sum(counts.values()) + 50
+    response = generate_content(
+        prompt,
+        generation_config=batch_config,
+        route='affirmation_batch'
+    )
+    if not response or not hasattr(response, 'text'):
+        return {}
+    return parse_batch(response.text, counts)
+
+def generate_affirmation_batch(counts: Dict[str, int]) -> Dict[str, List[str]]:
+    """
+    Generates affirmations for several emotions with as few Gemini calls as possible.
+
+    Up to AFFIRMATION_BATCH_MAX_ITEMS affirmations are requested per call as a
+    JSON object. Invalid entries are dropped and duplicates (within the batch,
+    across emotions, or matching a default affirmation) are removed.
+
+    Args:
+        counts (dict): {emotion: number of affirmations wanted}
+
+    Returns:
+        dict: {emotion: [affirmation, ...]}, possibly with fewer items than asked
+            for, or none for emotions whose generation failed
+    """
+    counts = {emotion.lower(): count for emotion, count in counts.items()
+              if count > 0 and emotion.lower() in EMOTION_PROMPTS}
+    seen = {affirmation.lower() for affirmation in DEFAULT_AFFIRMATIONS.values()}
+    results = {}
+    for chunk in chunk_counts(counts, AFFIRMATION_BATCH_MAX_ITEMS):
+        try:
+            batch = _request_affirmation_batch(chunk)
+        except Exception as e:
+            print(f"Error generating affirmation batch: {str(e)}")
+            continue
+        for emotion, texts in batch.items():
+            for text in texts:
+                affirmation = clean_affirmation(text)
+                if affirmation is None or affirmation.lower() in seen:
+                    continue
+                seen.add(affirmation.lower())
+                results.setdefault(emotion, []).append(affirmation)
+                if len(results[emotion]) >= chunk[emotion]:
+                    break
+    return results
+
 # Default affirmations as fallback
 DEFAULT_AFFIRMATIONS = {
     "happy": "I embrace and celebrate the joy in my life.",
@@ -94,9 +171,14 @@ DEFAULT_AFFIRMATIONS = {
     "confident": "I trust in my abilities and inner strength."
 }
 
+# Pre-generated affirmations per emotion, refilled in the background with batched calls
+affirmation_pool = ContentPool('affirmation', EMOTION_PROMPTS.keys(), generate_affirmation,
+                               generate_batch=generate_affirmation_batch)
+
 def get_affirmation(emotion: str) -> str:
     """
-    Gets an affirmation for the given emotion, falling back to defaults if generation fails.
+    Gets a pre-generated affirmation for the given emotion, falling back to defaults
+    if its pool is empty. Never waits on the LLM.
     
     Args:
         emotion (str): The detected emotion
@@ -104,14 +186,14 @@ def get_affirmation(emotion: str) -> str:
     Returns:
         str: An affirmation string
     """
-    # Try to generate a custom affirmation
-    affirmation = generate_affirmation(emotion)
+    emotion = emotion.lower()
+    affirmation = affirmation_pool.pop(emotion if emotion in EMOTION_PROMPTS else "neutral")
     
-    # Fall back to default if generation fails
+    # Fall back to default if the pool is empty
     if not affirmation:
         return DEFAULT_AFFIRMATIONS.get(
-            emotion.lower(),
+            emotion,
             "I am worthy of love, respect, and positive energy."
         )
     
-    return affirmation 
\ No newline at end of file
+    return affirmation
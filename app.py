@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, render_template, session, redirect, url_for
+from flask import Flask, request, jsonify, render_template, session, redirect, url_for, Response, stream_with_context
 import google.generativeai as genai
 import os
 import time
@@ -8,14 +8,29 @@ import json
 import requests
 from datetime import datetime, date, timedelta
 from dotenv import load_dotenv
-from functools import wraps
+from functools import wraps, partial
 import firebase_admin
 from firebase_admin import credentials, auth, firestore
-from mood_tracker import MoodTracker, MoodEntry
-from emotion_detector import detect_emotion
-from typing import Optional
+from mood_tracker import (MoodTracker, MoodEntry, DETECTED_EMOTION_TO_MOOD, AUTO_DETECTED_NOTE_PREFIX,
+                          AUTO_DETECTED_NOTE_MAX_CHARS)
+from emotion_batcher import detect_emotion, get_emotion_batcher
+from emotion_cache import emotion_cache, cache_key
+from emotion_detector import is_emotion_model_ready, is_emotion_service_ready, warm_up_emotion_model
 import re
-from affirmations import get_affirmation
+from affirmations import get_affirmation, affirmation_pool
+from quotes import next_quote, quote_pool
+from crisis_detector import screen_message
+from llm_client import generate_content, stream_content, get_llm_stats, get_llm_health, LLMUnavailableError
+from background_tasks import request_io, background_writes
+from response_cache import response_cache
+from chat_context import (build_chat_prompt, has_history, summary_refresh_due, compact_summary,
+                          claim_summary_refresh, release_summary_refresh)
+from prompts import render_prompt
+from chat_store import ChatStore, CHAT_LIST_PAGE_SIZE, MESSAGE_PAGE_SIZE, MAX_PAGE_SIZE
+from quote_store import QuoteStore, QUOTE_PAGE_SIZE
+from sqlite_storage import open_local_storage
+from storage import open_storage
+from single_flight import message_flights, IDEMPOTENCY_TTL_S, DUPLICATE_WINDOW_S, SINGLE_FLIGHT_WAIT_S
 import math
 
 def is_crisis_message(text):
@@ -31,35 +46,8 @@ def is_crisis_message(text):
     if not text or not isinstance(text, str):
         return False
         
-    # Convert to lowercase for case-insensitive matching
-    text = text.lower()
-    
-    # Crisis keywords related to suicide, self-harm, and panic
-    crisis_keywords = [
-        # Suicide-related
-        'suicide', 'kill myself', 'end my life', 'take my life', 'don\'t want to live',
-        'no reason to live', 'better off dead', 'want to die', 'rather be dead',
-        'should just die', 'going to end it', 'saying goodbye', 'final goodbye',
-        
-        # Self-harm related
-        'cut myself', 'cutting myself', 'harm myself', 'hurt myself', 'self-harm',
-        'self harm', 'injure myself', 'burning myself', 'hurting myself',
-        
-        # Severe distress/panic
-        'can\'t breathe', 'heart racing', 'panic attack', 'having a breakdown',
-        'losing control', 'can\'t take it anymore', 'unbearable pain', 'overwhelmed',
-        'no way out', 'trapped', 'hopeless', 'helpless',
-        
-        # Immediate danger
-        'overdose', 'pills', 'gun', 'jump', 'hanging', 'bridge', 'roof'
-    ]
-    
-    # Check for presence of any crisis keywords
-    for keyword in crisis_keywords:
-        if keyword in text:
-            return True
-            
-    return False
+    # Lexical gate first; ambiguous keyword hits are confirmed by the emotion model
+    return screen_message(text, need_emotion=False).is_crisis
 
 def get_calming_resources():
     """
@@ -105,6 +93,40 @@ def get_crisis_response():
     """
     return "I notice you may be going through a difficult time right now. Your safety and well-being are important. Please consider reaching out to a mental health professional or crisis support service who can provide immediate help. Remember that you're not alone, and support is available 24/7."
 
+def _write_crisis_log(entry):
+    try:
+        db.collection('crisis_logs').add(entry)
+    except Exception as e:
+        print(f"Error logging crisis message: {str(e)}")
+
+def log_crisis_message(user_id, message, timestamp, screening, session_type=None, chat_id=None):
+    """
+    Records a crisis message in the crisis_logs collection off the response path.
+    
+    Args:
+        user_id (str): The user who sent the message
+        message (str): The message text
+        timestamp (int): When the message was received
+        screening (MessageScreening): The screening result that flagged the message
+        session_type (str, optional): Where the message came from (chat, live, general)
+        chat_id (str, optional): The chat the message belongs to
+    """
+    if db is None:
+        return
+    
+    entry = {
+        'user_id': user_id,
+        'message': message,
+        'timestamp': timestamp,
+        'detected_keywords': True,
+        'matched_keywords': screening.matched_keywords
+    }
+    if session_type:
+        entry['session_type'] = session_type
+    if chat_id:
+        entry['chat_id'] = chat_id
+    background_writes.run_in_background(_write_crisis_log, entry)
+
 # Load environment variables
 load_dotenv()
 
@@ -159,25 +181,19 @@ except Exception as e:
     print(f"Error initializing Firebase Admin SDK: {str(e)}")
     print("Falling back to in-memory database")
 
-# Initialize in-memory data storage for development
-in_memory_db = {
-    'users': {},  # user_id -> user data
-    'chats': {},  # user_id -> {chat_id -> chat data}
-    'quotes': {}  # user_id -> [quote data]
-}
+# Without Firestore, use the SQLite database when STORAGE_BACKEND=sqlite (None keeps in-memory storage)
+local_storage = open_local_storage() if db is None else None
+
+# Repositories of the configured backend, shared by the stores below
+storage = open_storage(db, local_storage)
 
 # Initialize mood tracker
-mood_tracker = MoodTracker(db)
+mood_tracker = MoodTracker(storage.mood_entries)
 
 # Initialize chat emotion logger
 class ChatEmotionLogger:
-    def __init__(self, db: Optional[firestore.Client]):
-        self.db = db
-        self.in_memory_storage = []  # Fallback storage when db is None
-        if db is not None:
-            self.collection = self.db.collection('chat_emotions')
-        else:
-            print("Using in-memory storage for chat emotions")
+    def __init__(self, entries):
+        self.entries = entries
 
     def log_emotion(self, user_id: str, message: str, detected_emotion: str, timestamp: int = None):
         """
@@ -193,17 +209,11 @@ class ChatEmotionLogger:
             'timestamp': timestamp
         }
 
-        if self.db is not None:
-            doc_ref = self.collection.document()
-            doc_ref.set(entry)
-            return doc_ref.id
-        else:
-            # Use in-memory storage
-            entry_id = str(len(self.in_memory_storage))
-            self.in_memory_storage.append(entry)
-            return entry_id
+        return self.entries.add(entry)
 
-chat_emotion_logger = ChatEmotionLogger(db)
+chat_emotion_logger = ChatEmotionLogger(storage.chat_emotions)
+chat_store = ChatStore(storage.chats)
+quote_store = QuoteStore(storage.quotes)
 
 # Firebase authentication middleware - simplified for development
 def firebase_required(f):
@@ -222,22 +232,13 @@ def firebase_required(f):
                         user_id = decoded_token['uid']
                         session['user_id'] = user_id
                         
-                        # Check if user exists in Firestore
-                        user_ref = db.collection('users').document(user_id)
-                        user_doc = user_ref.get()
-                        
-                        if not user_doc.exists:
-                            # Create user document with basic info
-                            user_ref.set({
-                                'email': decoded_token.get('email', ''),
-                                'name': decoded_token.get('name', ''),
-                                'photo_url': decoded_token.get('picture', ''),
-                                'created_at': int(time.time())
-                            })
-                            
-                            # Create initial collections
-                            user_ref.collection('chats')
-                            user_ref.collection('quotes')
+                        # Create the user's profile with basic info if it doesn't exist
+                        storage.users.create(user_id, {
+                            'email': decoded_token.get('email', ''),
+                            'name': decoded_token.get('name', ''),
+                            'photo_url': decoded_token.get('picture', ''),
+                            'created_at': int(time.time())
+                        })
                     except Exception as e:
                         print(f"Firebase auth error: {str(e)}")
                         # Fall back to test user
@@ -252,15 +253,12 @@ def firebase_required(f):
                 user_id = 'test-user-' + str(uuid.uuid4())
                 session['user_id'] = user_id
             
-            # Initialize user data in memory if needed
-            user_id = session['user_id']
-            if user_id not in in_memory_db['users']:
-                in_memory_db['users'][user_id] = {
-                    'email': 'test@example.com',
-                    'name': 'Test User'
-                }
-                in_memory_db['chats'][user_id] = {}
-                in_memory_db['quotes'][user_id] = []
+            # Test users get a placeholder profile
+            storage.users.create(session['user_id'], {
+                'email': 'test@example.com',
+                'name': 'Test User',
+                'created_at': int(time.time())
+            })
         
         return f(*args, **kwargs)
     
@@ -295,6 +293,38 @@ def sign_up():
     }
     return render_template('sign-up.html', firebase_config=firebase_config)
 
+# Readiness probe for load balancers and deploy checks
+@app.route('/ready')
+def ready():
+    """
+    Reports whether this worker has finished warming up the local emotion model,
+    and separately whether the shared inference service is answering.
+    """
+    local_model = is_emotion_model_ready()
+    status = {'ready': local_model, 'local_model': local_model, 'emotion_service': is_emotion_service_ready()}
+    return jsonify(status), 200 if local_model else 503
+
+# Runtime metrics for this worker process
+@app.route('/metrics')
+def metrics():
+    """
+    Reports LLM call timings, emotion detection and task pool counters for this worker.
+    """
+    return jsonify({
+        'pid': os.getpid(),
+        'llm': get_llm_stats(),
+        'llm_health': get_llm_health(),
+        'emotion_cache': emotion_cache.get_stats(),
+        'emotion_batcher': dict(get_emotion_batcher().stats),
+        'request_io': request_io.get_stats(),
+        'background_writes': background_writes.get_stats(),
+        'response_cache': response_cache.get_stats(),
+        'affirmation_pool': affirmation_pool.get_stats(),
+        'quote_pool': quote_pool.get_stats(),
+        'message_flights': message_flights.get_stats(),
+        'sqlite': local_storage.get_stats() if local_storage is not None else None
+    })
+
 # Main routes
 @app.route('/')
 @firebase_required
@@ -318,15 +348,8 @@ def index():
         'appId': os.environ.get('FIREBASE_APP_ID', '')
     }
     
-    # Get user data from Firestore
-    user_data = {}
-    if firebase_admin._apps:
-        db = firestore.client()
-        user_ref = db.collection('users').document(user_id)
-        user_doc = user_ref.get()
-        
-        if user_doc.exists:
-            user_data = user_doc.to_dict()
+    # Get the user's profile
+    user_data = get_user_profile(user_id)
     
     # Render the template with user data
     return render_template('index.html', 
@@ -335,92 +358,6 @@ def index():
                           firebase_config=firebase_config,
                           google_maps_api_key=google_maps_api_key)
 
-# Define the base therapeutic system prompt
-BASE_THERAPEUTIC_PROMPT = """
-You are a calm, empathetic mental health therapist. Your responses should be:
-- Warm and supportive, using phrases like "It's okay to feel that way" or "You're doing your best"
-- Non-judgmental and validating of the user's feelings
-- Thoughtful but concise
-- Focused on helping the user explore their thoughts and feelings
-- Encouraging and gentle in your approach
-
-Always prioritize a compassionate tone while providing helpful guidance.
-"""
-
-# List of quote prompt variations to ensure diversity
-QUOTE_PROMPTS = [
-    """
-    Generate a single, inspiring therapeutic quote about self-compassion and personal growth.
-    The quote should be brief (under 150 characters), uplifting, and meaningful.
-    Do not include any explanation, attribution, or quotation marks unless it's from a specific person.
-    """,
-    
-    """
-    Create one short, powerful quote about resilience and overcoming challenges.
-    Make it inspirational, concise (under 150 characters), and focused on inner strength.
-    Only provide the quote itself without any additional context or formatting.
-    """,
-    
-    """
-    Provide a single mindfulness quote that offers perspective on being present.
-    Keep it brief (under 150 characters), insightful, and calming.
-    No explanation or context needed, just the quote itself.
-    """,
-    
-    """
-    Generate one unique quote about healing and emotional well-being.
-    It should be short (under 150 characters), hopeful, and emotionally resonant.
-    Just the quote text with no additional formatting or context.
-    """,
-    
-    """
-    Create a single motivational quote about self-acceptance and personal value.
-    Keep it concise (under 150 characters), affirming, and positive.
-    Only the quote text is needed, no attribution unless it's from someone specific.
-    """
-]
-
-# Define mood-specific additions to the prompt
-MOOD_PROMPTS = {
-    "happy": """
-The user is feeling happy. While maintaining your therapeutic approach:
-- Celebrate their positive emotions
-- Help them savor this feeling
-- Explore what's contributing to their happiness
-- Encourage them to build on these positive experiences
-""",
-    "sad": """
-The user is feeling sad. While maintaining your therapeutic approach:
-- Be especially gentle and compassionate
-- Validate that sadness is a normal human emotion
-- Offer comfort with phrases like "I hear how difficult this is for you"
-- Provide hope while acknowledging their current feelings
-- Suggest small, manageable ways to care for themselves
-""",
-    "anxious": """
-The user is feeling anxious. While maintaining your therapeutic approach:
-- Help them feel grounded with your calm responses
-- Acknowledge their anxiety without minimizing it
-- Use reassuring phrases like "Many people experience anxiety"
-- Suggest breathing techniques or mindfulness if appropriate
-- Focus on what they can control in the present moment
-""",
-    "angry": """
-The user is feeling angry. While maintaining your therapeutic approach:
-- Acknowledge their anger as valid without judgment
-- Help them express their feelings in a constructive way
-- Use phrases like "It makes sense that you feel this way"
-- Guide them toward understanding what's beneath the anger
-- Offer perspective while respecting their emotions
-""",
-    "neutral": """
-The user hasn't shown strong emotional signals in their messages. Maintain your general therapeutic approach and:
-- Be attentive to emotional cues in their messages
-- Adjust your tone accordingly as the conversation progresses
-- Use open-ended questions to explore how they're feeling
-"""
-}
-
 # Emergency resources to display when crisis is detected
 EMERGENCY_RESOURCES = [
     {
@@ -523,34 +460,270 @@ EMERGENCY_RESOURCES = [
 
 # Helper function to safely generate Gemini response
 def generate_safe_response(prompt, max_retries=2):
-    """Helper function to safely generate responses from Gemini with retries"""
+    """
+    Helper function to safely generate responses from Gemini with retries.
+    
+    Retries immediately (no sleeping on a request thread). Calls rejected by the
+    circuit breaker or the concurrency limit, or that hit their deadline, are not
+    retried.
+    """
     for attempt in range(max_retries):
         try:
-            model = genai.GenerativeModel(
+            response = generate_content(
+                prompt,
                 model_name="models/" + GEMINI_CONFIG["model"],  # Use full model name with "models/" prefix
-                generation_config=GEMINI_CONFIG["generation_config"]
+                generation_config=GEMINI_CONFIG["generation_config"],
+                route='safe_response'
             )
-            response = model.generate_content(prompt)
             if response and response.text:
                 return response.text.strip()
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             print(f"Attempt {attempt + 1} failed: {str(e)}")
             if attempt == max_retries - 1:
                 raise
-            time.sleep(1)  # Short delay before retry
     return None
 
 def get_therapy_prompt(user_message, emotion=None):
     """Helper function to construct the therapy prompt"""
-    base_prompt = """You are a compassionate AI therapist. Your responses should be:
-    - Warm and supportive
-    - Non-judgmental and validating
-    - Brief but thoughtful (2-3 sentences)
-    - Focused on the user's feelings
+    emotion_context = f"\nThe user's current emotion is: {emotion}\n" if emotion else "\n"
+    return render_prompt('therapy', emotion_context=emotion_context, user_message=user_message)
+
+def get_user_profile(user_id):
+    """Returns the stored profile for a user (empty if there is none)"""
+    return storage.users.get(user_id) or {}
+
+def response_cache_allowed(user_id):
     """
+    Whether replies for this user may be served from and stored in the response cache.
     
-    emotion_context = f"\nThe user's current emotion is: {emotion}\n" if emotion else "\n"
-    return f"{base_prompt}{emotion_context}\nUser: {user_message}\nTherapist:"
+    The opt-out is read from the user's profile once and remembered in the session.
+    """
+    if not response_cache.enabled:
+        return False
+    if 'response_cache_opt_out' not in session:
+        try:
+            session['response_cache_opt_out'] = bool(get_user_profile(user_id).get('response_cache_opt_out', False))
+        except Exception as e:
+            print(f"Error reading response cache preference: {str(e)}")
+            return False
+    return not session['response_cache_opt_out']
+
+def refresh_chat_summary(chat_key, chat_ref, chat_data):
+    """Folds older turns of a chat into its rolling summary"""
+    if not claim_summary_refresh(chat_key):
+        return
+    try:
+        update = compact_summary(chat_data, load_turns=partial(chat_store.get_messages, chat_ref, chat_data))
+        if update is None:
+            return
+        # Only touch the summary fields so concurrent message writes aren't lost
+        chat_store.update_chat(chat_ref, update)
+        chat_data.update(update)
+    finally:
+        release_summary_refresh(chat_key)
+
+def schedule_summary_refresh(user_id, chat_id, chat_ref, chat_data):
+    """Refreshes a chat's rolling summary off the response path once enough turns have aged out"""
+    if summary_refresh_due(chat_data):
+        background_writes.run_in_background(refresh_chat_summary, (user_id, chat_id), chat_ref, chat_data)
+
+def sse_event(event, data):
+    """Formats a Server-Sent Event carrying a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events):
+    """Wraps an event generator in a text/event-stream response"""
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Stop reverse proxies from buffering the stream
+        }
+    )
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+def get_idempotency_key():
+    """The client's Idempotency-Key header for this request, or None"""
+    return request.headers.get(IDEMPOTENCY_HEADER, '').strip()[:128] or None
+
+def message_flight_key(scope):
+    """
+    Identifies duplicate sends of a message to a chat (scope) by the current user.
+
+    Returns:
+        tuple: (key, seconds to replay the reply) - the key is None if the request can't be matched
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return None, 0
+
+    idempotency_key = get_idempotency_key()
+    if idempotency_key:
+        return (user_id, scope, 'key', idempotency_key), IDEMPOTENCY_TTL_S
+
+    data = request.get_json(silent=True)
+    message = data.get('message') if isinstance(data, dict) else None
+    if not message or not isinstance(message, str):
+        return None, 0
+    return (user_id, scope, 'message', cache_key(message)), DUPLICATE_WINDOW_S
+
+def share_reply(key, future, payload, status, ttl):
+    """Hands a leader's reply to waiting duplicates; only successful replies are replayed later"""
+    if not 200 <= status < 300:
+        # Don't pass a (possibly transient) failure on: waiters handle their request themselves
+        message_flights.finish(key, future, error=RuntimeError(f"Original request failed with status {status}"))
+        return
+    replayable = isinstance(payload, dict) and 'error' not in payload
+    message_flights.finish(key, future, result=(payload, status), ttl=ttl if replayable else 0)
+
+def share_streamed_reply(events, key, future, ttl):
+    """Passes a leader's SSE events through and shares the payload of its `done` event"""
+    payload = None
+    try:
+        for event in events:
+            if event.startswith('event: done\n'):
+                payload = json.loads(event.split('data: ', 1)[1])
+            yield event
+    finally:
+        if hasattr(events, 'close'):
+            events.close()
+        if payload is None:
+            # No reply was completed (error or client gone); duplicates run on their own
+            message_flights.finish(key, future, result=None)
+        else:
+            share_reply(key, future, payload, 200, ttl)
+
+def replay_events(payload):
+    """Sends a reply produced by another request as `meta` and `done` events"""
+    meta_fields = ('detected_emotion', 'wellness_score', 'is_crisis', 'show_emergency')
+    yield sse_event('meta', {field: payload[field] for field in meta_fields if field in payload})
+    yield sse_event('done', payload)
+
+def coalesce_duplicates(f):
+    """
+    Runs duplicate sends of a message once.
+
+    Requests with the same Idempotency-Key header, or with the same message
+    from the same user to the same chat, share one classification, Gemini call
+    and write. Duplicates arriving while the first request runs wait for its
+    reply; ones arriving after it finished get the reply replayed for
+    IDEMPOTENCY_TTL_S (keyed) or DUPLICATE_WINDOW_S (unkeyed). The JSON and
+    streaming variants of a route share keys, so a client falling back from
+    one to the other with the same key gets the same reply.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key, ttl = message_flight_key(kwargs.get('chat_id', 'current'))
+        if key is None:
+            return f(*args, **kwargs)
+
+        leader, future = message_flights.begin(key)
+        if not leader:
+            try:
+                replay = future.result(timeout=SINGLE_FLIGHT_WAIT_S)
+            except Exception:
+                replay = None
+            if replay is None:
+                # The original request failed or is stuck; handle this one normally
+                return f(*args, **kwargs)
+            payload, status = replay
+            if request.path.endswith('/stream') and status == 200:
+                return sse_response(replay_events(payload))
+            return jsonify(payload), status
+
+        try:
+            response = app.make_response(f(*args, **kwargs))
+        except BaseException as e:
+            message_flights.finish(key, future, error=e)
+            raise
+
+        if response.is_streamed:
+            response.response = share_streamed_reply(response.response, key, future, ttl)
+        else:
+            share_reply(key, future, response.get_json(silent=True), response.status_code, ttl)
+        return response
+
+    return decorated_function
+
+def find_idempotent_reply(chat_ref, chat_data, idempotency_key):
+    """
+    Finds the reply already saved for a message sent with this Idempotency-Key,
+    so retries handled by another worker don't append the message again.
+
+    Returns:
+        dict: The response payload for the saved reply, or None
+    """
+    exchange = chat_store.find_idempotent_exchange(chat_ref, chat_data, idempotency_key)
+    if exchange is None:
+        return None
+    message, reply = exchange
+    if reply is None or reply.get('sender') != 'bot':
+        return None
+    return chat_reply_payload(reply['text'], reply['timestamp'],
+                              message.get('emotion', 'neutral'), message.get('is_crisis', False))
+
+def chat_reply_payload(text, timestamp, detected_emotion, is_crisis):
+    """The response body for a reply added to a chat; crisis replies carry support resources"""
+    payload = {
+        'message': {
+            'sender': 'bot',
+            'text': text,
+            'timestamp': timestamp
+        },
+        'detected_emotion': detected_emotion,
+        'is_crisis': is_crisis,
+        'show_resources': is_crisis
+    }
+    if is_crisis:
+        payload.update({
+            'emergency_resources': EMERGENCY_RESOURCES[:5],
+            'resource_message': "Here are some resources that can provide immediate support:",
+            'calming_resources': get_calming_resources(),
+            'calming_message': "While you seek help, here are some techniques that might help you feel more grounded:"
+        })
+    return payload
+
+def stream_reply(prompt, route, result, cache_context=None):
+    """
+    Streams a Gemini reply as `token` events.
+
+    The full reply text is stored in result['text'] once the stream is exhausted;
+    it stays None if generation failed, in which case an `error` event is sent.
+    cache_context is the (emotion, message) pair of a non-crisis turn that may
+    use the response cache; a cached reply is sent as a single token.
+    """
+    if cache_context:
+        cached = response_cache.get(*cache_context)
+        if cached:
+            result['text'] = cached
+            yield sse_event('token', {'text': cached})
+            return
+    
+    chunks = []
+    try:
+        for chunk in stream_content(prompt, route=route):
+            chunks.append(chunk)
+            yield sse_event('token', {'text': chunk})
+    except Exception as e:
+        print(f"Error streaming AI response: {str(e)}")
+        yield sse_event('error', {
+            'error': str(e),
+            'message': {'text': "I'm here to listen. Could you please share that again?"}
+        })
+        return
+    reply = ''.join(chunks).strip()
+    if reply and cache_context:
+        response_cache.put(*cache_context, reply)
+    result['text'] = reply or "I'm here to listen. Could you please share that again?"
+
+def page_limit(default, param='limit'):
+    """The page size query parameter (`limit` unless given), clamped to 1..MAX_PAGE_SIZE"""
+    limit = request.args.get(param, default=default, type=int)
+    return max(1, min(limit, MAX_PAGE_SIZE))
 
 @app.route('/api/chats', methods=['GET'])
 @firebase_required
@@ -560,38 +733,14 @@ def get_chats():
         if not user_id:
             return jsonify({'error': 'User not found'}), 404
         
-        # If Firestore is available, use it
-        if db is not None:
-            # Get chats from Firestore
-            chats_ref = db.collection('users').document(user_id).collection('chats')
-            chats_query = chats_ref.order_by('updated_at', direction=firestore.Query.DESCENDING)
-            chat_docs = chats_query.stream()
-            
-            chats = []
-            for doc in chat_docs:
-                chat_data = doc.to_dict()
-                chat_data['id'] = doc.id
-                chats.append(chat_data)
-                
-            if not chats:
-                # If no chats exist, return empty list
-                return jsonify([])
-                
-            return jsonify(chats)
-        else:
-            # Get chats from in-memory database
-            user_chats = in_memory_db['chats'].get(user_id, {})
-            
-            # Convert to list and sort by updated_at (newest first)
-            chats = []
-            for chat_id, chat_data in user_chats.items():
-                chat_with_id = dict(chat_data)
-                chat_with_id['id'] = chat_id
-                chats.append(chat_with_id)
-            
-            chats.sort(key=lambda x: x.get('updated_at', 0), reverse=True)
-            
-            return jsonify(chats)
+        # One page of chat summaries (newest first); messages are fetched per chat
+        limit = page_limit(CHAT_LIST_PAGE_SIZE)
+        try:
+            chats, next_cursor = chat_store.list_chats(user_id, limit=limit, cursor=request.args.get('cursor'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({'chats': chats, 'next_cursor': next_cursor})
     except Exception as e:
         print(f"Error getting chats: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -613,44 +762,30 @@ def create_chat():
         chat_data = {
             'title': title,
             'created_at': timestamp,
-            'updated_at': timestamp,
-            'messages': [
-                {
-                    'sender': 'system',
-                    'text': 'Hello there! 👋 I\'m your friendly AI Therapist, here to support you on your journey. Feel free to share what\'s on your mind, and I\'ll listen and respond to how you\'re feeling. I\'m here to help. 💖',
-                    'timestamp': timestamp
-                }
-            ]
+            'updated_at': timestamp
         }
+        messages = [
+            {
+                'sender': 'system',
+                'text': 'Hello there! 👋 I\'m your friendly AI Therapist, here to support you on your journey. Feel free to share what\'s on your mind, and I\'ll listen and respond to how you\'re feeling. I\'m here to help. 💖',
+                'timestamp': timestamp
+            }
+        ]
         
-        # If Firestore is available, use it
-        if db is not None:
-            # Check if user document exists, if not create it
-            user_ref = db.collection('users').document(user_id)
-            user_doc = user_ref.get()
-            
-            if not user_doc.exists:
-                # Create user document with basic info
-                user_ref.set({
-                    'email': in_memory_db['users'].get(user_id, {}).get('email', 'user@example.com'),
-                    'name': in_memory_db['users'].get(user_id, {}).get('name', 'User'),
-                    'created_at': timestamp
-                })
-            
-            # Create chat document with auto-generated ID
-            chat_ref = user_ref.collection('chats').document()
-            chat_ref.set(chat_data)
-            chat_id = chat_ref.id
-        else:
-            # Store in in-memory database
-            chat_id = str(uuid.uuid4())
-            if user_id not in in_memory_db['chats']:
-                in_memory_db['chats'][user_id] = {}
-            in_memory_db['chats'][user_id][chat_id] = chat_data
+        # Create the user's profile if it doesn't exist yet
+        storage.users.create(user_id, {
+            'email': 'user@example.com',
+            'name': 'User',
+            'created_at': timestamp
+        })
+        
+        # Create the chat document (auto-generated ID) and its first message
+        chat_id = chat_store.create_chat(user_id, chat_data, messages)
         
-        # Include the ID in the response
+        # Include the ID and messages in the response
         response_data = dict(chat_data)
         response_data['id'] = chat_id
+        response_data['messages'] = messages
         
         return jsonify(response_data)
     except Exception as e:
@@ -665,30 +800,14 @@ def get_chat(chat_id):
         if not user_id:
             return jsonify({'error': 'User not found'}), 404
         
-        # If Firestore is available, use it
-        if db is not None:
-            # Get chat from Firestore
-            chat_ref = db.collection('users').document(user_id).collection('chats').document(chat_id)
-            chat_doc = chat_ref.get()
-            
-            if not chat_doc.exists:
-                return jsonify({'error': 'Chat not found'}), 404
-                
-            chat_data = chat_doc.to_dict()
-            chat_data['id'] = chat_id
-            
-            return jsonify(chat_data)
-        else:
-            # Get chat from in-memory database
-            user_chats = in_memory_db['chats'].get(user_id, {})
-            
-            if chat_id not in user_chats:
-                return jsonify({'error': 'Chat not found'}), 404
-            
-            chat_data = dict(user_chats[chat_id])
-            chat_data['id'] = chat_id
-            
-            return jsonify(chat_data)
+        # The latest messages, or those before the `before` position for older pages
+        before = request.args.get('before', type=int)
+        chat_data = chat_store.get_chat(user_id, chat_id, before=before, limit=page_limit(MESSAGE_PAGE_SIZE))
+        if chat_data is None:
+            return jsonify({'error': 'Chat not found'}), 404
+        
+        chat_data['id'] = chat_id
+        return jsonify(chat_data)
     except Exception as e:
         print(f"Error getting chat: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -701,35 +820,18 @@ def delete_chat(chat_id):
         if not user_id:
             return jsonify({'error': 'User not found'}), 404
         
-        # If Firestore is available, use it
-        if db is not None:
-            # Delete chat from Firestore
-            chat_ref = db.collection('users').document(user_id).collection('chats').document(chat_id)
-            chat_doc = chat_ref.get()
-            
-            if not chat_doc.exists:
-                return jsonify({'error': 'Chat not found'}), 404
-                
-            # Delete the chat document
-            chat_ref.delete()
-            
-            return jsonify({'success': True})
-        else:
-            # Delete chat from in-memory database
-            user_chats = in_memory_db['chats'].get(user_id, {})
-            
-            if chat_id not in user_chats:
-                return jsonify({'error': 'Chat not found'}), 404
-            
-            del user_chats[chat_id]
-            
-            return jsonify({'success': True})
+        # Deletes the chat document and its messages
+        if not chat_store.delete_chat(user_id, chat_id):
+            return jsonify({'error': 'Chat not found'}), 404
+        
+        return jsonify({'success': True})
     except Exception as e:
         print(f"Error deleting chat: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/chats/<chat_id>/messages', methods=['POST'])
 @firebase_required
+@coalesce_duplicates
 def add_message(chat_id):
     try:
         user_id = session.get('user_id')
@@ -742,19 +844,34 @@ def add_message(chat_id):
             return jsonify({'error': 'Please provide a message'}), 400
         
         user_message = data['message']
+        idempotency_key = get_idempotency_key()
         timestamp = int(time.time())
         
-        # First check if this is a crisis message
-        is_crisis = is_crisis_message(user_message)
+        # Read the chat while the message is being classified
+        chat_future = request_io.submit(chat_store.load_chat, user_id, chat_id)
         
-        # Detect emotion from user message
-        detected_emotion = detect_emotion(user_message)
+        # Check for crisis indicators and detect emotion with a single model call
+        screening = screen_message(user_message)
+        is_crisis = screening.is_crisis
+        detected_emotion = screening.detected_emotion
         print(f"Chat message received. Detected emotion: {detected_emotion}")
         print(f"Message: {user_message[:50]}...")
         
-        # Log emotion to mood tracker if not neutral
+        # The reply needs the chat's history, so the read has to finish here
+        chat = chat_future.result()
+        if chat is None:
+            return jsonify({'error': 'Chat not found'}), 404
+        chat_ref, chat_data = chat
+        
+        # A retry of a message that was already answered gets the saved reply
+        if idempotency_key:
+            replayed = find_idempotent_reply(chat_ref, chat_data, idempotency_key)
+            if replayed is not None:
+                return jsonify(replayed)
+        
+        # Log emotion to mood tracker if not neutral (off the response path)
         if detected_emotion != 'neutral':
-            log_mood_to_tracker(user_id, detected_emotion, user_message)
+            background_writes.run_in_background(log_mood_to_tracker, user_id, detected_emotion, user_message)
         
         # Create user message object
         user_message_obj = {
@@ -764,61 +881,13 @@ def add_message(chat_id):
             'emotion': detected_emotion,
             'is_crisis': is_crisis
         }
-        
-        # Get chat from database
-        if db is not None:
-            # Get chat from Firestore
-            chat_ref = db.collection('users').document(user_id).collection('chats').document(chat_id)
-            chat_doc = chat_ref.get()
-            
-            if not chat_doc.exists:
-                return jsonify({'error': 'Chat not found'}), 404
-            
-            # Get chat data
-            chat_data = chat_doc.to_dict()
-            messages = chat_data.get('messages', [])
-            
-            # Add user message
-            messages.append(user_message_obj)
-        else:
-            # Get chat from in-memory database
-            user_chats = in_memory_db['chats'].get(user_id, {})
-            
-            if chat_id not in user_chats:
-                return jsonify({'error': 'Chat not found'}), 404
-            
-            chat_data = user_chats[chat_id]
-            
-            # Add user message to chat
-            if 'messages' not in chat_data:
-                chat_data['messages'] = []
-            
-            chat_data['messages'].append(user_message_obj)
-            messages = chat_data['messages']
+        if idempotency_key:
+            user_message_obj['idempotency_key'] = idempotency_key
         
         # If this is a crisis message, provide a static response with resources
         if is_crisis:
             print("CRISIS MESSAGE DETECTED in chat!")
-            
-            # Log the crisis message if database is available
-            if db is not None:
-                try:
-                    db.collection('crisis_logs').add({
-                        'user_id': user_id,
-                        'message': user_message,
-                        'timestamp': timestamp,
-                        'session_type': 'chat',
-                        'chat_id': chat_id,
-                        'detected_keywords': True
-                    })
-                except Exception as e:
-                    print(f"Error logging crisis message: {str(e)}")
-            
-            # Define calming resources and grounding techniques
-            calming_resources = get_calming_resources()
-            
-            # Select relevant emergency resources
-            selected_emergency_resources = EMERGENCY_RESOURCES[:5]
+            log_crisis_message(user_id, user_message, timestamp, screening, session_type='chat', chat_id=chat_id)
             
             # Create static crisis response
             crisis_response = get_crisis_response()
@@ -832,91 +901,34 @@ def add_message(chat_id):
                 'responding_to_crisis': True
             }
             
-            # Add bot message to messages
-            messages.append(bot_message_obj)
-            
-            # Update chat data
-            if db is not None:
-                chat_data['messages'] = messages
-                chat_data['updated_at'] = timestamp
-                
-                # Update chat document in Firestore
-                chat_ref.set(chat_data)
-            else:
-                chat_data['messages'] = messages
-                chat_data['updated_at'] = timestamp
+            chat_store.append_messages(chat_ref, chat_data, [user_message_obj, bot_message_obj], timestamp)
+            schedule_summary_refresh(user_id, chat_id, chat_ref, chat_data)
             
-            return jsonify({
-                'message': {
-                    'sender': 'bot',
-                    'text': crisis_response,
-                    'timestamp': timestamp
-                },
-                'detected_emotion': detected_emotion,
-                'is_crisis': True,
-                'show_resources': True,
-                'emergency_resources': selected_emergency_resources,
-                'resource_message': "Here are some resources that can provide immediate support:",
-                'calming_resources': calming_resources,
-                'calming_message': "While you seek help, here are some techniques that might help you feel more grounded:"
-            })
+            return jsonify(chat_reply_payload(crisis_response, timestamp, detected_emotion, True))
         
         # If not a crisis, proceed with normal AI response
         try:
-            # Simple direct model creation
-            model = genai.GenerativeModel(
-                model_name="models/gemini-1.5-flash"
-            )
-            
-            # Generate response with a simple prompt
-            prompt = f"You are a compassionate AI therapist. The user is feeling {detected_emotion}. Respond with empathy in 2-3 sentences.\n\nUser: {user_message}\nYour response:"
-            print(f"Sending prompt to Gemini: {prompt[:50]}...")
-            
-            # Generate response
-            response = model.generate_content(prompt)
-            
-            # Extract text safely
-            ai_message = "I'm here to listen. Could you please share that again?"
-            if response and hasattr(response, 'text'):
-                ai_message = response.text.strip()
-                print(f"AI response received: {ai_message[:50]}...")
-            else:
-                print("Warning: Empty or invalid response from Gemini API")
-            
-            # Create bot message object
-            bot_message_obj = {
-                'sender': 'bot',
-                'text': ai_message,
-                'timestamp': timestamp,
-                'responding_to_emotion': detected_emotion,
-                'responding_to_crisis': False
-            }
-            
-            # Add bot message to messages
-            messages.append(bot_message_obj)
-            
-            # Update chat data
-            if db is not None:
-                chat_data['messages'] = messages
-                chat_data['updated_at'] = timestamp
+            # Short generic messages opening a chat may be answered from the response cache
+            cache_allowed = not has_history(chat_data) and response_cache_allowed(user_id)
+            ai_message = response_cache.get(detected_emotion, user_message) if cache_allowed else None
+            if ai_message is None:
+                # Generate response with the rolling summary and recent turns as context
+                prompt = build_chat_prompt(user_message, detected_emotion, chat_data)
+                print(f"Sending prompt to Gemini: {prompt[:50]}...")
                 
-                # Update chat document in Firestore
-                chat_ref.set(chat_data)
-            else:
-                chat_data['messages'] = messages
-                chat_data['updated_at'] = timestamp
-            
-            return jsonify({
-                'message': {
-                    'sender': 'bot',
-                    'text': ai_message,
-                    'timestamp': timestamp
-                },
-                'detected_emotion': detected_emotion,
-                'is_crisis': False,
-                'show_resources': False
-            })
-            
+                # Generate response with the shared model instance
+                response = generate_content(prompt, route='chat_message')
+                
+                # Extract text safely
+                ai_message = "I'm here to listen. Could you please share that again?"
+                if response and hasattr(response, 'text'):
+                    ai_message = response.text.strip()
+                    print(f"AI response received: {ai_message[:50]}...")
+                    if cache_allowed:
+                        response_cache.put(detected_emotion, user_message, ai_message)
+                else:
+                    print("Warning: Empty or invalid response from Gemini API")
+        
         except Exception as e:
             print(f"Error generating AI response: {str(e)}")
             return jsonify({
@@ -927,11 +939,134 @@ def add_message(chat_id):
                 },
                 'error': str(e)
             }), 500
+        
+        # Create bot message object
+        bot_message_obj = {
+            'sender': 'bot',
+            'text': ai_message,
+            'timestamp': timestamp,
+            'responding_to_emotion': detected_emotion,
+            'responding_to_crisis': False
+        }
+        
+        chat_store.append_messages(chat_ref, chat_data, [user_message_obj, bot_message_obj], timestamp)
+        schedule_summary_refresh(user_id, chat_id, chat_ref, chat_data)
+        
+        return jsonify(chat_reply_payload(ai_message, timestamp, detected_emotion, False))
             
     except Exception as e:
         print(f"Error in add_message: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/chats/<chat_id>/messages/stream', methods=['POST'])
+@firebase_required
+@coalesce_duplicates
+def add_message_stream(chat_id):
+    """
+    Streaming variant of add_message.
+
+    Responds with Server-Sent Events: a `meta` event with the screening result,
+    `token` events as Gemini generates the reply, and a `done` event carrying the
+    same payload add_message returns. The chat is persisted once the reply is
+    complete.
+    """
+    try:
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({'error': 'User not found'}), 404
+        
+        data = request.get_json()
+        if not data or 'message' not in data:
+            return jsonify({'error': 'Please provide a message'}), 400
+        
+        user_message = data['message']
+        idempotency_key = get_idempotency_key()
+        timestamp = int(time.time())
+        
+        # Read the chat while the message is being classified
+        chat_future = request_io.submit(chat_store.load_chat, user_id, chat_id)
+        
+        # Check for crisis indicators and detect emotion with a single model call
+        screening = screen_message(user_message)
+        is_crisis = screening.is_crisis
+        detected_emotion = screening.detected_emotion
+        print(f"Streaming chat message received. Detected emotion: {detected_emotion}")
+        
+        # Resolve the chat before streaming so a missing chat is still a plain 404
+        chat = chat_future.result()
+        if chat is None:
+            return jsonify({'error': 'Chat not found'}), 404
+        chat_ref, chat_data = chat
+        
+        # A retry of a message that was already answered gets the saved reply
+        if idempotency_key:
+            replayed = find_idempotent_reply(chat_ref, chat_data, idempotency_key)
+            if replayed is not None:
+                return sse_response(replay_events(replayed))
+        
+        # Log emotion to mood tracker if not neutral (off the response path)
+        if detected_emotion != 'neutral':
+            background_writes.run_in_background(log_mood_to_tracker, user_id, detected_emotion, user_message)
+        
+        if is_crisis:
+            print("CRISIS MESSAGE DETECTED in chat!")
+            log_crisis_message(user_id, user_message, timestamp, screening, session_type='chat', chat_id=chat_id)
+        
+        user_message_obj = {
+            'sender': 'user',
+            'text': user_message,
+            'timestamp': timestamp,
+            'emotion': detected_emotion,
+            'is_crisis': is_crisis
+        }
+        if idempotency_key:
+            user_message_obj['idempotency_key'] = idempotency_key
+        
+        # Short generic messages opening a chat may be answered from the response cache (never crisis turns)
+        cache_context = None
+        if not is_crisis and not has_history(chat_data) and response_cache_allowed(user_id):
+            cache_context = (detected_emotion, user_message)
+        
+        def save_reply(ai_message):
+            chat_store.append_messages(chat_ref, chat_data, [user_message_obj, {
+                'sender': 'bot',
+                'text': ai_message,
+                'timestamp': timestamp,
+                'responding_to_emotion': detected_emotion,
+                'responding_to_crisis': is_crisis
+            }], timestamp)
+            schedule_summary_refresh(user_id, chat_id, chat_ref, chat_data)
+        
+        def generate():
+            yield sse_event('meta', {'detected_emotion': detected_emotion, 'is_crisis': is_crisis})
+            
+            # Crisis responses are static: send them whole with the resources
+            if is_crisis:
+                crisis_response = get_crisis_response()
+                save_reply(crisis_response)
+                yield sse_event('done', chat_reply_payload(crisis_response, timestamp, detected_emotion, True))
+                return
+            
+            # The rolling summary and recent turns give the reply its context
+            prompt = build_chat_prompt(user_message, detected_emotion, chat_data)
+            result = {'text': None}
+            yield from stream_reply(prompt, 'chat_message', result, cache_context)
+            if result['text'] is None:
+                return
+            
+            try:
+                save_reply(result['text'])
+            except Exception as e:
+                print(f"Error saving streamed chat: {str(e)}")
+            
+            yield sse_event('done', chat_reply_payload(result['text'], timestamp, detected_emotion, False))
+        
+        return sse_response(generate())
+            
+    except Exception as e:
+        print(f"Error in add_message_stream: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/chat', methods=['POST'])
 @firebase_required
 def chat():
@@ -946,23 +1081,14 @@ def chat():
         user_id = session.get('user_id', 'anonymous')
         
         # First check if this is a crisis message
-        is_crisis = is_crisis_message(user_message)
+        screening = screen_message(user_message, need_emotion=False)
+        is_crisis = screening.is_crisis
         
         if is_crisis:
             print(f"CRISIS MESSAGE DETECTED in general chat from user {user_id}")
             
-            # Log the crisis message if database is available
-            if db is not None:
-                try:
-                    db.collection('crisis_logs').add({
-                        'user_id': user_id,
-                        'message': user_message,
-                        'timestamp': timestamp,
-                        'session_type': 'general',
-                        'detected_keywords': True
-                    })
-                except Exception as e:
-                    print(f"Error logging crisis message: {str(e)}")
+            # Log the crisis message (off the response path)
+            log_crisis_message(user_id, user_message, timestamp, screening, session_type='general')
             
             # Define calming resources and grounding techniques
             calming_resources = get_calming_resources()
@@ -979,17 +1105,12 @@ def chat():
         
         # If not a crisis, proceed with normal response generation
         try:
-            # Simple direct model creation
-            model = genai.GenerativeModel(
-                model_name="models/gemini-1.5-flash"
-            )
-            
             # Simple prompt
-            prompt = f"You are a helpful and compassionate AI therapist. User: {user_message}\nYour response:"
+            prompt = render_prompt('general_chat', user_message=user_message)
             print(f"Sending prompt to Gemini: {prompt[:50]}...")
             
-            # Generate response
-            response = model.generate_content(prompt)
+            # Generate response with the shared model instance
+            response = generate_content(prompt, route='chat')
             
             # Extract text safely
             ai_response = "I'm here to listen. Could you please share that again?"
@@ -1023,72 +1144,15 @@ def get_quote():
         if not user_id:
             return jsonify({'error': 'User not found'}), 404
         
-        # Add randomization factors
         current_timestamp = int(time.time())
         
         # Get requested category from query params, default to random
         category = request.args.get('category', 'random')
         
-        # Map category to appropriate prompt
-        category_prompts = {
-            'inspiration': """
-                Generate a single, inspiring therapeutic quote that motivates action and positive change.
-                The quote should be brief (under 150 characters), uplifting, and focused on motivation.
-                Do not include any explanation, attribution, or quotation marks unless it's from a specific person.
-            """,
-            'mindfulness': """
-                Provide a single mindfulness quote that helps ground someone in the present moment.
-                Keep it brief (under 150 characters), insightful, and focused on awareness and presence.
-                Just the quote text with no additional formatting.
-            """,
-            'growth': """
-                Create a single therapeutic quote about personal growth, learning, and self-improvement.
-                Make it concise (under 150 characters), affirming, and focused on the journey of becoming better.
-                Only provide the quote itself without any additional context.
-            """,
-            'resilience': """
-                Generate one unique quote about resilience, overcoming challenges, and inner strength.
-                It should be short (under 150 characters), empowering, and focused on bouncing back from difficulty.
-                Just the quote text with no additional formatting or context.
-            """
-        }
-        
-        # Select a prompt based on category or random if not specified
-        if category != 'random' and category in category_prompts:
-            selected_prompt = category_prompts[category]
-        else:
-            # If random or invalid category, choose randomly from all prompts
-            all_prompts = list(category_prompts.values()) + QUOTE_PROMPTS
-            selected_prompt = random.choice(all_prompts)
-            
-            # Also randomly assign a category for the quote
-            category = random.choice(list(category_prompts.keys()))
-        
-        # Add timestamp to ensure uniqueness
-        prompt_with_timestamp = f"{selected_prompt}\n\nGenerate something completely unique. Current timestamp: {current_timestamp}"
-        
-        # Configure for higher creativity
-        generation_config = {
-            "temperature": 1.0,  # Increased temperature for more randomness
-            "top_p": 1.0,
-            "top_k": 40,
-            "max_output_tokens": 256,
-        }
-        
-        model = genai.GenerativeModel(
-            model_name="models/gemini-1.5-flash",  # Use full model name with "models/" prefix
-            generation_config=generation_config
-        )
-        
-        response = model.generate_content(prompt_with_timestamp)
-        
-        # Format the quote (remove extra quotes if present)
-        if not response:
-            quote_text = "Every moment is a fresh beginning."
-        else:
-            quote_text = response.text.strip()
-            if quote_text.startswith('"') and quote_text.endswith('"'):
-                quote_text = quote_text[1:-1]
+        # Take a pre-generated quote from the category's pool
+        quote = next_quote(category)
+        quote_text = quote['text']
+        category = quote['category']
         
         # Create quote object with category
         quote_data = {
@@ -1097,15 +1161,8 @@ def get_quote():
             'created_at': current_timestamp
         }
         
-        # Store the quote in Firestore if available
-        if db is not None:
-            # Add a new quote document with auto-generated ID
-            quotes_ref = db.collection('users').document(user_id).collection('quotes')
-            quote_ref = quotes_ref.document()
-            quote_ref.set(quote_data)
-            
-            # Include the document ID in the response
-            quote_data['id'] = quote_ref.id
+        # Save the quote (the response includes its ID)
+        quote_data = quote_store.add_quote(user_id, quote_data)
         
         # Return the quote as JSON
         return jsonify(quote_data)
@@ -1128,66 +1185,38 @@ def get_quotes():
         
         # Get query parameters for filtering
         category = request.args.get('category')
-        search_term = request.args.get('search')
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 12, type=int)
-        
-        # Use Firestore if available
-        if db is not None:
-            # Get all quotes for the user
-            quotes_ref = db.collection('users').document(user_id).collection('quotes')
-            query = quotes_ref.order_by('created_at', direction=firestore.Query.DESCENDING)
-            
-            # Apply category filter if provided
-            if category and category != 'all':
-                query = query.where('category', '==', category)
-                
-            # Get all quotes that match the query
-            quote_docs = query.stream()
-            
-            # Convert to list for filtering and pagination
-            quotes = []
-            for doc in quote_docs:
-                quote_data = doc.to_dict()
-                quote_data['id'] = doc.id  # Add document ID as quote ID
-                
-                # Apply search term filter if provided
-                if search_term and search_term.lower() not in quote_data.get('text', '').lower():
-                    continue
-                    
-                quotes.append(quote_data)
-                
-            # Calculate pagination
-            total_quotes = len(quotes)
+        if category == 'all':
+            category = None
+        search_term = (request.args.get('search') or '').strip()
+        per_page = page_limit(QUOTE_PAGE_SIZE, 'per_page')
+        page = max(1, request.args.get('page', 1, type=int))
+        
+        # One page, newest first; pass the previous page's next_cursor as `cursor`
+        # (and its number + 1 as `page`) for the next one. Without a cursor, `page`
+        # selects the page by skipping the earlier ones. The total is only counted
+        # when there is no cursor.
+        try:
+            quotes, next_cursor, total_quotes = quote_store.list_quotes(
+                user_id, category=category, search=search_term or None,
+                limit=per_page, cursor=request.args.get('cursor'), page=page
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        total_pages = None
+        if total_quotes is not None:
             total_pages = max(1, (total_quotes + per_page - 1) // per_page)
-            page = min(page, total_pages)  # Ensure page doesn't exceed total pages
-            
-            # Get paginated subset
-            start_idx = (page - 1) * per_page
-            end_idx = min(start_idx + per_page, total_quotes)
-            paginated_quotes = quotes[start_idx:end_idx]
-            
-            # Return quotes with pagination metadata
-            return jsonify({
-                'quotes': paginated_quotes,
-                'pagination': {
-                    'page': page,
-                    'per_page': per_page,
-                    'total_quotes': total_quotes,
-                    'total_pages': total_pages
-                }
-            })
-        else:
-            # If Firestore is not available, return empty list with pagination metadata
-            return jsonify({
-                'quotes': [],
-                'pagination': {
-                    'page': 1,
-                    'per_page': per_page,
-                    'total_quotes': 0,
-                    'total_pages': 1
-                }
-            })
+        
+        return jsonify({
+            'quotes': quotes,
+            'pagination': {
+                'page': page,
+                'per_page': per_page,
+                'next_cursor': next_cursor,
+                'total_quotes': total_quotes,
+                'total_pages': total_pages
+            }
+        })
     except Exception as e:
         print(f"Error getting quotes: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -1200,14 +1229,8 @@ def delete_quote(quote_id):
         if not user_id:
             return jsonify({'error': 'User not found'}), 404
         
-        # Use Firestore if available
-        if db is not None:
-            # Delete the quote from Firestore
-            db.collection('users').document(user_id).collection('quotes').document(quote_id).delete()
-            return jsonify({'success': True})
-        else:
-            # If Firestore is not available, return error
-            return jsonify({'error': 'Quotes storage not available in development mode'}), 500
+        quote_store.delete_quote(user_id, quote_id)
+        return jsonify({'success': True})
     except Exception as e:
         print(f"Error deleting quote: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -1267,6 +1290,39 @@ def firebase_user_data():
             'error': str(e)
         }), 500
 
+@app.route('/api/preferences', methods=['GET', 'PUT'])
+@firebase_required
+def user_preferences():
+    """
+    Reads or updates the user's preferences.
+    
+    response_cache (bool): whether replies to short, generic messages may be
+    shared through the response cache
+    """
+    try:
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({'error': 'User not found'}), 404
+        
+        if request.method == 'PUT':
+            data = request.get_json()
+            if not data or not isinstance(data.get('response_cache'), bool):
+                return jsonify({'error': 'Please provide response_cache as true or false'}), 400
+            
+            opt_out = not data['response_cache']
+            storage.users.update(user_id, {'response_cache_opt_out': opt_out})
+            session['response_cache_opt_out'] = opt_out
+        else:
+            opt_out = bool(get_user_profile(user_id).get('response_cache_opt_out', False))
+        
+        return jsonify({
+            'response_cache': not opt_out,
+            'response_cache_available': response_cache.enabled
+        })
+    except Exception as e:
+        print(f"Error updating preferences: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 # Add user verification endpoint
 @app.route('/api/verify-auth', methods=['GET'])
 def verify_auth():
@@ -1537,22 +1593,14 @@ def log_mood_to_tracker(user_id, detected_emotion, message=None):
     """
     try:
         # Convert emotion to mood format
-        mood_map = {
-            'happy': 'happy',
-            'excited': 'happy',
-            'neutral': 'neutral',
-            'anxious': 'anxious',
-            'sad': 'sad',
-            'angry': 'angry'
-        }
-        mood = mood_map.get(detected_emotion, 'neutral')
+        mood = DETECTED_EMOTION_TO_MOOD.get(detected_emotion, 'neutral')
         
         # Create mood entry
         entry = MoodEntry(
             user_id=user_id,
             date=date.today().isoformat(),
             mood=mood,
-            note=f"Auto-detected during therapy session: {message[:50]}..." if message else "Auto-detected during therapy session"
+            note=f"{AUTO_DETECTED_NOTE_PREFIX}: {message[:AUTO_DETECTED_NOTE_MAX_CHARS]}..." if message else AUTO_DETECTED_NOTE_PREFIX
         )
         
         # Save to the mood tracker
@@ -1564,7 +1612,18 @@ def log_mood_to_tracker(user_id, detected_emotion, message=None):
         print(f"Error logging mood to tracker: {str(e)}")
         return None
 
+def store_live_session(session_data):
+    """
+    Stores one live session exchange in the live_sessions collection
+    """
+    try:
+        db.collection('live_sessions').add(session_data)
+        print("Live session data stored in Firebase")
+    except Exception as db_error:
+        print(f"Error storing live session data: {str(db_error)}")
+
 @app.route('/api/chats/current/messages', methods=['POST'])
+@coalesce_duplicates
 def process_live_session_message():
     try:
         data = request.get_json()
@@ -1581,23 +1640,14 @@ def process_live_session_message():
             user_id = f'temp_user_{str(uuid.uuid4())}'
             session['user_id'] = user_id
         
-        # First check if this is a crisis message
-        is_crisis = is_crisis_message(user_message)
+        # Check for crisis indicators and detect emotion with a single model call
+        screening = screen_message(user_message)
+        is_crisis = screening.is_crisis
         if is_crisis:
             print("CRISIS MESSAGE DETECTED in live session!")
             
-            # Log the crisis message if database is available
-            if db is not None:
-                try:
-                    db.collection('crisis_logs').add({
-                        'user_id': user_id,
-                        'message': user_message,
-                        'timestamp': timestamp,
-                        'session_type': 'live',
-                        'detected_keywords': True
-                    })
-                except Exception as e:
-                    print(f"Error logging crisis message: {str(e)}")
+            # Log the crisis message (off the response path)
+            log_crisis_message(user_id, user_message, timestamp, screening, session_type='live')
             
             # Define calming resources and grounding techniques
             calming_resources = get_calming_resources()
@@ -1623,37 +1673,36 @@ def process_live_session_message():
             })
         
         # If not a crisis, proceed with normal processing
-        # Detect emotion from user message
-        detected_emotion = detect_emotion(user_message)
+        # Emotion was already detected during screening
+        detected_emotion = screening.detected_emotion
         print(f"Live session message received. Detected emotion: {detected_emotion}")
         print(f"Message: {user_message[:50]}...")
         
-        # Log emotion to mood tracker
+        # Log emotion to mood tracker (off the response path)
         if detected_emotion != 'neutral':
-            log_mood_to_tracker(user_id, detected_emotion, user_message)
+            background_writes.run_in_background(log_mood_to_tracker, user_id, detected_emotion, user_message)
         
         try:
-            # Simple direct model creation
-            model = genai.GenerativeModel(
-                model_name="models/gemini-1.5-flash"
-            )
-            
-            # Generate response with a simple prompt
-            base_prompt = f"You are a compassionate AI therapist. The user is feeling {detected_emotion}. Respond with empathy in 2-3 sentences."
-            
-            prompt = f"{base_prompt}\n\nUser: {user_message}\nYour response:"
-            print(f"Sending prompt to Gemini: {prompt[:50]}...")
-            
-            # Generate response
-            response = model.generate_content(prompt)
-            
-            # Extract text safely
-            ai_response = "I'm here to listen. Could you please share that again?"
-            if response and hasattr(response, 'text'):
-                ai_response = response.text.strip()
-                print(f"AI response received: {ai_response[:50]}...")
-            else:
-                print("Warning: Empty or invalid response from Gemini API")
+            # Short generic messages may be answered from the response cache
+            cache_allowed = response_cache_allowed(user_id)
+            ai_response = response_cache.get(detected_emotion, user_message) if cache_allowed else None
+            if ai_response is None:
+                # Generate response with a simple prompt
+                prompt = render_prompt('therapist_reply', emotion=detected_emotion, context='', user_message=user_message)
+                print(f"Sending prompt to Gemini: {prompt[:50]}...")
+                
+                # Generate response with the shared model instance
+                response = generate_content(prompt, route='live_session')
+                
+                # Extract text safely
+                ai_response = "I'm here to listen. Could you please share that again?"
+                if response and hasattr(response, 'text'):
+                    ai_response = response.text.strip()
+                    print(f"AI response received: {ai_response[:50]}...")
+                    if cache_allowed:
+                        response_cache.put(detected_emotion, user_message, ai_response)
+                else:
+                    print("Warning: Empty or invalid response from Gemini API")
             
             # Generate a simple wellness score based on emotion
             wellness_score = {
@@ -1671,25 +1720,17 @@ def process_live_session_message():
             if show_emergency:
                 print(f"Emergency flag triggered! Wellness score: {wellness_score}")
             
-            # Store session data in Firebase if available
+            # Store session data in Firebase if available (off the response path)
             if db is not None:
-                try:
-                    # Store session data in a live-sessions collection
-                    session_data = {
-                        'user_id': user_id,
-                        'timestamp': timestamp,
-                        'user_message': user_message,
-                        'ai_response': ai_response,
-                        'emotion': detected_emotion,
-                        'is_crisis': is_crisis,
-                        'wellness_score': wellness_score
-                    }
-                    
-                    # Add to live-sessions collection
-                    db.collection('live_sessions').add(session_data)
-                    print("Live session data stored in Firebase")
-                except Exception as db_error:
-                    print(f"Error storing live session data: {str(db_error)}")
+                background_writes.run_in_background(store_live_session, {
+                    'user_id': user_id,
+                    'timestamp': timestamp,
+                    'user_message': user_message,
+                    'ai_response': ai_response,
+                    'emotion': detected_emotion,
+                    'is_crisis': is_crisis,
+                    'wellness_score': wellness_score
+                })
             
             return jsonify({
                 'message': {
@@ -1718,6 +1759,122 @@ def process_live_session_message():
         print(f"Error processing message: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/chats/current/messages/stream', methods=['POST'])
+@coalesce_duplicates
+def process_live_session_message_stream():
+    """
+    Streaming variant of process_live_session_message.
+
+    Sends a `meta` event with the detected emotion and wellness score, `token`
+    events while Gemini generates, and a `done` event with the full payload.
+    The live session record is stored once the reply is complete.
+    """
+    try:
+        data = request.get_json()
+        if not data or 'message' not in data:
+            return jsonify({'error': 'Please provide a message'}), 400
+        
+        user_message = data['message']
+        timestamp = int(time.time())
+        
+        # Get user ID from session (set before streaming starts so the cookie is sent)
+        user_id = session.get('user_id')
+        if not user_id:
+            user_id = f'temp_user_{str(uuid.uuid4())}'
+            session['user_id'] = user_id
+        
+        # Check for crisis indicators and detect emotion with a single model call
+        screening = screen_message(user_message)
+        
+        if screening.is_crisis:
+            print("CRISIS MESSAGE DETECTED in live session!")
+            log_crisis_message(user_id, user_message, timestamp, screening, session_type='live')
+            
+            def generate_crisis():
+                yield sse_event('meta', {'detected_emotion': 'distressed', 'wellness_score': 20, 'is_crisis': True})
+                yield sse_event('done', {
+                    'message': {
+                        'text': get_crisis_response(),
+                        'timestamp': timestamp
+                    },
+                    'detected_emotion': 'distressed',
+                    'wellness_score': 20,
+                    'is_crisis': True,
+                    'show_emergency': True,
+                    'emergency_resources': EMERGENCY_RESOURCES[:5],
+                    'resource_message': "Here are some resources that can provide immediate support:",
+                    'calming_resources': get_calming_resources(),
+                    'calming_message': "While you seek help, here are some techniques that might help you feel more grounded:",
+                    'success': True
+                })
+            
+            return sse_response(generate_crisis())
+        
+        detected_emotion = screening.detected_emotion
+        print(f"Streaming live session message received. Detected emotion: {detected_emotion}")
+        
+        # Log emotion to mood tracker (off the response path)
+        if detected_emotion != 'neutral':
+            background_writes.run_in_background(log_mood_to_tracker, user_id, detected_emotion, user_message)
+        
+        # Generate a simple wellness score based on emotion
+        wellness_score = {
+            'happy': 85,
+            'excited': 90,
+            'neutral': 70,
+            'anxious': 40,
+            'sad': 30,
+            'angry': 35
+        }.get(detected_emotion, 60)
+        show_emergency = wellness_score < 40
+        
+        # Short generic messages may be answered from the response cache
+        cache_context = (detected_emotion, user_message) if response_cache_allowed(user_id) else None
+        
+        def generate():
+            yield sse_event('meta', {
+                'detected_emotion': detected_emotion,
+                'wellness_score': wellness_score,
+                'is_crisis': False,
+                'show_emergency': show_emergency
+            })
+            
+            prompt = render_prompt('therapist_reply', emotion=detected_emotion, context='', user_message=user_message)
+            result = {'text': None}
+            yield from stream_reply(prompt, 'live_session', result, cache_context)
+            if result['text'] is None:
+                return
+            
+            # Store session data in Firebase if available (off the response path)
+            if db is not None:
+                background_writes.run_in_background(store_live_session, {
+                    'user_id': user_id,
+                    'timestamp': timestamp,
+                    'user_message': user_message,
+                    'ai_response': result['text'],
+                    'emotion': detected_emotion,
+                    'is_crisis': False,
+                    'wellness_score': wellness_score
+                })
+            
+            yield sse_event('done', {
+                'message': {
+                    'text': result['text'],
+                    'timestamp': timestamp
+                },
+                'detected_emotion': detected_emotion,
+                'wellness_score': wellness_score,
+                'is_crisis': False,
+                'show_emergency': show_emergency,
+                'success': True
+            })
+        
+        return sse_response(generate())
+            
+    except Exception as e:
+        print(f"Error processing streamed message: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/get_affirmation')
 @firebase_required
 def get_daily_affirmation():
@@ -1727,7 +1884,7 @@ def get_daily_affirmation():
             return jsonify({'error': 'User not found'}), 404
             
         # Get the user's most recent mood from the mood tracker
-        entries = mood_tracker.get_user_mood_entries(
+        latest_entry = mood_tracker.get_latest_mood_entry(
             user_id=user_id,
             start_date=(datetime.now() - timedelta(days=1)).date().isoformat(),
             end_date=date.today().isoformat()
@@ -1735,8 +1892,8 @@ def get_daily_affirmation():
         
         # Use the most recent mood, or default to 'neutral'
         current_mood = 'neutral'
-        if entries:
-            current_mood = entries[0].mood
+        if latest_entry is not None:
+            current_mood = latest_entry.mood
             
         # Generate affirmation based on mood
         affirmation = get_affirmation(current_mood)
@@ -1993,24 +2150,16 @@ def check_crisis():
         message = data['message']
         
         # Check if the message contains crisis indicators
-        is_crisis = is_crisis_message(message)
+        screening = screen_message(message, need_emotion=False)
+        is_crisis = screening.is_crisis
         
         # If this is a crisis message, log it
         if is_crisis:
             user_id = session.get('user_id', 'anonymous')
             print(f"Crisis message detected from user {user_id}")
             
-            # Log to database if available
-            if db is not None:
-                try:
-                    db.collection('crisis_logs').add({
-                        'user_id': user_id,
-                        'message': message,
-                        'timestamp': int(time.time()),
-                        'detected_keywords': True
-                    })
-                except Exception as e:
-                    print(f"Error logging crisis message: {str(e)}")
+            # Log the crisis message (off the response path)
+            log_crisis_message(user_id, message, int(time.time()), screening)
         
         # Return result with resources if it's a crisis
         return jsonify({
@@ -2042,23 +2191,15 @@ def get_response():
         user_id = session.get('user_id', 'anonymous')
         timestamp = int(time.time())
         
-        # First check if this is a crisis message
-        crisis_detected = is_crisis_message(user_input)
+        # Check for crisis indicators and detect emotion with a single model call
+        screening = screen_message(user_input)
+        crisis_detected = screening.is_crisis
         
         if crisis_detected:
             print(f"Crisis detected in message from user {user_id}")
             
-            # Log the crisis message if database is available
-            if db is not None:
-                try:
-                    db.collection('crisis_logs').add({
-                        'user_id': user_id,
-                        'message': user_input,
-                        'timestamp': timestamp,
-                        'detected_keywords': True
-                    })
-                except Exception as e:
-                    print(f"Error logging crisis message: {str(e)}")
+            # Log the crisis message (off the response path)
+            log_crisis_message(user_id, user_input, timestamp, screening)
             
             # Define calming resources and grounding techniques
             calming_resources = get_calming_resources()
@@ -2082,22 +2223,23 @@ def get_response():
         
         # If not a crisis, proceed with normal response generation
         try:
-            # Detect emotion
-            detected_emotion = detect_emotion(user_input)
-            
-            # Create Gemini model
-            model = genai.GenerativeModel(
-                model_name="models/gemini-1.5-flash"
-            )
-            
-            # Generate response
-            prompt = f"You are a compassionate AI therapist. The user is feeling {detected_emotion}. Respond with empathy in 2-3 sentences.\n\nUser: {user_input}\nYour response:"
-            response = model.generate_content(prompt)
-            
-            # Extract text safely
-            ai_response = "I'm here to listen. Could you please share more about what you're experiencing?"
-            if response and hasattr(response, 'text'):
-                ai_response = response.text.strip()
+            # Emotion was already detected during screening
+            detected_emotion = screening.detected_emotion
+            
+            # Short generic messages may be answered from the response cache
+            cache_allowed = response_cache_allowed(user_id)
+            ai_response = response_cache.get(detected_emotion, user_input) if cache_allowed else None
+            if ai_response is None:
+                # Generate response with the shared model instance
+                prompt = render_prompt('therapist_reply', emotion=detected_emotion, context='', user_message=user_input)
+                response = generate_content(prompt, route='get_response')
+                
+                # Extract text safely
+                ai_response = "I'm here to listen. Could you please share more about what you're experiencing?"
+                if response and hasattr(response, 'text'):
+                    ai_response = response.text.strip()
+                    if cache_allowed:
+                        response_cache.put(detected_emotion, user_input, ai_response)
             
             return jsonify({
                 'text': ai_response,
@@ -2297,5 +2439,9 @@ if __name__ == '__main__':
     # Get port from environment variable or use default
     port = int(os.environ.get("PORT", 3001))
     
+    # Load and warm up the emotion model before accepting traffic
+    if os.getenv("EMOTION_WARMUP", "true").lower() == "true":
+        warm_up_emotion_model()
+    
     # Run app with host set to 0.0.0.0 to be accessible from the outside
     app.run(host='0.0.0.0', port=port, debug=True) 
\ No newline at end of file
@@ -0,0 +1,93 @@
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Threads per worker for overlapping request-path I/O (chat reads) with classification
+REQUEST_IO_WORKERS = int(os.getenv("REQUEST_IO_WORKERS", os.getenv("GUNICORN_THREADS", "8")))
+
+# Threads per worker for fire-and-forget writes (mood logs, crisis logs, live session records)
+BACKGROUND_WRITE_WORKERS = int(os.getenv("BACKGROUND_WRITE_WORKERS", "4"))
+
+class TaskPool:
+    """
+    Lazily created thread pool shared by all request threads of a worker.
+
+    `submit` is for work the request will wait on later (so independent I/O
+    overlaps), `run_in_background` for writes the response doesn't depend on.
+    Background failures are logged, never raised into a request.
+
+    The executor is created on first use in each process, so pools built at
+    import time in the gunicorn master don't leak threads into forked workers.
+    Its threads are joined at interpreter exit, so queued writes still land on a
+    graceful shutdown.
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0
+        }
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        pid = os.getpid()
+        if self._executor is not None and self._pid == pid:
+            return self._executor
+        with self._lock:
+            if self._executor is None or self._pid != pid:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix=self.name
+                )
+                self._pid = pid
+            return self._executor
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _on_done(self, future: Future):
+        if future.cancelled() or future.exception() is not None:
+            self._count('failed')
+        else:
+            self._count('completed')
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """
+        Starts fn(*args, **kwargs) on the pool.
+
+        Returns:
+            Future: Resolves to fn's return value (or raises its exception)
+        """
+        self._count('submitted')
+        future = self._get_executor().submit(fn, *args, **kwargs)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def run_in_background(self, fn, *args, **kwargs) -> Future:
+        """
+        Starts fn(*args, **kwargs) without anyone waiting on it; errors are logged.
+        """
+        future = self.submit(fn, *args, **kwargs)
+
+        def log_failure(done: Future):
+            if not done.cancelled() and done.exception() is not None:
+                print(f"Background task {getattr(fn, '__name__', fn)} failed: {str(done.exception())}")
+
+        future.add_done_callback(log_failure)
+        return future
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['pending'] = stats['submitted'] - stats['completed'] - stats['failed']
+        return stats
+
+request_io = TaskPool('request-io', REQUEST_IO_WORKERS)
+background_writes = TaskPool('background-writes', BACKGROUND_WRITE_WORKERS)
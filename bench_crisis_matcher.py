@@ -0,0 +1,87 @@
+"""
+Micro-benchmark: Aho-Corasick crisis matcher vs. the previous linear keyword scan.
+
+    python bench_crisis_matcher.py
+"""
+import random
+import timeit
+
+from crisis_matcher import CRISIS_KEYWORDS, CrisisKeywordMatcher, crisis_keyword_matcher
+
+def legacy_is_crisis_message(text):
+    """The previous implementation: one substring search per keyword."""
+    if not text or not isinstance(text, str):
+        return False
+    text = text.lower()
+    for keyword in CRISIS_KEYWORDS:
+        if keyword in text:
+            return True
+    return False
+
+def legacy_find_all(text):
+    """The previous approach extended to report every hit, for a like-for-like comparison."""
+    text = text.lower()
+    return [keyword for keyword in CRISIS_KEYWORDS if keyword in text]
+
+SENTENCES = [
+    "I had a long day at work and I'm pretty tired.",
+    "My sister called and we talked about the holidays.",
+    "I keep thinking about what my manager said in the meeting.",
+    "Honestly I don't know why I feel so off lately.",
+    "We went for a walk in the park and it was nice to be outside.",
+    "Sometimes I worry that I'm not doing enough for my friends.",
+    "I spilled coffee on my laptop this morning, great start.",
+    "The exam is next week and I haven't started studying.",
+]
+
+def make_message(length: int, rng: random.Random) -> str:
+    words = []
+    while len(" ".join(words)) < length:
+        words.append(rng.choice(SENTENCES))
+    return " ".join(words)[:length]
+
+def run(lengths=(40, 200, 1000, 5000), messages_per_length=200, seed=7):
+    rng = random.Random(seed)
+    print(f"{'length':>8} {'legacy any':>12} {'legacy all':>12} {'automaton':>12} {'speedup(all)':>13}")
+    for length in lengths:
+        messages = [make_message(length, rng) for _ in range(messages_per_length)]
+        # Sprinkle real crisis phrases into a tenth of the messages
+        for i in range(0, len(messages), 10):
+            messages[i] = messages[i] + " " + rng.choice(CRISIS_KEYWORDS)
+
+        number = max(1, 20000 // (messages_per_length * max(1, length // 200)))
+        legacy_any = timeit.timeit(lambda: [legacy_is_crisis_message(m) for m in messages], number=number)
+        legacy_all = timeit.timeit(lambda: [legacy_find_all(m) for m in messages], number=number)
+        automaton = timeit.timeit(lambda: [crisis_keyword_matcher.find(m) for m in messages], number=number)
+
+        per_message = 1e6 / (number * len(messages))
+        print(f"{length:>8} {legacy_any * per_message:>10.1f}us {legacy_all * per_message:>10.1f}us "
+              f"{automaton * per_message:>10.1f}us {legacy_all / automaton:>12.2f}x")
+
+    # Cost as the keyword list grows (the linear scan is O(keywords x length),
+    # the automaton O(length))
+    print()
+    print(f"{'keywords':>8} {'legacy all':>12} {'automaton':>12} {'speedup':>8}")
+    messages = [make_message(200, rng) for _ in range(messages_per_length)]
+    for multiplier in (1, 4, 16):
+        keywords = [f"{keyword} {suffix}" if suffix else keyword
+                    for keyword in CRISIS_KEYWORDS
+                    for suffix in [''] + [f"v{i}" for i in range(1, multiplier)]]
+        matcher = CrisisKeywordMatcher(keywords)
+        legacy_all = timeit.timeit(
+            lambda: [[k for k in keywords if k in lowered] for lowered in map(str.lower, messages)],
+            number=20)
+        automaton = timeit.timeit(lambda: [matcher.find(m) for m in messages], number=20)
+        per_message = 1e6 / (20 * len(messages))
+        print(f"{len(keywords):>8} {legacy_all * per_message:>10.1f}us "
+              f"{automaton * per_message:>10.1f}us {legacy_all / automaton:>7.2f}x")
+
+    # Behavioral differences caused by leading word-boundary matching
+    samples = ["Oil spills are terrible", "I took all my pills", "The gunther family", "I'm jumping off", "I overdosed"]
+    print()
+    for sample in samples:
+        print(f"{sample!r}: legacy={legacy_is_crisis_message(sample)} "
+              f"automaton={[m.keyword for m in crisis_keyword_matcher.find(sample)]}")
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,87 @@
+"""
+Micro-benchmark: MoodTracker's per-user date index vs. the previous full scan (in-memory mode).
+
+    python bench_mood_tracker.py                       # 10k, 100k and 1M entries
+    python bench_mood_tracker.py --sizes 1000000 5000000
+"""
+import argparse
+import random
+import time
+import timeit
+from datetime import date, timedelta
+
+from mood_tracker import MoodTracker, MoodEntry
+
+MOODS = ['happy', 'neutral', 'anxious', 'sad', 'angry']
+
+def legacy_get_user_mood_entries(storage: dict, user_id: str, start_date: str = None, end_date: str = None):
+    """The previous implementation: scan every user's entries, filter, then sort."""
+    entries = []
+    for entry_data in storage.values():
+        if entry_data['user_id'] == user_id:
+            if start_date and entry_data['date'] < start_date:
+                continue
+            if end_date and entry_data['date'] > end_date:
+                continue
+            entries.append(MoodEntry.from_dict(entry_data))
+    return sorted(entries, key=lambda x: x.date, reverse=True)
+
+def populate(tracker: MoodTracker, entries: int, users: int, days: int, rng: random.Random):
+    first_day = date.today() - timedelta(days=days)
+    dates = [(first_day + timedelta(days=i)).isoformat() for i in range(days)]
+    user_ids = [f"user-{i}" for i in range(users)]
+    for _ in range(entries):
+        tracker.add_mood_entry(MoodEntry(rng.choice(user_ids), rng.choice(dates), rng.choice(MOODS)))
+    return user_ids, dates
+
+def run(sizes=(10_000, 100_000, 1_000_000), entries_per_user=500, days=730, queries=50, seed=7):
+    rng = random.Random(seed)
+    print(f"{'entries':>10} {'users':>7} {'insert':>9} {'query':>6} {'legacy':>11} {'indexed':>11} {'speedup':>9}")
+    for size in sizes:
+        tracker = MoodTracker()
+        users = max(1, size // entries_per_user)
+        start = time.perf_counter()
+        user_ids, dates = populate(tracker, size, users, days, rng)
+        insert_us = (time.perf_counter() - start) * 1e6 / size
+
+        week_start = dates[-7]
+        today = dates[-1]
+        cases = {
+            'week': (week_start, today),  # /get_moods for the last week
+            'all': (None, None),          # /get_moods without a range
+        }
+        sample = [rng.choice(user_ids) for _ in range(queries)]
+        # The legacy scan costs O(total entries) per call; keep the largest runs short
+        legacy_number = max(1, min(queries, 2_000_000 // size))
+
+        for name, (start_date, end_date) in cases.items():
+            for user_id in sample[:3]:
+                # The legacy scan kept same-day entries oldest first; the index returns them newest first
+                expected = legacy_get_user_mood_entries(tracker.entries.entries, user_id, start_date, end_date)
+                entries = tracker.get_user_mood_entries(user_id, start_date, end_date)
+                assert [entry.date for entry in entries] == [entry.date for entry in expected]
+                assert sorted(map(repr, entries)) == sorted(map(repr, expected))
+
+            legacy = timeit.timeit(
+                lambda: [legacy_get_user_mood_entries(tracker.entries.entries, user_id, start_date, end_date)
+                         for user_id in sample[:legacy_number]],
+                number=1) / legacy_number
+            indexed = timeit.timeit(
+                lambda: [tracker.get_user_mood_entries(user_id, start_date, end_date) for user_id in sample],
+                number=1) / len(sample)
+            print(f"{size:>10} {users:>7} {insert_us:>7.1f}us {name:>6} {legacy * 1e6:>9.0f}us "
+                  f"{indexed * 1e6:>9.1f}us {legacy / indexed:>8.0f}x")
+
+        # /get_affirmation: the latest entry from yesterday or today
+        latest = timeit.timeit(
+            lambda: [tracker.get_latest_mood_entry(user_id, dates[-2], today) for user_id in sample],
+            number=1) / len(sample)
+        print(f"{'':>10} {'':>7} {'':>9} {'latest':>6} {'':>11} {latest * 1e6:>9.1f}us")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                        help="Total mood entries to benchmark with")
+    parser.add_argument('--entries-per-user', type=int, default=500)
+    args = parser.parse_args()
+    run(sizes=args.sizes, entries_per_user=args.entries_per_user)
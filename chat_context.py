@@ -0,0 +1,179 @@
+import os
+import threading
+from typing import Callable, Optional
+
+from llm_client import generate_content
+from prompts import estimate_tokens, render_prompt
+
+# Token budget for the recent turns resent with every message
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "1000"))
+
+# Older turns are folded into the rolling summary once this many have left the window
+CHAT_SUMMARY_BATCH_SIZE = int(os.getenv("CHAT_SUMMARY_BATCH_SIZE", "6"))
+
+# At most this many turns are folded in per refresh (long pre-existing chats catch up over several)
+CHAT_SUMMARY_MAX_TURNS = int(os.getenv("CHAT_SUMMARY_MAX_TURNS", "24"))
+
+# Upper bound on the rolling summary's length
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "200"))
+
+summary_generation_config = {
+    "temperature": 0.2,
+    "max_output_tokens": CHAT_SUMMARY_MAX_TOKENS,
+}
+
+# Senders whose messages are conversation turns; others (the 'system' greeting
+# every chat starts with) are left out of prompts and summaries
+SPEAKER_LABELS = {
+    'user': 'User',
+    'bot': 'Therapist'
+}
+
+def is_turn(message: dict) -> bool:
+    return message.get('sender') in SPEAKER_LABELS
+
+def _format_turn(message: dict) -> str:
+    return f"{SPEAKER_LABELS[message['sender']]}: {message.get('text', '')}"
+
+def _format_turns(messages: list) -> str:
+    return '\n'.join(_format_turn(message) for message in messages if is_turn(message))
+
+def select_recent_turns(messages: list, budget: int = CHAT_CONTEXT_TOKEN_BUDGET) -> int:
+    """
+    Finds the oldest message that still fits in the token budget, walking back from the newest.
+
+    Returns:
+        int: Index into messages where the recent window starts (len(messages) if none fit)
+    """
+    used = 0
+    start = len(messages)
+    while start > 0:
+        message = messages[start - 1]
+        cost = estimate_tokens(_format_turn(message)) if is_turn(message) else 0
+        if used + cost > budget:
+            break
+        used += cost
+        start -= 1
+    return start
+
+def build_chat_prompt(user_message: str, emotion: str, chat_data: Optional[dict]) -> str:
+    """
+    Builds the therapist prompt with conversational context.
+
+    The prompt carries the chat's rolling summary (covering turns before
+    `summary_upto`) and the most recent turns that fit in
+    CHAT_CONTEXT_TOKEN_BUDGET, so its size stays roughly constant however long
+    the chat gets. Turns between the summary and the window are left out until
+    the next summary refresh folds them in.
+
+    Args:
+        user_message (str): The new message (not yet in chat_data['messages'])
+        emotion (str): The detected mood for the new message
+        chat_data (dict, optional): The chat document
+
+    Returns:
+        str: The prompt for Gemini
+    """
+    context = ''
+    chat_data = chat_data or {}
+    summary = chat_data.get('summary')
+    if summary:
+        context += f"\n\nSummary of the conversation so far:\n{summary}"
+
+    messages = chat_data.get('messages', [])
+    turns = _format_turns(messages[select_recent_turns(messages):])
+    if turns:
+        context += f"\n\nRecent conversation:\n{turns}"
+
+    return render_prompt('therapist_reply', emotion=emotion, context=context, user_message=user_message)
+
+def has_history(chat_data: Optional[dict]) -> bool:
+    """Whether a chat already has turns or a summary that the reply should take into account"""
+    if not chat_data:
+        return False
+    return bool(chat_data.get('summary')) or any(is_turn(message) for message in chat_data.get('messages', []))
+
+def _window_start(chat_data: dict) -> int:
+    """Position in the chat of the first turn in the prompt's recent window"""
+    messages = chat_data.get('messages', [])
+    return chat_data.get('messages_offset', 0) + select_recent_turns(messages)
+
+def summary_refresh_due(chat_data: dict) -> bool:
+    """Whether enough turns have left the recent window to refresh the summary"""
+    return _window_start(chat_data) - chat_data.get('summary_upto', 0) >= CHAT_SUMMARY_BATCH_SIZE
+
+def compact_summary(chat_data: dict, load_turns: Optional[Callable[[int, int], list]] = None) -> Optional[dict]:
+    """
+    Folds turns that have left the recent window into the rolling summary.
+
+    Only runs once at least CHAT_SUMMARY_BATCH_SIZE such turns have
+    accumulated, and only sends the previous summary plus at most
+    CHAT_SUMMARY_MAX_TURNS of those turns to Gemini, so each refresh costs
+    about the same however long the chat is.
+
+    chat_data['messages'] may hold only the chat's latest messages, starting at
+    position chat_data['messages_offset']; older turns to fold in are then
+    fetched with load_turns(start, end).
+
+    Args:
+        chat_data (dict): The chat document
+        load_turns (callable, optional): Returns the messages at positions [start, end)
+
+    Returns:
+        dict: {'summary': str, 'summary_upto': int} to store on the chat, or
+            None if no refresh is due or summarization failed
+    """
+    if not summary_refresh_due(chat_data):
+        return None
+
+    messages = chat_data.get('messages', [])
+    offset = chat_data.get('messages_offset', 0)
+    summary_upto = chat_data.get('summary_upto', 0)
+    fold_upto = min(_window_start(chat_data), summary_upto + max(CHAT_SUMMARY_BATCH_SIZE, CHAT_SUMMARY_MAX_TURNS))
+
+    if summary_upto >= offset:
+        folded = messages[summary_upto - offset:fold_upto - offset]
+    elif load_turns is not None:
+        folded = load_turns(summary_upto, fold_upto)
+    else:
+        return None
+
+    previous = chat_data.get('summary') or "(none yet)"
+    turns = _format_turns(folded)
+    if not turns:
+        # Nothing but system messages aged out; advance past them without a Gemini call
+        return {'summary': chat_data.get('summary'), 'summary_upto': fold_upto}
+    prompt = render_prompt('chat_summary', max_words=CHAT_SUMMARY_MAX_TOKENS * 3 // 4, summary=previous, turns=turns)
+
+    try:
+        response = generate_content(
+            prompt,
+            generation_config=summary_generation_config,
+            route='chat_summary'
+        )
+        if not response or not response.text.strip():
+            return None
+        return {'summary': response.text.strip(), 'summary_upto': fold_upto}
+    except Exception as e:
+        print(f"Error updating chat summary: {str(e)}")
+        return None
+
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+def claim_summary_refresh(chat_key: tuple) -> bool:
+    """
+    Marks a chat's summary refresh as in progress in this process.
+
+    Returns:
+        bool: False if a refresh for the chat is already running
+    """
+    with _refreshing_lock:
+        if chat_key in _refreshing:
+            return False
+        _refreshing.add(chat_key)
+        return True
+
+def release_summary_refresh(chat_key: tuple):
+    with _refreshing_lock:
+        _refreshing.discard(chat_key)
@@ -0,0 +1,237 @@
+import os
+import json
+import base64
+from typing import NamedTuple, Optional
+
+# Most recent messages loaded with a chat when a reply is generated (the prompt
+# uses those that fit its token budget)
+CHAT_WINDOW_MESSAGES = int(os.getenv("CHAT_WINDOW_MESSAGES", "50"))
+
+# Characters of the last message kept on the chat document for previews
+CHAT_PREVIEW_CHARS = 120
+
+# Default page sizes for the chat list and message windows; requests may ask for up to MAX_PAGE_SIZE
+CHAT_LIST_PAGE_SIZE = int(os.getenv("CHAT_LIST_PAGE_SIZE", "20"))
+MESSAGE_PAGE_SIZE = int(os.getenv("MESSAGE_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = 200
+
+# Fields of the chat list projection
+CHAT_LIST_FIELDS = ('title', 'created_at', 'updated_at', 'message_count', 'last_message')
+
+MESSAGES_COLLECTION = 'messages'
+
+def message_id(seq: int) -> str:
+    """Message document IDs are zero-padded positions, so they sort in chat order"""
+    return f"{seq:08d}"
+
+def message_preview(message: Optional[dict]) -> Optional[dict]:
+    """The short form of a message stored on its chat document"""
+    if not message:
+        return None
+    return {
+        'sender': message.get('sender'),
+        'text': (message.get('text') or '')[:CHAT_PREVIEW_CHARS],
+        'timestamp': message.get('timestamp')
+    }
+
+def is_legacy_chat(chat_data: dict) -> bool:
+    """Chats written before messages moved to a subcollection embed them in a `messages` array"""
+    return 'message_count' not in chat_data
+
+def encode_cursor(values: list) -> str:
+    """Opaque, URL-safe page cursor"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> list:
+    """
+    Raises:
+        ValueError: The cursor is malformed
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+def _message_window(messages: list, before: Optional[int], limit: int) -> tuple:
+    """The `limit` messages before position `before` of a fully loaded chat, and whether older ones exist"""
+    end = len(messages) if before is None else max(0, min(before, len(messages)))
+    start = max(0, end - limit)
+    return messages[start:end], start > 0
+
+def chat_summary_fields(chat_data: dict) -> dict:
+    """A chat's metadata without its messages (legacy chats get a derived count and preview)"""
+    summary = {key: value for key, value in chat_data.items() if key != 'messages'}
+    if is_legacy_chat(chat_data):
+        messages = chat_data.get('messages', [])
+        summary['message_count'] = len(messages)
+        summary['last_message'] = message_preview(messages[-1] if messages else None)
+    return summary
+
+class ChatRef(NamedTuple):
+    """Identifies a chat loaded with ChatStore.load_chat"""
+    user_id: str
+    chat_id: str
+
+class ChatStore:
+    """
+    Chats and their messages, stored through a ChatRepository (see storage.py).
+
+    A chat's metadata holds its title, timestamps, `message_count`, a
+    `last_message` preview and the rolling summary; messages are stored
+    separately, each with its position in the chat as `seq`. Adding a turn
+    writes the new messages and bumps the count atomically, so its cost
+    doesn't grow with the chat, and a reply only loads a window of the latest
+    messages.
+
+    Firestore chats written before messages moved to a subcollection still
+    embed a `messages` array (see is_legacy_chat); they are served from it and
+    migrated the first time a message is added to them.
+    """
+
+    def __init__(self, chats):
+        self.chats = chats
+
+    def create_chat(self, user_id: str, chat_data: dict, messages: list) -> str:
+        """
+        Creates a chat with its first messages.
+
+        Returns:
+            str: The new chat's ID
+        """
+        messages = [dict(message, seq=seq) for seq, message in enumerate(messages)]
+        chat_data = dict(chat_data, message_count=len(messages),
+                         last_message=message_preview(messages[-1] if messages else None))
+        return self.chats.create(user_id, chat_data, messages)
+
+    def load_chat(self, user_id: str, chat_id: str, window: int = CHAT_WINDOW_MESSAGES):
+        """
+        Fetches a chat that messages are about to be added to.
+
+        chat_data['messages'] holds the chat's last `window` messages (all of
+        them for legacy chats); chat_data['messages_offset'] is the position
+        of the first one.
+
+        Returns:
+            tuple: (chat_ref, chat_data), or None if the chat doesn't exist
+        """
+        chat_data = self.chats.get(user_id, chat_id)
+        if chat_data is None:
+            return None
+
+        if is_legacy_chat(chat_data):
+            chat_data['messages_offset'] = 0
+        else:
+            messages = self.chats.latest_messages(user_id, chat_id, window)
+            chat_data['messages'] = messages
+            chat_data['messages_offset'] = messages[0]['seq'] if messages else chat_data['message_count']
+        return ChatRef(user_id, chat_id), chat_data
+
+    def append_messages(self, chat_ref: ChatRef, chat_data: dict, new_messages: list, timestamp: int):
+        """
+        Adds messages to a chat loaded with load_chat; chat_data is updated to include them.
+        """
+        stamped = self.chats.append_messages(chat_ref.user_id, chat_ref.chat_id, chat_data, new_messages, timestamp)
+        chat_data.setdefault('messages', []).extend(stamped)
+        chat_data['message_count'] = stamped[-1]['seq'] + 1
+        chat_data['last_message'] = message_preview(stamped[-1])
+        chat_data['updated_at'] = timestamp
+
+    def update_chat(self, chat_ref: ChatRef, fields: dict):
+        """Merges fields into the metadata of a chat loaded with load_chat"""
+        self.chats.update(chat_ref.user_id, chat_ref.chat_id, fields)
+
+    def get_messages(self, chat_ref: ChatRef, chat_data: dict, start: int, end: int) -> list:
+        """
+        Messages at positions [start, end) of a chat loaded with load_chat.
+        """
+        offset = chat_data.get('messages_offset', 0)
+        if is_legacy_chat(chat_data) or start >= offset:
+            return chat_data.get('messages', [])[max(0, start - offset):max(0, end - offset)]
+        return self.chats.messages_between(chat_ref.user_id, chat_ref.chat_id, start, end)
+
+    def find_idempotent_exchange(self, chat_ref: ChatRef, chat_data: dict, idempotency_key: str) -> Optional[tuple]:
+        """
+        Looks up the message sent with an Idempotency-Key in a chat loaded with
+        load_chat. The key is stored on the message and found with a query, so
+        the message is found however far back it is.
+
+        Returns:
+            tuple: (message, the message after it or None), or None if no
+                message was sent with the key
+        """
+        if is_legacy_chat(chat_data):
+            messages = chat_data.get('messages', [])
+            for i in range(len(messages) - 1, -1, -1):
+                if messages[i].get('idempotency_key') == idempotency_key:
+                    return messages[i], messages[i + 1] if i + 1 < len(messages) else None
+            return None
+
+        message = self.chats.find_message(chat_ref.user_id, chat_ref.chat_id, idempotency_key)
+        if message is None:
+            return None
+        following = self.get_messages(chat_ref, chat_data, message['seq'] + 1, message['seq'] + 2)
+        return message, following[0] if following else None
+
+    def get_chat(self, user_id: str, chat_id: str, before: Optional[int] = None,
+                 limit: int = MESSAGE_PAGE_SIZE) -> Optional[dict]:
+        """
+        Returns a chat's metadata with a window of its messages, or None if it doesn't exist.
+
+        The window holds the `limit` messages before position `before` (the
+        latest ones if before is None), oldest first. `has_more` says whether
+        older messages exist; `next_before` is the `before` value that fetches them.
+        """
+        chat_data = self.chats.get(user_id, chat_id)
+        if chat_data is None:
+            return None
+
+        if is_legacy_chat(chat_data):
+            messages = [dict(message, seq=seq) for seq, message in enumerate(chat_data.get('messages', []))]
+            messages, has_more = _message_window(messages, before, limit)
+        else:
+            messages = self.chats.latest_messages(user_id, chat_id, limit + 1, before)
+            has_more = len(messages) > limit
+            messages = messages[-limit:] if has_more else messages
+
+        chat_data = chat_summary_fields(chat_data)
+        chat_data['messages'] = messages
+        chat_data['has_more'] = has_more
+        chat_data['next_before'] = messages[0].get('seq') if has_more and messages else None
+        return chat_data
+
+    def list_chats(self, user_id: str, limit: int = CHAT_LIST_PAGE_SIZE, cursor: Optional[str] = None) -> tuple:
+        """
+        Returns a page of the user's chats, most recently updated first.
+
+        Only the CHAT_LIST_FIELDS are read, never the messages. Pages are keyed
+        on (updated_at, chat ID), so a page costs `limit` reads however many
+        chats the user has.
+
+        Returns:
+            tuple: (chats, next_cursor) - next_cursor is None on the last page
+
+        Raises:
+            ValueError: The cursor is malformed
+        """
+        after = tuple(decode_cursor(cursor)) if cursor else None
+        if after is not None and len(after) != 2:
+            raise ValueError("Invalid cursor")
+
+        page = self.chats.list(user_id, limit + 1, after)
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_cursor([page[-1].get('updated_at', 0), page[-1]['id']])
+        return page, next_cursor
+
+    def delete_chat(self, user_id: str, chat_id: str) -> bool:
+        """
+        Deletes a chat and its messages.
+
+        Returns:
+            bool: False if the chat doesn't exist
+        """
+        return self.chats.delete(user_id, chat_id)
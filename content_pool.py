@@ -0,0 +1,204 @@
+import os
+import re
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# Pool sizing (overridable via environment variables)
+CONTENT_POOL_LOW_WATERMARK = int(os.getenv("CONTENT_POOL_LOW_WATERMARK", "2"))
+CONTENT_POOL_TARGET_SIZE = int(os.getenv("CONTENT_POOL_TARGET_SIZE", "5"))
+
+# Seconds to wait before retrying a category whose generation failed
+CONTENT_POOL_RETRY_AFTER_S = float(os.getenv("CONTENT_POOL_RETRY_AFTER_S", "30"))
+
+# Set to false to never call the LLM from the refill thread (pools stay empty)
+CONTENT_POOL_REFILL = os.getenv("CONTENT_POOL_REFILL", "true").lower() == "true"
+
+_JSON_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+def chunk_counts(counts: Dict[str, int], max_items: int) -> List[Dict[str, int]]:
+    """Splits {category: count} into batch requests of at most max_items items"""
+    chunks, chunk, size = [], {}, 0
+    for category, count in counts.items():
+        count = min(count, max_items)
+        if chunk and size + count > max_items:
+            chunks.append(chunk)
+            chunk, size = {}, 0
+        chunk[category] = count
+        size += count
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def parse_batch(text: str, categories: Iterable[str]) -> Dict[str, list]:
+    """
+    Reads a batch reply: a JSON object (optionally in a code fence) mapping categories to lists.
+
+    Returns:
+        dict: {category: list} for the requested categories present in the reply
+
+    Raises:
+        ValueError: The reply isn't valid JSON
+    """
+    data = json.loads(_JSON_FENCE_RE.sub('', text.strip()))
+    if not isinstance(data, dict):
+        return {}
+    return {category: data[category] for category in categories if isinstance(data.get(category), list)}
+
+class ContentPool:
+    """
+    Per-category pools of pre-generated items (affirmations, quotes).
+
+    Requests take items with `pop`, an O(1) deque operation that never waits
+    on the LLM. A background thread keeps every category between the low
+    watermark and the target size by calling `generate(category)`, which
+    returns one item or None on failure. Callers fall back to static content
+    when a pool is empty.
+
+    If `generate_batch` is given, all categories due for a refill are topped up
+    together with one `generate_batch({category: count})` call returning
+    {category: [items]}, instead of one `generate` call per item.
+    """
+
+    def __init__(self, name: str, categories: Iterable[str], generate: Callable[[str], Optional[Any]],
+                 low_watermark: int = CONTENT_POOL_LOW_WATERMARK, target_size: int = CONTENT_POOL_TARGET_SIZE,
+                 refill: bool = CONTENT_POOL_REFILL,
+                 generate_batch: Optional[Callable[[Dict[str, int]], Dict[str, List[Any]]]] = None):
+        self.name = name
+        self.generate = generate
+        self.generate_batch = generate_batch
+        self.target_size = max(1, target_size)
+        self.low_watermark = min(max(0, low_watermark), self.target_size - 1)
+        self.refill = refill
+        self._pools = {category: deque() for category in categories}
+        self._retry_at = {}  # category -> monotonic time before which it isn't retried
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._items_lock = threading.Lock()
+        self._thread = None
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'generated': 0,
+            'duplicates': 0,
+            'batches': 0,
+            'failures': 0
+        }
+
+    @property
+    def categories(self) -> list:
+        return list(self._pools)
+
+    def start(self):
+        """Start the refill thread lazily (after any gunicorn fork)."""
+        if not self.refill:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name=f"{self.name}-pool-refill",
+                    daemon=True
+                )
+                self._thread.start()
+
+    def pop(self, category: str) -> Optional[Any]:
+        """
+        Takes a pre-generated item for the category.
+
+        Returns:
+            The item, or None if the pool is empty or the category is unknown
+        """
+        self.start()
+        pool = self._pools.get(category)
+        if pool is None:
+            return None
+
+        with self._items_lock:
+            item = pool.popleft() if pool else None
+        self.stats['hits' if item is not None else 'misses'] += 1
+
+        if len(pool) <= self.low_watermark:
+            self._wakeup.set()
+        return item
+
+    def add(self, category: str, items: Iterable[Any]) -> int:
+        """
+        Stores generated items for later serving.
+
+        Items already in the pool and items beyond the target size are dropped.
+
+        Returns:
+            int: The number of items added
+        """
+        pool = self._pools.get(category)
+        if pool is None:
+            return 0
+
+        added = 0
+        with self._items_lock:
+            for item in items:
+                if len(pool) >= self.target_size:
+                    break
+                if item in pool:
+                    self.stats['duplicates'] += 1
+                    continue
+                pool.append(item)
+                added += 1
+        self.stats['generated'] += added
+        return added
+
+    def _refill_category(self, category: str) -> bool:
+        """Tops one category up to the target size; returns False if generation failed."""
+        pool = self._pools[category]
+        while len(pool) < self.target_size:
+            try:
+                item = self.generate(category)
+            except Exception as e:
+                print(f"Error generating {self.name} for pool '{category}': {str(e)}")
+                item = None
+            if item is None or not self.add(category, [item]):
+                self.stats['failures'] += 1
+                return False
+        return True
+
+    def _refill_batch(self, categories: List[str]) -> List[str]:
+        """Tops categories up with one generate_batch call; returns those that got nothing."""
+        counts = {category: self.target_size - len(self._pools[category]) for category in categories}
+        try:
+            batch = self.generate_batch(counts) or {}
+        except Exception as e:
+            print(f"Error generating {self.name} batch for pools {categories}: {str(e)}")
+            batch = {}
+        self.stats['batches'] += 1
+
+        failed = [category for category in categories if not self.add(category, batch.get(category, []))]
+        self.stats['failures'] += len(failed)
+        return failed
+
+    def _run(self):
+        while True:
+            # Cleared before checking the pools, so a pop() during the refill below wakes the next wait
+            self._wakeup.clear()
+            due = [
+                category for category, pool in self._pools.items()
+                if len(pool) <= self.low_watermark and time.monotonic() >= self._retry_at.get(category, 0.0)
+            ]
+            if self.generate_batch is not None:
+                failed = self._refill_batch(due) if due else []
+            else:
+                failed = [category for category in due if not self._refill_category(category)]
+            for category in failed:
+                self._retry_at[category] = time.monotonic() + CONTENT_POOL_RETRY_AFTER_S
+
+            # Sleep until a pool drops to its low watermark, or until failed categories may be retried
+            self._wakeup.wait(timeout=CONTENT_POOL_RETRY_AFTER_S)
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats['sizes'] = {category: len(pool) for category, pool in self._pools.items()}
+        return stats
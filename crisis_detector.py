@@ -0,0 +1,92 @@
+import os
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from crisis_matcher import find_crisis_keywords, has_intent_context
+from emotion_batcher import analyze_emotion
+from emotion_detector import mood_from_probabilities
+
+# Immediate-danger words that also mean something harmless ("the bridge was
+# closed", "we were hanging out"). Every other keyword, including the
+# suicidal-ideation, hopelessness and distress phrases, flags a crisis
+# immediately, so a model miss can't suppress them. These flag a crisis
+# immediately too when two of them occur together or one comes with intent
+# phrasing ("I'm going to jump", "all my pills"); only a single bare word goes
+# to the emotion model for confirmation.
+AMBIGUOUS_CRISIS_KEYWORDS = {
+    'pills', 'gun', 'jump', 'hanging', 'bridge', 'roof'
+}
+
+# Emotions that count as distress when verifying ambiguous candidates
+DISTRESS_EMOTIONS = ('fear', 'sadness', 'anger', 'disgust')
+
+# Minimum combined probability of DISTRESS_EMOTIONS that confirms an ambiguous candidate
+CRISIS_DISTRESS_THRESHOLD = float(os.getenv("CRISIS_DISTRESS_THRESHOLD", "0.5"))
+
+@dataclass
+class MessageScreening:
+    is_crisis: bool
+    detected_emotion: Optional[str] = None   # Mood, when the emotion model ran
+    matched_keywords: List[str] = field(default_factory=list)
+    distress_score: Optional[float] = None
+    verified_by_model: bool = False
+
+def distress_score(probabilities: dict) -> float:
+    return sum(probabilities.get(emotion, 0.0) for emotion in DISTRESS_EMOTIONS)
+
+def screen_message(text: str, need_emotion: bool = True,
+                   analyze: Callable[[str], Optional[dict]] = analyze_emotion) -> MessageScreening:
+    """
+    Tiered crisis detection sharing a single model call with emotion detection.
+
+    1. A lexical gate (the precompiled keyword automaton) runs on every message.
+       Messages without hits are not crises.
+    2. Hits on unambiguous keywords, two or more hits, and ambiguous keywords
+       with intent phrasing around them are crises without consulting the model.
+    3. A message whose only hit is a single bare ambiguous keyword is confirmed
+       by the emotion model: it is a crisis if the distress probability reaches
+       CRISIS_DISTRESS_THRESHOLD. If the model is unavailable it is treated
+       as a crisis.
+
+    The emotion model runs at most once per message - when a candidate needs
+    verification or the caller needs the detected emotion - and the same
+    batched forward pass answers both questions.
+
+    Args:
+        text (str): The message text to analyze
+        need_emotion (bool): Whether the caller also needs the detected mood
+        analyze (callable): Returns the emotion distribution for a text
+
+    Returns:
+        MessageScreening: The crisis decision and, when computed, the mood
+    """
+    if not text or not isinstance(text, str):
+        return MessageScreening(is_crisis=False, detected_emotion='neutral' if need_emotion else None)
+
+    matches = find_crisis_keywords(text)
+    keywords = []
+    for match in matches:
+        if match.keyword not in keywords:
+            keywords.append(match.keyword)
+    needs_verification = (
+        len(matches) == 1
+        and matches[0].keyword in AMBIGUOUS_CRISIS_KEYWORDS
+        and not has_intent_context(text, matches[0])
+    )
+
+    probabilities = None
+    if need_emotion or needs_verification:
+        probabilities = analyze(text)
+
+    screening = MessageScreening(is_crisis=bool(keywords), matched_keywords=keywords)
+    if probabilities:
+        screening.detected_emotion = mood_from_probabilities(probabilities)
+        screening.distress_score = distress_score(probabilities)
+    elif need_emotion:
+        screening.detected_emotion = 'neutral'
+
+    if needs_verification and probabilities:
+        screening.is_crisis = screening.distress_score >= CRISIS_DISTRESS_THRESHOLD
+        screening.verified_by_model = True
+
+    return screening
@@ -0,0 +1,176 @@
+import re
+from collections import deque
+from dataclasses import dataclass
+from typing import Iterator, List
+
+# Crisis keywords related to suicide, self-harm, and panic
+CRISIS_KEYWORDS = [
+    # Suicide-related
+    'suicide', 'kill myself', 'end my life', 'take my life', 'don\'t want to live',
+    'no reason to live', 'better off dead', 'want to die', 'rather be dead',
+    'should just die', 'going to end it', 'saying goodbye', 'final goodbye',
+
+    # Self-harm related
+    'cut myself', 'cutting myself', 'harm myself', 'hurt myself', 'self-harm',
+    'self harm', 'injure myself', 'burning myself', 'hurting myself',
+
+    # Severe distress/panic
+    'can\'t breathe', 'heart racing', 'panic attack', 'having a breakdown',
+    'losing control', 'can\'t take it anymore', 'unbearable pain', 'overwhelmed',
+    'no way out', 'trapped', 'hopeless', 'helpless',
+
+    # Immediate danger
+    'overdose', 'pills', 'gun', 'jump', 'hanging', 'bridge', 'roof'
+]
+
+# Phrasing near an "immediate danger" keyword that states intent or access to
+# the means ("I'm going to jump", "all my pills", "I bought a gun")
+INTENT_PHRASES = [
+    "i'm going to", "i am going to", "going to", "i'm gonna", "gonna", "i will", "i'll",
+    "i want to", "i plan to", "planning to", "tonight", "all my", "all of my", "enough",
+    "off the", "off a", "off of", "i bought", "bought a", "i got", "i've got", "i have a",
+    "i saved", "i've saved", "saved up", "stockpiled"
+]
+
+# Characters before (and half as many after) a keyword searched for intent phrasing
+INTENT_WINDOW_CHARS = 40
+
+@dataclass
+class KeywordMatch:
+    keyword: str
+    start: int  # Offset of the first character in the normalized text
+    end: int    # Offset just past the last character
+
+class AhoCorasick:
+    """
+    Multi-pattern string matcher.
+
+    Builds a trie of all patterns with failure links once, then finds every
+    occurrence of every pattern in a single left-to-right pass over the text,
+    independent of the number of patterns.
+    """
+
+    def __init__(self, patterns: List[str]):
+        self.patterns = list(patterns)
+        self._goto = [{}]     # state -> {char: next state}
+        self._fail = [0]      # state -> failure state
+        self._output = [[]]   # state -> indices of patterns ending here
+
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(index)
+
+        # Breadth-first pass to compute failure links
+        order = []
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            order.append(state)
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+        # Fold the failure links into a deterministic transition table so the scan
+        # does exactly one dict lookup per character. Characters missing from a
+        # state's table lead back to the root.
+        self._delta = [dict(self._goto[0])]
+        self._delta.extend({} for _ in range(len(self._goto) - 1))
+        for state in order:
+            transitions = dict(self._delta[self._fail[state]])
+            transitions.update(self._goto[state])
+            self._delta[state] = transitions
+
+    def iter_matches(self, text: str) -> Iterator[tuple[int, int]]:
+        """
+        Yields (pattern index, end offset) for every occurrence in `text`.
+        """
+        delta, output = self._delta, self._output
+        state = 0
+        for position, char in enumerate(text):
+            state = delta[state].get(char, 0)
+            if output[state]:
+                for index in output[state]:
+                    yield index, position + 1
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == '_'
+
+def normalize_text(text: str) -> str:
+    """
+    Lowercases text and folds typographic apostrophes so "can’t" matches "can't".
+    """
+    return text.lower().replace('’', "'")
+
+class CrisisKeywordMatcher:
+    """
+    Finds crisis keywords that start at a word boundary, so "pills" matches
+    "took some pills" but not "spills".
+
+    The end of a keyword isn't checked, so inflected forms still match like
+    they did with the plain substring scan: "jump" matches "jumping",
+    "overdose" matches "overdosed" and "hopeless" matches "hopelessness".
+    Missing a crisis message costs far more than a false alarm.
+    """
+
+    def __init__(self, keywords: List[str] = CRISIS_KEYWORDS):
+        self.keywords = [normalize_text(keyword) for keyword in keywords]
+        self._automaton = AhoCorasick(self.keywords)
+
+    def find(self, text: str) -> List[KeywordMatch]:
+        """
+        Returns every crisis keyword occurring in the text, with its position.
+
+        Args:
+            text (str): The message text to analyze
+
+        Returns:
+            list[KeywordMatch]: Matches ordered by end position
+        """
+        if not text or not isinstance(text, str):
+            return []
+
+        text = normalize_text(text)
+        matches = []
+        for index, end in self._automaton.iter_matches(text):
+            keyword = self.keywords[index]
+            start = end - len(keyword)
+            if start > 0 and _is_word_char(text[start - 1]):
+                continue
+            matches.append(KeywordMatch(keyword=keyword, start=start, end=end))
+        return matches
+
+    def matches(self, text: str) -> bool:
+        return bool(self.find(text))
+
+_INTENT_RE = re.compile(r"(?<!\w)(?:" + "|".join(re.escape(phrase) for phrase in INTENT_PHRASES) + r")(?!\w)")
+
+def has_intent_context(text: str, match: KeywordMatch) -> bool:
+    """
+    Whether intent or first-person phrasing appears around a keyword match.
+
+    Args:
+        text (str): The message text the match was found in
+        match (KeywordMatch): A match returned by CrisisKeywordMatcher.find
+    """
+    text = normalize_text(text)
+    window = text[max(0, match.start - INTENT_WINDOW_CHARS):match.end + INTENT_WINDOW_CHARS // 2]
+    return _INTENT_RE.search(window) is not None
+
+# Compiled once at import time and shared by every request
+crisis_keyword_matcher = CrisisKeywordMatcher()
+
+def find_crisis_keywords(text: str) -> List[KeywordMatch]:
+    return crisis_keyword_matcher.find(text)
@@ -0,0 +1,146 @@
+import os
+import threading
+import queue
+import time
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Optional
+
+from emotion_detector import analyze_texts, mood_from_probabilities, EMOTION_MAX_CHARS
+
+# Batching parameters (overridable via environment variables)
+EMOTION_BATCH_MAX_SIZE = int(os.getenv("EMOTION_BATCH_MAX_SIZE", "16"))
+EMOTION_BATCH_MAX_WAIT_MS = float(os.getenv("EMOTION_BATCH_MAX_WAIT_MS", "10"))
+EMOTION_BATCH_TIMEOUT_S = float(os.getenv("EMOTION_BATCH_TIMEOUT_S", "30"))
+
+class EmotionBatcher:
+    """
+    Groups concurrent emotion detection requests into micro-batches.
+
+    Request threads submit texts to a queue and receive a Future. A single
+    background thread collects up to `max_batch_size` texts, waiting at most
+    `max_wait_ms` after the first one arrives, runs them through
+    `analyze_texts` in one forward pass and resolves every Future with the
+    text's emotion distribution.
+    """
+
+    def __init__(self, max_batch_size: int = EMOTION_BATCH_MAX_SIZE,
+                 max_wait_ms: float = EMOTION_BATCH_MAX_WAIT_MS):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.stats = {
+            'requests': 0,
+            'batches': 0,
+            'max_batch_size_seen': 0
+        }
+
+    def _ensure_started(self):
+        """Start the batching thread lazily (after any gunicorn fork)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name="emotion-batcher",
+                    daemon=True
+                )
+                self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        """
+        Queues a text for classification.
+
+        Args:
+            text (str): Non-empty text to analyze
+
+        Returns:
+            Future: Resolves to the emotion distribution ({label: probability})
+        """
+        future = Future()
+        self._ensure_started()
+        self._queue.put((text, future))
+        return future
+
+    def _collect_batch(self) -> list:
+        """Blocks for the first item, then gathers more until full or the wait expires."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            texts = [text[:EMOTION_MAX_CHARS] for text, _ in batch]
+            try:
+                results = analyze_texts(texts)
+            except Exception as e:
+                print(f"Error in batched emotion detection: {str(e)}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.stats['requests'] += len(batch)
+            self.stats['batches'] += 1
+            self.stats['max_batch_size_seen'] = max(self.stats['max_batch_size_seen'], len(batch))
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+@lru_cache(maxsize=1)
+def get_emotion_batcher() -> EmotionBatcher:
+    """
+    Creates and caches the process-wide emotion batcher.
+    """
+    return EmotionBatcher()
+
+def detect_emotion(text: str, timeout: Optional[float] = EMOTION_BATCH_TIMEOUT_S) -> str:
+    """
+    Detects the primary emotion in the given text through the micro-batching engine.
+
+    Args:
+        text (str): The text to analyze
+        timeout (float, optional): Seconds to wait for the batch result
+
+    Returns:
+        str: The detected mood (mapped from the emotion)
+    """
+    # Empty or non-string input never needs the model
+    if not text or not isinstance(text, str):
+        return 'neutral'
+
+    result = analyze_emotion(text, timeout=timeout)
+    return mood_from_probabilities(result) if result else 'neutral'
+
+def analyze_emotion(text: str, timeout: Optional[float] = EMOTION_BATCH_TIMEOUT_S) -> Optional[dict]:
+    """
+    Computes the full emotion distribution through the micro-batching engine.
+
+    Args:
+        text (str): The text to analyze
+        timeout (float, optional): Seconds to wait for the batch result
+
+    Returns:
+        dict: {label: probability}, or None for empty input or on error
+    """
+    if not text or not isinstance(text, str):
+        return None
+
+    try:
+        return get_emotion_batcher().submit(text).result(timeout=timeout)
+    except Exception as e:
+        print(f"Error waiting for batched emotion analysis: {str(e)}")
+        return None
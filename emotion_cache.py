@@ -0,0 +1,157 @@
+import os
+import re
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+# Cache parameters (overridable via environment variables)
+EMOTION_CACHE_SIZE = int(os.getenv("EMOTION_CACHE_SIZE", "4096"))
+EMOTION_CACHE_TTL_S = float(os.getenv("EMOTION_CACHE_TTL_S", str(24 * 60 * 60)))
+
+# Optional SQLite file shared by all gunicorn workers on the same machine
+EMOTION_CACHE_DB = os.getenv("EMOTION_CACHE_DB", "")
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+def cache_key(text: str) -> str:
+    """
+    Builds a content-addressed key from the normalized text.
+
+    Only whitespace is normalized: the emotion model is cased, so "I'm FINE"
+    and "i'm fine" can score differently and must not share an entry.
+
+    Args:
+        text (str): The (already truncated) text that will be classified
+
+    Returns:
+        str: SHA-256 hex digest of the whitespace-collapsed text
+    """
+    normalized = _WHITESPACE_RE.sub(' ', text.strip())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+class EmotionCache:
+    """
+    Bounded LRU cache with TTL for emotion distributions ({label: probability}).
+
+    Entries live in an in-process OrderedDict. When `db_path` is given, misses
+    also consult a shared SQLite table so workers can reuse each other's results.
+    """
+
+    def __init__(self, maxsize: int = EMOTION_CACHE_SIZE, ttl: float = EMOTION_CACHE_TTL_S,
+                 db_path: str = EMOTION_CACHE_DB):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.db_path = db_path
+        self._entries = OrderedDict()  # key -> (result, expires_at)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {
+            'hits': 0,
+            'shared_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0
+        }
+        if db_path:
+            self._get_db()
+
+    def _get_db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS emotion_results ('
+                'key TEXT PRIMARY KEY, result TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+            self._local.conn = conn
+        return conn
+
+    def _get_shared(self, key: str, now: float) -> Optional[tuple]:
+        """Returns (result, expires_at) from the shared store, or None"""
+        try:
+            row = self._get_db().execute(
+                'SELECT result, expires_at FROM emotion_results WHERE key = ? AND expires_at > ?',
+                (key, now)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading shared emotion cache: {str(e)}")
+            return None
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def _put_shared(self, items: list[tuple[str, dict]], expires_at: float):
+        try:
+            conn = self._get_db()
+            with conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO emotion_results (key, result, expires_at) VALUES (?, ?, ?)',
+                    [(key, json.dumps(result), expires_at) for key, result in items]
+                )
+                conn.execute('DELETE FROM emotion_results WHERE expires_at <= ?', (time.time(),))
+        except sqlite3.Error as e:
+            print(f"Error writing shared emotion cache: {str(e)}")
+
+    def _store_local(self, key: str, result: dict, expires_at: float):
+        # Caller holds self._lock
+        self._entries[key] = (result, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Returns the cached emotion distribution for a key, or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                result, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return result
+                del self._entries[key]
+                self.stats['expirations'] += 1
+
+        if self.db_path:
+            shared = self._get_shared(key, now)
+            if shared is not None:
+                result, expires_at = shared
+                with self._lock:
+                    # Keep the original expiry so a hit never extends a result's lifetime
+                    self._store_local(key, result, expires_at)
+                    self.stats['shared_hits'] += 1
+                return result
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def put_many(self, items: list[tuple[str, dict]]):
+        """
+        Stores (key, emotion distribution) pairs in the local cache and the shared store.
+        """
+        if not items:
+            return
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            for key, result in items:
+                self._store_local(key, result, expires_at)
+        if self.db_path:
+            self._put_shared(items, expires_at)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['shared_hits']) / lookups if lookups else 0.0
+        return stats
+
+emotion_cache = EmotionCache()
@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+from multiprocessing.connection import Client
+from typing import Optional
+
+# Location of the shared emotion inference service (see emotion_server.py).
+# Leave EMOTION_SERVER_SOCKET unset to always classify in-process.
+EMOTION_SERVER_SOCKET = os.getenv("EMOTION_SERVER_SOCKET", "")
+
+# Shared secret of the service and its clients; messages are pickled, so there
+# is no default and the service is not used without one
+EMOTION_SERVER_AUTHKEY = os.getenv("EMOTION_SERVER_AUTHKEY", "").encode()
+
+# After a failed connection, skip the service for this many seconds
+EMOTION_SERVER_RETRY_AFTER_S = float(os.getenv("EMOTION_SERVER_RETRY_AFTER_S", "30"))
+
+class EmotionServiceClient:
+    """
+    Thin client for the out-of-process emotion inference service.
+
+    Each request thread keeps its own persistent connection to the service's
+    Unix socket. When the service is unreachable the client backs off for a
+    while so callers can fall back to local inference without paying a
+    connection attempt on every message.
+    """
+
+    def __init__(self, address: str, authkey: bytes = EMOTION_SERVER_AUTHKEY):
+        self.address = address
+        self.authkey = authkey
+        self._local = threading.local()
+        self._unavailable_until = 0.0
+
+    def _get_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = Client(self.address, family='AF_UNIX', authkey=self.authkey)
+            self._local.conn = conn
+        return conn
+
+    def _drop_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def analyze(self, texts: list[str]) -> Optional[list[dict]]:
+        """
+        Sends texts to the inference service.
+
+        Args:
+            texts (list[str]): Non-empty texts
+
+        Returns:
+            list[dict]: Emotion distributions ({label: probability}) aligned
+            with `texts`, or None if the service is unavailable
+        """
+        if time.monotonic() < self._unavailable_until:
+            return None
+
+        try:
+            conn = self._get_connection()
+            conn.send({'texts': texts})
+            reply = conn.recv()
+        except Exception as e:
+            print(f"Emotion service unavailable, using local model: {str(e)}")
+            self._drop_connection()
+            self._unavailable_until = time.monotonic() + EMOTION_SERVER_RETRY_AFTER_S
+            return None
+
+        if 'error' in reply:
+            print(f"Emotion service error: {reply['error']}")
+            return None
+
+        return reply['results']
+
+_client = None
+if EMOTION_SERVER_SOCKET:
+    if EMOTION_SERVER_AUTHKEY:
+        _client = EmotionServiceClient(EMOTION_SERVER_SOCKET)
+    else:
+        print("EMOTION_SERVER_SOCKET is set but EMOTION_SERVER_AUTHKEY is not, using local model")
+
+def analyze_remotely(texts: list[str]) -> Optional[list[dict]]:
+    """
+    Analyzes texts through the shared inference service if one is configured.
+
+    Returns:
+        list[dict]: Emotion distributions, or None when the caller should use the local model
+    """
+    if _client is None:
+        return None
+    return _client.analyze(texts)
@@ -1,6 +1,39 @@
-from transformers import pipeline
+import os
+import time
+import argparse
+import threading
+from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
 from functools import lru_cache
+import numpy as np
 import torch
+from typing import Optional
+from emotion_client import analyze_remotely
+from emotion_cache import emotion_cache, cache_key
+
+EMOTION_MODEL_NAME = "j-hartmann/emotion-english-distilroberta-base"
+
+# Inference backend: 'pytorch' (full precision), 'quantized' (dynamic int8)
+# or 'onnx' (exported graph run through onnxruntime, needs `optimum[onnxruntime]`)
+EMOTION_BACKENDS = ('pytorch', 'quantized', 'onnx')
+EMOTION_BACKEND = os.getenv("EMOTION_BACKEND", "pytorch").lower()
+
+# Where the exported ONNX graph is cached so it is only exported once
+EMOTION_ONNX_PATH = os.getenv("EMOTION_ONNX_PATH", os.path.join("models", "emotion-onnx"))
+
+# Long message handling: 'window' classifies overlapping token windows and pools
+# their logits, 'truncate' keeps only the first window
+EMOTION_LONG_TEXT_MODE = os.getenv("EMOTION_LONG_TEXT_MODE", "window").lower()
+EMOTION_MAX_TOKENS = int(os.getenv("EMOTION_MAX_TOKENS", "512"))
+EMOTION_WINDOW_STRIDE = int(os.getenv("EMOTION_WINDOW_STRIDE", "64"))
+EMOTION_MAX_WINDOWS = int(os.getenv("EMOTION_MAX_WINDOWS", "8"))
+
+# Texts per forward pass in the bulk API; texts are sorted by length first so
+# each batch pads to a similar length
+EMOTION_BULK_BATCH_SIZE = int(os.getenv("EMOTION_BULK_BATCH_SIZE", "32"))
+
+# Hard character cap applied before tokenization so huge inputs can't make the
+# tokenizer do unbounded work (generous: tokens average ~4 characters)
+EMOTION_MAX_CHARS = EMOTION_MAX_TOKENS * (EMOTION_MAX_WINDOWS if EMOTION_LONG_TEXT_MODE == 'window' else 1) * 8
 
 # Map HuggingFace emotions to our mood categories
 EMOTION_TO_MOOD = {
@@ -13,18 +46,261 @@ EMOTION_TO_MOOD = {
     'disgust': 'angry'
 }
 
-@lru_cache(maxsize=1)
-def get_emotion_pipeline():
+# Sample messages covering every label in EMOTION_TO_MOOD, used for parity checks
+PARITY_SAMPLE_TEXTS = [
+    "I got the job! I can't stop smiling today.",
+    "Spending the afternoon with my family made me so happy.",
+    "Wait, they're moving the whole office to another city?",
+    "I had no idea she was coming back this week, what a shock.",
+    "I went to the store and then came home.",
+    "The meeting is scheduled for Tuesday at 3pm.",
+    "I'm terrified that something bad is going to happen tonight.",
+    "My heart keeps racing and I'm scared of the exam results.",
+    "I miss my grandmother so much since she passed away.",
+    "Nothing feels worth it anymore and I cry every night.",
+    "I'm so furious that my roommate lied to me again.",
+    "Stop interrupting me, it makes me really angry.",
+    "That food smelled rotten and it was absolutely revolting.",
+    "The way he treats people is disgusting."
+]
+
+def _load_model(backend: str):
+    """
+    Loads the tokenizer and model for the requested backend.
+    """
+    tokenizer = AutoTokenizer.from_pretrained(EMOTION_MODEL_NAME)
+
+    if backend == 'onnx':
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+
+        if os.path.isdir(EMOTION_ONNX_PATH):
+            model = ORTModelForSequenceClassification.from_pretrained(EMOTION_ONNX_PATH)
+        else:
+            model = ORTModelForSequenceClassification.from_pretrained(EMOTION_MODEL_NAME, export=True)
+            model.save_pretrained(EMOTION_ONNX_PATH)
+            print(f"Exported emotion model to ONNX at {EMOTION_ONNX_PATH}")
+        return tokenizer, model
+
+    model = AutoModelForSequenceClassification.from_pretrained(EMOTION_MODEL_NAME)
+    model.eval()
+    if backend == 'quantized':
+        # Dynamic int8 quantization of the linear layers (weights quantized ahead
+        # of time, activations at runtime) - the bulk of DistilRoBERTa's compute
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return tokenizer, model
+
+# Set once the local model has loaded and served its first batch in this process
+_model_ready = threading.Event()
+
+# Set while the shared inference service is answering for this process
+_remote_ready = threading.Event()
+
+@lru_cache(maxsize=None)
+def get_emotion_pipeline(backend: str = EMOTION_BACKEND):
     """
     Creates and caches the emotion detection pipeline.
-    Uses LRU cache to ensure we only load the model once.
+    Uses LRU cache to ensure we only load the model once per backend.
+    
+    Args:
+        backend (str): One of EMOTION_BACKENDS, defaults to EMOTION_BACKEND
     """
+    if backend not in EMOTION_BACKENDS:
+        print(f"Unknown emotion backend '{backend}', using pytorch")
+        backend = 'pytorch'
+
+    try:
+        tokenizer, model = _load_model(backend)
+    except ImportError as e:
+        print(f"Emotion backend '{backend}' unavailable ({str(e)}), using pytorch")
+        backend = 'pytorch'
+        tokenizer, model = _load_model(backend)
+
+    print(f"Emotion model loaded with {backend} backend")
     return pipeline(
         "text-classification",
-        model="j-hartmann/emotion-english-distilroberta-base",
+        model=model,
+        tokenizer=tokenizer,
         top_k=1
     )
 
+def _window_logits(texts: list[str], backend: str = EMOTION_BACKEND) -> torch.Tensor:
+    """
+    Tokenizes texts into token windows and returns one pooled logit row per text.
+    
+    Text is cut on token boundaries by the tokenizer. In 'window' mode a long
+    text is split into overlapping windows of EMOTION_MAX_TOKENS tokens (at most
+    EMOTION_MAX_WINDOWS of them), all windows of the batch run through a single
+    forward pass, and each text's window logits are averaged.
+    """
+    classifier = get_emotion_pipeline(backend)
+    tokenizer, model = classifier.tokenizer, classifier.model
+    windowed = EMOTION_LONG_TEXT_MODE == 'window'
+
+    encoded = tokenizer(
+        texts,
+        truncation=True,
+        max_length=EMOTION_MAX_TOKENS,
+        stride=EMOTION_WINDOW_STRIDE if windowed else 0,
+        return_overflowing_tokens=windowed,
+        padding=True,
+        return_tensors='pt'
+    )
+
+    sample_map = encoded.pop('overflow_to_sample_mapping', None)
+    if sample_map is None:
+        sample_map = torch.arange(len(texts))
+
+    # Drop windows beyond the per-text limit to keep the cost of long texts bounded
+    window_index = torch.zeros_like(sample_map)
+    for i in range(1, len(sample_map)):
+        if sample_map[i] == sample_map[i - 1]:
+            window_index[i] = window_index[i - 1] + 1
+    keep = window_index < EMOTION_MAX_WINDOWS
+    if not bool(keep.all()):
+        encoded = {name: tensor[keep] for name, tensor in encoded.items()}
+        sample_map = sample_map[keep]
+
+    with torch.no_grad():
+        window_logits = model(**encoded).logits
+
+    # Mean-pool the window logits of each text
+    pooled = torch.zeros(len(texts), window_logits.shape[-1], dtype=window_logits.dtype)
+    pooled.index_add_(0, sample_map, window_logits)
+    counts = torch.bincount(sample_map, minlength=len(texts)).clamp(min=1)
+    return pooled / counts.unsqueeze(-1).to(pooled.dtype)
+
+def get_emotion_labels(backend: str = EMOTION_BACKEND) -> list[str]:
+    """
+    Returns the model's emotion labels in logit order (the columns of the
+    probability arrays returned by `batch_analyze_emotions`).
+    """
+    id2label = get_emotion_pipeline(backend).model.config.id2label
+    return [id2label[i] for i in range(len(id2label))]
+
+def _bucketed_probabilities(texts: list[str], batch_size: int = EMOTION_BULK_BATCH_SIZE,
+                            backend: str = EMOTION_BACKEND) -> np.ndarray:
+    """
+    Computes emotion probabilities, grouping texts of similar length into the
+    same forward pass so little attention compute is spent on padding.
+    
+    Returns:
+        np.ndarray: Array of shape (len(texts), len(labels)) aligned with `texts`
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    probabilities = np.zeros((len(texts), len(get_emotion_labels(backend))), dtype=np.float32)
+
+    for start in range(0, len(order), batch_size):
+        bucket = order[start:start + batch_size]
+        logits = _window_logits([texts[i] for i in bucket], backend)
+        probabilities[bucket] = torch.softmax(logits.float(), dim=-1).numpy()
+
+    return probabilities
+
+def _moods_from_probabilities(probabilities: np.ndarray) -> list[str]:
+    labels = get_emotion_labels()
+    return [
+        EMOTION_TO_MOOD.get(labels[label_id], 'neutral')
+        for label_id in probabilities.argmax(axis=1)
+    ]
+
+def mood_from_probabilities(probabilities: dict) -> str:
+    """
+    Maps an emotion distribution ({label: probability}) to our mood categories.
+    """
+    emotion = max(probabilities, key=probabilities.get)
+    return EMOTION_TO_MOOD.get(emotion, 'neutral')
+
+def analyze_locally(texts: list[str], backend: str = EMOTION_BACKEND) -> list[dict]:
+    """
+    Runs the in-process model on a list of texts.
+    
+    Args:
+        texts (list[str]): Non-empty texts
+        backend (str): One of EMOTION_BACKENDS, defaults to EMOTION_BACKEND
+        
+    Returns:
+        list[dict]: Emotion distribution ({label: probability}) per text
+    """
+    labels = get_emotion_labels(backend)
+    results = [
+        {label: float(probability) for label, probability in zip(labels, row)}
+        for row in _bucketed_probabilities(texts, backend=backend)
+    ]
+    if backend == EMOTION_BACKEND:
+        _model_ready.set()
+    return results
+
+def _analyze_remotely(texts: list[str]) -> Optional[list[dict]]:
+    """
+    analyze_remotely, recording whether the shared inference service answered.
+    """
+    results = analyze_remotely(texts)
+    if results is None:
+        _remote_ready.clear()
+    else:
+        _remote_ready.set()
+    return results
+
+def analyze_texts(texts: list[str]) -> list[dict]:
+    """
+    Computes emotion distributions, serving repeated messages from the result cache.
+    Only cache misses are sent to the shared inference service when configured,
+    falling back to the in-process model.
+    
+    Args:
+        texts (list[str]): Non-empty texts
+        
+    Returns:
+        list[dict]: Emotion distribution ({label: probability}) per text
+    """
+    keys = [cache_key(text) for text in texts]
+    results = [emotion_cache.get(key) for key in keys]
+
+    miss_indices = [i for i, result in enumerate(results) if result is None]
+    if not miss_indices:
+        return results
+
+    # Identical texts within one batch only need a single forward pass
+    unique_misses = {}
+    for i in miss_indices:
+        unique_misses.setdefault(keys[i], texts[i])
+    miss_keys = list(unique_misses)
+    miss_texts = list(unique_misses.values())
+
+    miss_results = _analyze_remotely(miss_texts)
+    if miss_results is None:
+        miss_results = analyze_locally(miss_texts)
+
+    emotion_cache.put_many(list(zip(miss_keys, miss_results)))
+    fresh = dict(zip(miss_keys, miss_results))
+    for i in miss_indices:
+        results[i] = fresh[keys[i]]
+    return results
+
+def classify_texts(texts: list[str]) -> list[str]:
+    """
+    Classifies texts into mood categories (see `analyze_texts`).
+    """
+    return [mood_from_probabilities(result) for result in analyze_texts(texts)]
+
+def analyze_emotion(text: str) -> Optional[dict]:
+    """
+    Computes the full emotion distribution for a single text.
+    
+    Args:
+        text (str): The text to analyze
+        
+    Returns:
+        dict: {label: probability}, or None for empty input or on error
+    """
+    try:
+        if not text or not isinstance(text, str):
+            return None
+        return analyze_texts([text[:EMOTION_MAX_CHARS]])[0]
+    except Exception as e:
+        print(f"Error in emotion analysis: {str(e)}")
+        return None
+
 def detect_emotion(text: str) -> str:
     """
     Detects the primary emotion in the given text using the Hugging Face model.
@@ -36,26 +312,15 @@ def detect_emotion(text: str) -> str:
         str: The detected mood (mapped from the emotion)
     """
     try:
-        # Get the emotion pipeline
-        classifier = get_emotion_pipeline()
-        
         # Ensure text is not empty and is a string
         if not text or not isinstance(text, str):
             return 'neutral'
             
-        # Truncate text if it's too long (model has a token limit)
-        text = text[:512]
-        
-        # Get emotion prediction
-        result = classifier(text)
-        
-        # Extract the top emotion
-        emotion = result[0][0]['label']
-        
-        # Map the emotion to our mood categories
-        mood = EMOTION_TO_MOOD.get(emotion, 'neutral')
+        # Cap pathological lengths; token-level truncation happens in the tokenizer
+        text = text[:EMOTION_MAX_CHARS]
         
-        return mood
+        # Get emotion prediction mapped to our mood categories
+        return classify_texts([text])[0]
         
     except Exception as e:
         print(f"Error in emotion detection: {str(e)}")
@@ -69,29 +334,148 @@ def batch_detect_emotions(texts: list[str]) -> list[str]:
         texts (list[str]): List of texts to analyze
         
     Returns:
-        list[str]: List of detected moods
+        list[str]: List of detected moods, aligned with `texts` (empty or
+        non-string inputs map to 'neutral')
     """
+    moods = ['neutral'] * len(texts)
     try:
-        # Get the emotion pipeline
-        classifier = get_emotion_pipeline()
+        # Skip empty texts and cap pathological lengths, remembering positions
+        valid_indices = [i for i, text in enumerate(texts) if text and isinstance(text, str)]
         
-        # Filter out empty texts and truncate long ones
-        valid_texts = [text[:512] for text in texts if text and isinstance(text, str)]
+        if not valid_indices:
+            return moods
         
-        if not valid_texts:
-            return ['neutral'] * len(texts)
-        
-        # Get predictions for all texts
-        results = classifier(valid_texts)
-        
-        # Map emotions to moods
-        moods = [
-            EMOTION_TO_MOOD.get(result[0]['label'], 'neutral')
-            for result in results
-        ]
+        # Get predictions for all valid texts, mapped to moods
+        valid_moods = classify_texts([texts[i][:EMOTION_MAX_CHARS] for i in valid_indices])
+        for i, mood in zip(valid_indices, valid_moods):
+            moods[i] = mood
         
         return moods
         
     except Exception as e:
         print(f"Error in batch emotion detection: {str(e)}")
-        return ['neutral'] * len(texts)  # Default to neutral on error 
\ No newline at end of file
+        return ['neutral'] * len(texts)  # Default to neutral on error
+
+def batch_analyze_emotions(texts: list, batch_size: int = EMOTION_BULK_BATCH_SIZE) -> tuple[list[str], np.ndarray]:
+    """
+    Bulk entry point for re-scoring large message histories with the local model.
+    
+    Texts are sorted into length buckets of `batch_size` so each forward pass
+    pads to a similar length. Results stay aligned with the input; empty or
+    non-string inputs are reported as 'neutral' with all probability on the
+    neutral label.
+    
+    Args:
+        texts (list): Texts to analyze
+        batch_size (int): Texts per forward pass
+        
+    Returns:
+        tuple: (moods, probabilities) where moods is a list of mapped moods and
+        probabilities is a float32 array of shape (len(texts), len(labels)) with
+        columns ordered as `get_emotion_labels()`
+    """
+    labels = get_emotion_labels()
+    moods = ['neutral'] * len(texts)
+    probabilities = np.zeros((len(texts), len(labels)), dtype=np.float32)
+
+    valid_indices = [i for i, text in enumerate(texts) if text and isinstance(text, str)]
+    invalid_indices = [i for i, text in enumerate(texts) if not (text and isinstance(text, str))]
+    if invalid_indices and 'neutral' in labels:
+        probabilities[invalid_indices, labels.index('neutral')] = 1.0
+
+    if valid_indices:
+        valid_probabilities = _bucketed_probabilities(
+            [texts[i][:EMOTION_MAX_CHARS] for i in valid_indices],
+            batch_size=batch_size
+        )
+        probabilities[valid_indices] = valid_probabilities
+        for i, mood in zip(valid_indices, _moods_from_probabilities(valid_probabilities)):
+            moods[i] = mood
+
+    return moods, probabilities
+
+def warm_up_emotion_model() -> bool:
+    """
+    Loads the emotion model and runs dummy inputs through it so the first real
+    request doesn't pay for weight loading and first-call allocations.
+    
+    The shared inference service is tried as well when it is configured, but
+    the local model is always loaded: it is what requests fall back to when
+    the service stops answering.
+    
+    Returns:
+        bool: True if the local model is ready to serve requests
+    """
+    started_at = time.monotonic()
+    # A short message and one long enough to exercise the sliding-window path
+    warmup_texts = ["I'm fine, thanks.", " ".join(PARITY_SAMPLE_TEXTS) * 8]
+
+    _analyze_remotely(warmup_texts)
+    try:
+        analyze_locally(warmup_texts)
+    except Exception as e:
+        print(f"Error warming up emotion model: {str(e)}")
+        return False
+
+    print(f"Emotion model warmed up in {time.monotonic() - started_at:.1f}s")
+    return True
+
+def is_emotion_model_ready() -> bool:
+    """Whether the local model has loaded in this process"""
+    return _model_ready.is_set()
+
+def is_emotion_service_ready() -> bool:
+    """Whether the shared inference service answered this process's last request"""
+    return _remote_ready.is_set()
+
+def check_backend_parity(backend: str, texts: list[str] = PARITY_SAMPLE_TEXTS) -> dict:
+    """
+    Compares a backend's predictions against the full-precision PyTorch model.
+    Both run through analyze_locally, so long texts take the same token-window
+    path as production requests.
+    
+    Args:
+        backend (str): The backend to check
+        texts (list[str]): Sample texts to classify with both backends
+        
+    Returns:
+        dict: Label agreement rate, mood agreement rate, mismatching samples and
+        any model labels that EMOTION_TO_MOOD does not map
+    """
+    candidate_labels = set(get_emotion_labels(backend))
+    reference_labels = [max(result, key=result.get) for result in analyze_locally(texts, 'pytorch')]
+    labels = [max(result, key=result.get) for result in analyze_locally(texts, backend)]
+
+    mismatches = []
+    mood_matches = 0
+    for text, expected, actual in zip(texts, reference_labels, labels):
+        if EMOTION_TO_MOOD.get(expected, 'neutral') == EMOTION_TO_MOOD.get(actual, 'neutral'):
+            mood_matches += 1
+        if expected != actual:
+            mismatches.append({'text': text, 'expected': expected, 'actual': actual})
+
+    return {
+        'backend': backend,
+        'samples': len(texts),
+        'label_agreement': (len(texts) - len(mismatches)) / len(texts),
+        'mood_agreement': mood_matches / len(texts),
+        'mismatches': mismatches,
+        'unmapped_labels': sorted(candidate_labels - set(EMOTION_TO_MOOD))
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Emotion detector utilities")
+    parser.add_argument('--parity', choices=EMOTION_BACKENDS, help="Check a backend against the PyTorch model")
+    args = parser.parse_args()
+
+    if args.parity:
+        report = check_backend_parity(args.parity)
+        print(f"Backend: {report['backend']} ({report['samples']} samples)")
+        print(f"Label agreement: {report['label_agreement']:.1%}")
+        print(f"Mood agreement: {report['mood_agreement']:.1%}")
+        for mismatch in report['mismatches']:
+            print(f"  {mismatch['expected']} -> {mismatch['actual']}: {mismatch['text']}")
+        if report['unmapped_labels']:
+            print(f"Labels missing from EMOTION_TO_MOOD: {', '.join(report['unmapped_labels'])}")
+    else:
+        parser.print_help()
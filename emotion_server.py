@@ -0,0 +1,137 @@
+"""
+Shared emotion inference service.
+
+Owns a fixed number of model replicas, each in its own process pinned to a
+CPU core, and serves classification jobs from every Flask worker over a Unix
+socket. Run it next to gunicorn and point the workers at it, with the same
+secret (e.g. from `python -c "import secrets; print(secrets.token_hex(32))"`):
+
+    export EMOTION_SERVER_AUTHKEY=<secret>
+    EMOTION_SERVER_SOCKET=/run/ai-therapist/emotion.sock python emotion_server.py
+    EMOTION_SERVER_SOCKET=/run/ai-therapist/emotion.sock gunicorn app:app
+
+The socket's directory is created private to the service's user (0700), so
+the workers must run as that user. Workers fall back to their own in-process
+model if the service is down.
+"""
+import os
+import stat
+import threading
+import multiprocessing
+from multiprocessing.connection import Listener
+
+from emotion_client import EMOTION_SERVER_AUTHKEY
+
+EMOTION_SERVER_SOCKET = os.getenv("EMOTION_SERVER_SOCKET", "/run/ai-therapist/emotion.sock")
+EMOTION_SERVER_REPLICAS = int(os.getenv("EMOTION_SERVER_REPLICAS", "2"))
+
+def _init_replica(core_counter):
+    """
+    Pins this replica process to its own core and loads the model once.
+    """
+    with core_counter.get_lock():
+        replica_index = core_counter.value
+        core_counter.value += 1
+
+    try:
+        cores = sorted(os.sched_getaffinity(0))
+        core = cores[replica_index % len(cores)]
+        os.sched_setaffinity(0, {core})
+    except (AttributeError, OSError) as e:
+        # sched_setaffinity is Linux-only
+        core = None
+        print(f"Could not pin emotion replica {replica_index}: {str(e)}")
+
+    import torch
+    from emotion_detector import get_emotion_pipeline
+
+    # One replica per core, so each one runs single-threaded
+    torch.set_num_threads(1)
+    get_emotion_pipeline()
+    print(f"Emotion replica {replica_index} ready (pid {os.getpid()}, core {core})")
+
+def _analyze(texts):
+    from emotion_detector import analyze_locally
+    return analyze_locally(texts)
+
+def _serve_connection(conn, pool):
+    """
+    Answers classification jobs from one Flask worker thread until it disconnects.
+    """
+    with conn:
+        while True:
+            try:
+                request = conn.recv()
+            except (EOFError, OSError):
+                # Closed or reset by the client
+                return
+
+            try:
+                reply = {'results': pool.apply(_analyze, (request['texts'],))}
+            except Exception as e:
+                print(f"Error classifying batch: {str(e)}")
+                reply = {'error': str(e)}
+
+            try:
+                conn.send(reply)
+            except OSError:
+                return
+
+def _private_socket_dir(address: str):
+    """
+    Creates the socket's directory readable only by this user, or checks that an existing one is.
+
+    Raises:
+        RuntimeError: The directory belongs to another user or isn't a directory
+    """
+    directory = os.path.dirname(os.path.abspath(address))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise RuntimeError(f"Socket directory {directory} must be a directory owned by this user")
+    if stat.S_IMODE(info.st_mode) != 0o700:
+        os.chmod(directory, 0o700)
+
+def serve(address: str = EMOTION_SERVER_SOCKET, replicas: int = EMOTION_SERVER_REPLICAS):
+    """
+    Starts the replica pool and accepts client connections forever.
+
+    Args:
+        address (str): Path of the Unix socket to listen on
+        replicas (int): Number of model replica processes
+
+    Raises:
+        RuntimeError: EMOTION_SERVER_AUTHKEY is not set, or the socket directory isn't private
+    """
+    if not EMOTION_SERVER_AUTHKEY:
+        raise RuntimeError("EMOTION_SERVER_AUTHKEY must be set to a secret shared with the workers")
+    _private_socket_dir(address)
+    if os.path.exists(address):
+        os.remove(address)
+
+    core_counter = multiprocessing.Value('i', 0)
+    pool = multiprocessing.Pool(
+        processes=replicas,
+        initializer=_init_replica,
+        initargs=(core_counter,)
+    )
+
+    print(f"Emotion service listening on {address} with {replicas} replicas")
+    with Listener(address, family='AF_UNIX', authkey=EMOTION_SERVER_AUTHKEY) as listener:
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    print(f"Error accepting emotion client: {str(e)}")
+                    continue
+                threading.Thread(
+                    target=_serve_connection,
+                    args=(conn, pool),
+                    daemon=True
+                ).start()
+        finally:
+            pool.terminate()
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,318 @@
+"""
+Firestore implementation of the storage repositories (see storage.py).
+
+Layout:
+    users/{user}                               profile and preferences
+    users/{user}/chats/{chat}                  chat metadata
+    users/{user}/chats/{chat}/messages/{seq}   one document per message
+    users/{user}/quotes/{quote}
+    mood_entries/{entry}
+    chat_emotions/{entry}
+"""
+import time
+from typing import Optional
+
+from firebase_admin import firestore
+
+from chat_store import (CHAT_LIST_FIELDS, MESSAGES_COLLECTION, message_id, message_preview, is_legacy_chat,
+                        chat_summary_fields)
+from storage import Storage
+
+# Firestore allows at most 500 operations per write batch
+FIRESTORE_MAX_BATCH_WRITES = 500
+
+class FirestoreUsers:
+    def __init__(self, db: firestore.Client):
+        self.db = db
+
+    def _user_ref(self, user_id: str):
+        return self.db.collection('users').document(user_id)
+
+    def get(self, user_id: str) -> Optional[dict]:
+        user_doc = self._user_ref(user_id).get()
+        return (user_doc.to_dict() or {}) if user_doc.exists else None
+
+    def create(self, user_id: str, data: dict) -> bool:
+        user_ref = self._user_ref(user_id)
+        if user_ref.get().exists:
+            return False
+        user_ref.set(data)
+        return True
+
+    def update(self, user_id: str, fields: dict):
+        self._user_ref(user_id).set(fields, merge=True)
+
+class FirestoreMoodEntries:
+    def __init__(self, db: firestore.Client):
+        self.collection = db.collection('mood_entries')
+
+    def add(self, entry: dict) -> str:
+        doc_ref = self.collection.document()
+        # Auto IDs are random; created_at orders entries from the same day
+        doc_ref.set(dict(entry, created_at=time.time()))
+        return doc_ref.id
+
+    def get(self, entry_id: str) -> Optional[dict]:
+        doc = self.collection.document(entry_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def list_for_user(self, user_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                      limit: Optional[int] = None) -> list:
+        query = self.collection.where('user_id', '==', user_id)
+        if start_date:
+            query = query.where('date', '>=', start_date)
+        if end_date:
+            query = query.where('date', '<=', end_date)
+        query = query.order_by('date', direction=firestore.Query.DESCENDING)
+
+        # Same-day entries are ordered by created_at here rather than in the
+        # query, which would skip entries written before the field existed
+        docs = [doc.to_dict() for doc in query.stream()]
+        docs.sort(key=lambda data: (data.get('date'), data.get('created_at', 0)), reverse=True)
+        return docs[:limit] if limit is not None else docs
+
+    def latest(self, user_id: str) -> Optional[dict]:
+        entries = self.list_for_user(user_id, limit=1)
+        return entries[0] if entries else None
+
+    def update(self, entry_id: str, fields: dict) -> bool:
+        doc_ref = self.collection.document(entry_id)
+        if not doc_ref.get().exists:
+            return False
+        if fields:
+            doc_ref.update(fields)
+        return True
+
+    def delete(self, entry_id: str) -> bool:
+        doc_ref = self.collection.document(entry_id)
+        if not doc_ref.get().exists:
+            return False
+        doc_ref.delete()
+        return True
+
+class FirestoreChatEmotions:
+    def __init__(self, db: firestore.Client):
+        self.collection = db.collection('chat_emotions')
+
+    def add(self, entry: dict) -> str:
+        doc_ref = self.collection.document()
+        doc_ref.set(entry)
+        return doc_ref.id
+
+class FirestoreChats:
+    """
+    A chat document holds only metadata; every message is its own document in
+    the chat's `messages` subcollection, keyed by its zero-padded position.
+
+    Chats written before that layout embed a `messages` array (see
+    chat_store.is_legacy_chat). get() returns it as is, and a legacy chat is
+    migrated the first time messages are appended to it; migrate_chats.py
+    migrates them in bulk.
+    """
+
+    def __init__(self, db: firestore.Client):
+        self.db = db
+
+    def _chats_ref(self, user_id: str):
+        return self.db.collection('users').document(user_id).collection('chats')
+
+    def _chat_ref(self, user_id: str, chat_id: str):
+        return self._chats_ref(user_id).document(chat_id)
+
+    def create(self, user_id: str, chat_data: dict, messages: list) -> str:
+        chat_ref = self._chats_ref(user_id).document()
+        batch = self.db.batch()
+        batch.set(chat_ref, chat_data)
+        for message in messages:
+            batch.set(chat_ref.collection(MESSAGES_COLLECTION).document(message_id(message['seq'])), message)
+        batch.commit()
+        return chat_ref.id
+
+    def get(self, user_id: str, chat_id: str) -> Optional[dict]:
+        chat_doc = self._chat_ref(user_id, chat_id).get()
+        return chat_doc.to_dict() if chat_doc.exists else None
+
+    def latest_messages(self, user_id: str, chat_id: str, limit: int, before: Optional[int] = None) -> list:
+        query = (self._chat_ref(user_id, chat_id).collection(MESSAGES_COLLECTION)
+                 .order_by('seq', direction=firestore.Query.DESCENDING)
+                 .limit(limit))
+        if before is not None:
+            query = query.where('seq', '<', before)
+        messages = [doc.to_dict() for doc in query.stream()]
+        messages.reverse()
+        return messages
+
+    def messages_between(self, user_id: str, chat_id: str, start: int, end: int) -> list:
+        query = (self._chat_ref(user_id, chat_id).collection(MESSAGES_COLLECTION)
+                 .where('seq', '>=', start)
+                 .where('seq', '<', end)
+                 .order_by('seq'))
+        return [doc.to_dict() for doc in query.stream()]
+
+    def find_message(self, user_id: str, chat_id: str, idempotency_key: str) -> Optional[dict]:
+        query = (self._chat_ref(user_id, chat_id).collection(MESSAGES_COLLECTION)
+                 .where('idempotency_key', '==', idempotency_key)
+                 .limit(1))
+        docs = list(query.stream())
+        return docs[0].to_dict() if docs else None
+
+    def append_messages(self, user_id: str, chat_id: str, chat_data: dict, new_messages: list,
+                        timestamp: int) -> list:
+        chat_ref = self._chat_ref(user_id, chat_id)
+        if is_legacy_chat(chat_data):
+            self.migrate(chat_ref, chat_data)
+
+        @firestore.transactional
+        def append(transaction):
+            snapshot = chat_ref.get(transaction=transaction)
+            seq = (snapshot.to_dict() or {}).get('message_count', 0)
+            stamped = [dict(message, seq=seq + i) for i, message in enumerate(new_messages)]
+            for message in stamped:
+                transaction.set(chat_ref.collection(MESSAGES_COLLECTION).document(message_id(message['seq'])), message)
+            transaction.update(chat_ref, {
+                'message_count': seq + len(stamped),
+                'last_message': message_preview(stamped[-1]),
+                'updated_at': timestamp
+            })
+            return stamped
+
+        return append(self.db.transaction())
+
+    def update(self, user_id: str, chat_id: str, fields: dict):
+        self._chat_ref(user_id, chat_id).update(fields)
+
+    def list(self, user_id: str, limit: int, after: Optional[tuple] = None) -> list:
+        chats_ref = self._chats_ref(user_id)
+        query = (chats_ref.select(CHAT_LIST_FIELDS)
+                 .order_by('updated_at', direction=firestore.Query.DESCENDING)
+                 .order_by('__name__', direction=firestore.Query.DESCENDING)
+                 .limit(limit))
+        if after:
+            query = query.start_after([after[0], chats_ref.document(str(after[1]))])
+        docs = list(query.stream())
+
+        # Legacy chats have no count or preview yet; read those few in full and derive them
+        legacy = {doc.id: doc.reference for doc in docs if is_legacy_chat(doc.to_dict())}
+        derived = {}
+        if legacy:
+            for full_doc in self.db.get_all(list(legacy.values())):
+                if full_doc.exists:
+                    derived[full_doc.id] = chat_summary_fields(full_doc.to_dict())
+
+        page = []
+        for doc in docs:
+            chat_data = derived.get(doc.id) or doc.to_dict()
+            page.append(dict({field: chat_data.get(field) for field in CHAT_LIST_FIELDS}, id=doc.id))
+        return page
+
+    def delete(self, user_id: str, chat_id: str) -> bool:
+        chat_ref = self._chat_ref(user_id, chat_id)
+        if not chat_ref.get().exists:
+            return False
+
+        # Firestore doesn't delete subcollections with their parent document
+        messages_ref = chat_ref.collection(MESSAGES_COLLECTION)
+        while True:
+            docs = list(messages_ref.limit(FIRESTORE_MAX_BATCH_WRITES).stream())
+            if not docs:
+                break
+            batch = self.db.batch()
+            for doc in docs:
+                batch.delete(doc.reference)
+            batch.commit()
+
+        chat_ref.delete()
+        return True
+
+    def migrate(self, chat_ref, chat_data: Optional[dict] = None) -> int:
+        """
+        Moves a legacy chat's embedded messages into its `messages` subcollection.
+
+        Safe to re-run: message documents are keyed by position, and the
+        embedded array is only removed once they're all written.
+
+        Returns:
+            int: The number of messages moved (0 if the chat was already migrated)
+        """
+        if chat_data is None:
+            chat_doc = chat_ref.get()
+            if not chat_doc.exists:
+                return 0
+            chat_data = chat_doc.to_dict()
+        if not is_legacy_chat(chat_data):
+            return 0
+
+        messages = [dict(message, seq=seq) for seq, message in enumerate(chat_data.get('messages', []))]
+        messages_ref = chat_ref.collection(MESSAGES_COLLECTION)
+        for start in range(0, len(messages), FIRESTORE_MAX_BATCH_WRITES):
+            batch = self.db.batch()
+            for message in messages[start:start + FIRESTORE_MAX_BATCH_WRITES]:
+                batch.set(messages_ref.document(message_id(message['seq'])), message)
+            batch.commit()
+
+        chat_ref.update({
+            'messages': firestore.DELETE_FIELD,
+            'message_count': len(messages),
+            'last_message': message_preview(messages[-1] if messages else None)
+        })
+        chat_data['messages'] = messages
+        chat_data['messages_offset'] = 0
+        chat_data['message_count'] = len(messages)
+        return len(messages)
+
+class FirestoreQuotes:
+    def __init__(self, db: firestore.Client):
+        self.db = db
+
+    def _quotes_ref(self, user_id: str):
+        return self.db.collection('users').document(user_id).collection('quotes')
+
+    def add(self, user_id: str, quote_data: dict) -> dict:
+        quote_ref = self._quotes_ref(user_id).document()
+        quote_ref.set(quote_data)
+        return dict(quote_data, id=quote_ref.id)
+
+    def delete(self, user_id: str, quote_id: str):
+        self._quotes_ref(user_id).document(quote_id).delete()
+
+    def all_for_user(self, user_id: str) -> list:
+        return [
+            dict(doc.to_dict(), id=doc.id)
+            for doc in self._quotes_ref(user_id).select(['text', 'category', 'created_at']).stream()
+        ]
+
+    def _query(self, user_id: str, category: Optional[str]):
+        query = self._quotes_ref(user_id)
+        if category:
+            query = query.where('category', '==', category)
+        return query
+
+    def page(self, user_id: str, limit: int, category: Optional[str] = None,
+             after: Optional[tuple] = None, offset: int = 0) -> list:
+        query = (self._query(user_id, category)
+                 .order_by('created_at', direction=firestore.Query.DESCENDING)
+                 .order_by('__name__', direction=firestore.Query.DESCENDING)
+                 .limit(limit))
+        if after is not None:
+            query = query.start_after([after[0], self._quotes_ref(user_id).document(str(after[1]))])
+        if offset:
+            query = query.offset(offset)
+        return [dict(doc.to_dict(), id=doc.id) for doc in query.stream()]
+
+    def count(self, user_id: str, category: Optional[str] = None) -> Optional[int]:
+        """Counts with an aggregation query, which doesn't read the quotes (None if the client library predates them)"""
+        query = self._query(user_id, category)
+        if not hasattr(query, 'count'):
+            return None
+        results = query.count(alias='total').get()
+        return int(results[0][0].value) if results and results[0] else 0
+
+def firestore_storage(db: firestore.Client) -> Storage:
+    return Storage(
+        backend='Firestore',
+        users=FirestoreUsers(db),
+        mood_entries=FirestoreMoodEntries(db),
+        chat_emotions=FirestoreChatEmotions(db),
+        chats=FirestoreChats(db),
+        quotes=FirestoreQuotes(db)
+    )
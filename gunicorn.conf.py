@@ -0,0 +1,40 @@
+import os
+
+# gunicorn picks this file up automatically from the working directory.
+
+# Request threads per worker. Concurrent requests let the emotion batcher fill
+# micro-batches; llm_client sizes its Gemini call pool from the same variable.
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+# Load the emotion model weights once in the master so forked workers share the
+# pages copy-on-write. Opt-in: it also imports the app (and initializes Firebase)
+# before forking.
+preload_app = os.getenv("EMOTION_PRELOAD_IN_MASTER", "false").lower() == "true"
+
+# Warm the model in every worker before it starts accepting traffic
+EMOTION_WARMUP = os.getenv("EMOTION_WARMUP", "true").lower() == "true"
+
+# Workers spend several seconds warming up; don't let the arbiter kill them
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+def when_ready(server):
+    if preload_app:
+        from emotion_detector import get_emotion_pipeline
+
+        # Only load the weights here; running inference in the master would start
+        # torch's thread pool, which does not survive fork()
+        get_emotion_pipeline()
+        server.log.info("Emotion model loaded in master for copy-on-write sharing")
+
+def post_worker_init(worker):
+    # Start filling the affirmation and quote pools in the background
+    from affirmations import affirmation_pool
+    from quotes import quote_pool
+
+    affirmation_pool.start()
+    quote_pool.start()
+
+    if EMOTION_WARMUP:
+        from emotion_detector import warm_up_emotion_model
+
+        warm_up_emotion_model()
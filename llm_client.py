@@ -0,0 +1,467 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import partial
+from typing import Optional
+
+import google.generativeai as genai
+from google.generativeai import client as genai_client
+
+from background_tasks import TaskPool
+from prompts import PROMPT_MAX_TOKENS, TokenHistogram, estimate_tokens
+
+DEFAULT_MODEL_NAME = "models/gemini-1.5-flash"
+
+# Maximum concurrent Gemini calls per worker process; defaults to the number of
+# request threads each gunicorn worker runs (see gunicorn.conf.py)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", os.getenv("GUNICORN_THREADS", "8")))
+
+# Seconds a caller waits for a Gemini response (for streams: the first chunk)
+LLM_CALL_TIMEOUT_S = float(os.getenv("LLM_CALL_TIMEOUT_S", "20"))
+
+# Seconds a caller waits for a free call slot before failing fast
+LLM_QUEUE_TIMEOUT_S = float(os.getenv("LLM_QUEUE_TIMEOUT_S", "2"))
+
+# Calls slower than this count as congestion for the adaptive limit
+LLM_SLOW_CALL_S = float(os.getenv("LLM_SLOW_CALL_S", "8"))
+
+# Consecutive failures that open the circuit, and how long it stays open
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+LLM_BREAKER_RESET_S = float(os.getenv("LLM_BREAKER_RESET_S", "30"))
+
+class LLMUnavailableError(RuntimeError):
+    """Raised without waiting on Gemini: the circuit is open or no call slot freed up in time."""
+
+class LLMTimeoutError(LLMUnavailableError):
+    """Raised when Gemini doesn't answer within LLM_CALL_TIMEOUT_S."""
+
+class PromptTooLargeError(ValueError):
+    """Raised, before anything is sent, for prompts estimated above PROMPT_MAX_TOKENS."""
+
+class ModelRegistry:
+    """
+    Process-wide registry of GenerativeModel instances keyed by model name and
+    generation config.
+
+    Models are built once and reused by every request, and they all share the
+    SDK's default client (and its connection), so repeated calls skip model
+    construction and connection setup.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(model_name: str, generation_config: Optional[dict]) -> tuple:
+        return model_name, json.dumps(generation_config or {}, sort_keys=True)
+
+    def get(self, model_name: str = DEFAULT_MODEL_NAME, generation_config: Optional[dict] = None):
+        """
+        Returns the shared model for this name/config, building it on first use.
+
+        Returns:
+            tuple: (GenerativeModel, seconds spent on setup - 0.0 when reused)
+        """
+        key = self._key(model_name, generation_config)
+        model = self._models.get(key)
+        if model is not None:
+            return model, 0.0
+
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                return model, 0.0
+
+            started_at = time.perf_counter()
+            # Creates (once per process) the client that holds the API connection
+            genai_client.get_default_generative_client()
+            model = genai.GenerativeModel(
+                model_name=model_name,
+                generation_config=generation_config
+            )
+            self._models[key] = model
+            return model, time.perf_counter() - started_at
+
+model_registry = ModelRegistry()
+
+class CircuitBreaker:
+    """
+    Stops calling Gemini while it is failing.
+
+    closed: calls go through; `failure_threshold` consecutive failures open the circuit.
+    open: calls fail immediately with LLMUnavailableError for `reset_after` seconds.
+    half_open: a single probe call goes through; success closes the circuit,
+    failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURE_THRESHOLD,
+                 reset_after: float = LLM_BREAKER_RESET_S):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_after = reset_after
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.transitions = deque(maxlen=20)  # (timestamp, from_state, to_state)
+        self.stats = {
+            'opened': 0,
+            'rejected': 0
+        }
+
+    def _transition(self, state: str):
+        # Caller holds self._lock
+        if state == self.state:
+            return
+        print(f"LLM circuit breaker: {self.state} -> {state}")
+        self.transitions.append((time.time(), self.state, state))
+        self.state = state
+        if state == self.OPEN:
+            self._opened_at = time.monotonic()
+            self.stats['opened'] += 1
+
+    def before_call(self):
+        """Raises LLMUnavailableError if the call must not go through."""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_after:
+                self._transition(self.HALF_OPEN)
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self.stats['rejected'] += 1
+        raise LLMUnavailableError("Gemini circuit breaker is open")
+
+    def cancel_probe(self):
+        """Gives back a half-open probe that never reached Gemini."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def on_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            self._transition(self.CLOSED)
+
+    def on_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._transition(self.OPEN)
+            self._probe_in_flight = False
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats['state'] = self.state
+            stats['consecutive_failures'] = self._failures
+            stats['transitions'] = [
+                {'at': at, 'from': from_state, 'to': to_state}
+                for at, from_state, to_state in self.transitions
+            ]
+        return stats
+
+class AdaptiveLimiter:
+    """
+    AIMD limit on in-flight Gemini calls.
+
+    Every fast, successful call raises the limit by 1/limit (about +1 per
+    round of calls); a failed or slow call halves it. The limit stays between
+    1 and `max_limit`. Callers wait at most `queue_timeout` seconds for a slot
+    and otherwise fail fast with LLMUnavailableError.
+    """
+
+    def __init__(self, max_limit: int = LLM_MAX_CONCURRENCY, queue_timeout: float = LLM_QUEUE_TIMEOUT_S,
+                 slow_call: float = LLM_SLOW_CALL_S):
+        self.max_limit = max(1, max_limit)
+        self.queue_timeout = queue_timeout
+        self.slow_call = slow_call
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self._condition = threading.Condition()
+        self.stats = {
+            'rejected': 0,
+            'decreases': 0
+        }
+
+    def acquire(self):
+        deadline = time.monotonic() + self.queue_timeout
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stats['rejected'] += 1
+                    raise LLMUnavailableError("Too many Gemini calls in flight")
+                self._condition.wait(remaining)
+            self.in_flight += 1
+
+    def release(self, latency_s: float, succeeded: bool):
+        with self._condition:
+            self.in_flight -= 1
+            if succeeded and latency_s < self.slow_call:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            else:
+                self.limit = max(1.0, self.limit / 2)
+                self.stats['decreases'] += 1
+            self._condition.notify_all()
+
+    def get_stats(self) -> dict:
+        with self._condition:
+            stats = dict(self.stats)
+            stats['limit'] = round(self.limit, 2)
+            stats['max_limit'] = self.max_limit
+            stats['in_flight'] = self.in_flight
+        return stats
+
+llm_breaker = CircuitBreaker()
+llm_limiter = AdaptiveLimiter()
+
+# Runs the blocking SDK calls so callers can stop waiting at their deadline; a
+# call keeps its limiter slot until it actually finishes, so the pool never
+# needs more threads than the limiter allows
+_llm_calls = TaskPool('llm-call', LLM_MAX_CONCURRENCY)
+
+def _release_when_done(started_at: float, future):
+    """Frees a call's slot once the SDK call itself returns."""
+    succeeded = not future.cancelled() and future.exception() is None
+    llm_limiter.release(time.perf_counter() - started_at, succeeded)
+
+_stats_lock = threading.Lock()
+_stats = {}  # route -> counters
+
+def _new_route_stats() -> dict:
+    return {
+        'calls': 0,
+        'errors': 0,
+        'timeouts': 0,
+        'rejected': 0,
+        'cold_starts': 0,
+        'streams': 0,
+        'oversized': 0,
+        'setup_s': 0.0,
+        'wait_s': 0.0,
+        'generation_s': 0.0,
+        'first_token_s': 0.0,
+        'prompt_tokens': TokenHistogram(),
+        'response_tokens': TokenHistogram()
+    }
+
+def _record_rejection(route: str):
+    with _stats_lock:
+        _stats.setdefault(route, _new_route_stats())['rejected'] += 1
+
+def _check_prompt_size(route: str, prompt) -> int:
+    """Estimates the prompt's tokens and refuses prompts over PROMPT_MAX_TOKENS."""
+    tokens = estimate_tokens(prompt if isinstance(prompt, str) else str(prompt))
+    if tokens > PROMPT_MAX_TOKENS:
+        with _stats_lock:
+            _stats.setdefault(route, _new_route_stats())['oversized'] += 1
+        raise PromptTooLargeError(f"Prompt for '{route}' is about {tokens} tokens (limit {PROMPT_MAX_TOKENS})")
+    return tokens
+
+def _response_text(response) -> str:
+    # .text raises when the response was blocked or has no parts
+    try:
+        return response.text or ''
+    except Exception:
+        return ''
+
+def _record(route: str, setup_s: float, wait_s: float, generation_s: float, error: bool,
+            first_token_s: Optional[float] = None, timed_out: bool = False,
+            prompt_tokens: int = 0, response_tokens: Optional[int] = None):
+    with _stats_lock:
+        stats = _stats.setdefault(route, _new_route_stats())
+        stats['prompt_tokens'].observe(prompt_tokens)
+        if response_tokens is not None:
+            stats['response_tokens'].observe(response_tokens)
+        stats['calls'] += 1
+        stats['errors'] += int(error)
+        stats['timeouts'] += int(timed_out)
+        stats['cold_starts'] += int(setup_s > 0)
+        stats['setup_s'] += setup_s
+        stats['wait_s'] += wait_s
+        stats['generation_s'] += generation_s
+        if first_token_s is not None:
+            stats['streams'] += 1
+            stats['first_token_s'] += first_token_s
+
+def _acquire_call(route: str):
+    """Checks the breaker and takes a limiter slot, failing fast when either says no."""
+    try:
+        llm_breaker.before_call()
+        try:
+            llm_limiter.acquire()
+        except LLMUnavailableError:
+            # A half-open probe that never ran must not wedge the breaker
+            llm_breaker.cancel_probe()
+            raise
+    except LLMUnavailableError:
+        _record_rejection(route)
+        raise
+
+def generate_content(prompt, model_name: str = DEFAULT_MODEL_NAME, generation_config: Optional[dict] = None,
+                     route: str = 'default', timeout: float = LLM_CALL_TIMEOUT_S, **kwargs):
+    """
+    Generates content with a shared model instance.
+
+    Calls go through the circuit breaker and the adaptive concurrency limit,
+    and the caller stops waiting after `timeout` seconds.
+
+    Args:
+        prompt: The prompt passed to GenerativeModel.generate_content
+        model_name (str): Full model name (with the "models/" prefix)
+        generation_config (dict, optional): Generation parameters
+        route (str): Label used to attribute timings in the LLM stats
+        timeout (float): Seconds to wait for the response
+
+    Returns:
+        The Gemini response object
+
+    Raises:
+        LLMUnavailableError: The circuit is open, no slot freed up in time, or
+            (LLMTimeoutError) the deadline passed
+        PromptTooLargeError: The prompt is estimated above PROMPT_MAX_TOKENS
+    """
+    prompt_tokens = _check_prompt_size(route, prompt)
+    model, setup_s = model_registry.get(model_name, generation_config)
+
+    wait_started_at = time.perf_counter()
+    _acquire_call(route)
+    started_at = time.perf_counter()
+    error = True
+    timed_out = False
+    response_tokens = None
+    future = None
+    try:
+        future = _llm_calls.submit(model.generate_content, prompt, **kwargs)
+        future.add_done_callback(partial(_release_when_done, started_at))
+        try:
+            response = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            timed_out = True
+            raise LLMTimeoutError(f"Gemini did not respond within {timeout:g}s")
+        error = False
+        response_tokens = estimate_tokens(_response_text(response))
+        return response
+    finally:
+        if future is None:
+            # submit() itself failed (e.g. the pool is shut down), so no callback will free the slot
+            llm_limiter.release(time.perf_counter() - started_at, False)
+        if error:
+            llm_breaker.on_failure()
+        else:
+            llm_breaker.on_success()
+        generation_s = time.perf_counter() - started_at
+        _record(route, setup_s, started_at - wait_started_at, generation_s, error, timed_out=timed_out,
+                prompt_tokens=prompt_tokens, response_tokens=response_tokens)
+
+def stream_content(prompt, model_name: str = DEFAULT_MODEL_NAME, generation_config: Optional[dict] = None,
+                   route: str = 'default', timeout: float = LLM_CALL_TIMEOUT_S, **kwargs):
+    """
+    Streams generated text with a shared model instance.
+
+    Goes through the circuit breaker and the adaptive concurrency limit like
+    generate_content; `timeout` bounds the wait for the first chunk. The call
+    slot is held until the stream is exhausted or closed. Time to first token
+    (measured from the start of generation, after queueing) is recorded
+    alongside the usual timings.
+
+    Args:
+        prompt: The prompt passed to GenerativeModel.generate_content
+        model_name (str): Full model name (with the "models/" prefix)
+        generation_config (dict, optional): Generation parameters
+        route (str): Label used to attribute timings in the LLM stats
+        timeout (float): Seconds to wait for the first chunk
+
+    Yields:
+        str: Non-empty text chunks as Gemini produces them
+
+    Raises:
+        PromptTooLargeError: The prompt is estimated above PROMPT_MAX_TOKENS
+    """
+    prompt_tokens = _check_prompt_size(route, prompt)
+    model, setup_s = model_registry.get(model_name, generation_config)
+
+    wait_started_at = time.perf_counter()
+    _acquire_call(route)
+    started_at = time.perf_counter()
+    first_token_s = None
+    error = True
+    timed_out = False
+    slot_released = False
+    chunks = []
+    try:
+        # The SDK fetches the first chunk when the stream is created. If submit()
+        # raises, the finally block below frees the slot.
+        future = _llm_calls.submit(model.generate_content, prompt, stream=True, **kwargs)
+        try:
+            response = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            timed_out = True
+            future.add_done_callback(partial(_release_when_done, started_at))
+            slot_released = True
+            raise LLMTimeoutError(f"Gemini did not start streaming within {timeout:g}s")
+
+        for chunk in response:
+            # A safety-blocked or empty chunk is a completed call without text, not a failure
+            text = _response_text(chunk)
+            if not text:
+                continue
+            if first_token_s is None:
+                first_token_s = time.perf_counter() - started_at
+            chunks.append(text)
+            yield text
+        error = False
+    except GeneratorExit:
+        # The client went away mid-stream; that says nothing about Gemini's health
+        error = False
+        raise
+    finally:
+        generation_s = time.perf_counter() - started_at
+        if not slot_released:
+            llm_limiter.release(first_token_s if first_token_s is not None else generation_s, not error)
+        if error:
+            llm_breaker.on_failure()
+        else:
+            llm_breaker.on_success()
+        _record(route, setup_s, started_at - wait_started_at, generation_s, error,
+                first_token_s if first_token_s is not None else generation_s, timed_out=timed_out,
+                prompt_tokens=prompt_tokens, response_tokens=estimate_tokens(''.join(chunks)) if chunks else None)
+
+def get_llm_stats() -> dict:
+    """
+    Returns per-route call counts and average setup, queueing and generation
+    times, the average time to first token of streamed calls, and histograms of
+    estimated prompt and response tokens.
+    """
+    with _stats_lock:
+        snapshot = {route: dict(stats) for route, stats in _stats.items()}
+        for stats in snapshot.values():
+            stats['prompt_tokens'] = stats['prompt_tokens'].to_dict()
+            stats['response_tokens'] = stats['response_tokens'].to_dict()
+
+    for stats in snapshot.values():
+        calls = max(stats['calls'], 1)
+        stats['avg_setup_ms'] = 1000 * stats.pop('setup_s') / calls
+        stats['avg_wait_ms'] = 1000 * stats.pop('wait_s') / calls
+        stats['avg_generation_ms'] = 1000 * stats.pop('generation_s') / calls
+        stats['avg_first_token_ms'] = 1000 * stats.pop('first_token_s') / max(stats['streams'], 1)
+    return snapshot
+
+def get_llm_health() -> dict:
+    """
+    Returns the circuit breaker state (with recent transitions) and the adaptive limit.
+    """
+    return {
+        'breaker': llm_breaker.get_stats(),
+        'limiter': llm_limiter.get_stats()
+    }
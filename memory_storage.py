@@ -0,0 +1,225 @@
+"""
+In-memory implementation of the storage repositories (see storage.py).
+
+Data lives in each worker process and is lost on restart; used for
+development when neither Firestore nor SQLite is configured.
+"""
+import bisect
+import copy
+import threading
+import uuid
+from typing import Optional
+
+from chat_store import CHAT_LIST_FIELDS, message_preview
+from storage import Storage
+
+class MemoryUsers:
+    def __init__(self):
+        self.users = {}  # user_id -> profile
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Optional[dict]:
+        with self._lock:
+            user = self.users.get(user_id)
+            return dict(user) if user is not None else None
+
+    def create(self, user_id: str, data: dict) -> bool:
+        with self._lock:
+            if user_id in self.users:
+                return False
+            self.users[user_id] = dict(data)
+            return True
+
+    def update(self, user_id: str, fields: dict):
+        with self._lock:
+            self.users.setdefault(user_id, {}).update(fields)
+
+class MemoryMoodEntries:
+    """
+    Each user's entries are also kept in a list of (date, sequence, entry_id)
+    sorted with bisect. A date range is then two binary searches plus the
+    matching slice (O(log n + k)) instead of a scan over every user's entries.
+    The list is oldest first, so the newest entry is its last item and
+    reversing a slice gives newest first.
+    """
+
+    def __init__(self):
+        self.entries = {}  # entry_id -> entry
+        self._user_index = {}  # user_id -> sorted [(date, seq, entry_id)] over entries
+        self._next_seq = 1
+        self._lock = threading.Lock()
+
+    def add(self, entry: dict) -> str:
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            entry_id = str(seq)
+            self.entries[entry_id] = dict(entry)
+            bisect.insort(self._user_index.setdefault(entry['user_id'], []), (entry['date'], seq, entry_id))
+        return entry_id
+
+    def get(self, entry_id: str) -> Optional[dict]:
+        entry = self.entries.get(entry_id)
+        return dict(entry) if entry is not None else None
+
+    def list_for_user(self, user_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                      limit: Optional[int] = None) -> list:
+        with self._lock:
+            index = self._user_index.get(user_id, [])
+            lo = bisect.bisect_left(index, (start_date,)) if start_date else 0
+            hi = bisect.bisect_right(index, (end_date, float('inf'))) if end_date else len(index)
+            if limit is not None:
+                lo = max(lo, hi - limit)
+            return [dict(self.entries[entry_id]) for _, _, entry_id in reversed(index[lo:hi])]
+
+    def latest(self, user_id: str) -> Optional[dict]:
+        with self._lock:
+            index = self._user_index.get(user_id)
+            return dict(self.entries[index[-1][2]]) if index else None
+
+    def update(self, entry_id: str, fields: dict) -> bool:
+        with self._lock:
+            entry = self.entries.get(entry_id)
+            if entry is None:
+                return False
+            entry.update(fields)
+            return True
+
+    def delete(self, entry_id: str) -> bool:
+        with self._lock:
+            entry = self.entries.pop(entry_id, None)
+            if entry is None:
+                return False
+            index = self._user_index[entry['user_id']]
+            del index[bisect.bisect_left(index, (entry['date'], int(entry_id), entry_id))]
+            if not index:
+                del self._user_index[entry['user_id']]
+            return True
+
+class MemoryChatEmotions:
+    def __init__(self):
+        self.entries = []
+        self._lock = threading.Lock()
+
+    def add(self, entry: dict) -> str:
+        with self._lock:
+            self.entries.append(dict(entry))
+            return str(len(self.entries) - 1)
+
+class MemoryChats:
+    def __init__(self):
+        self.chats = {}  # user_id -> {chat_id -> (metadata, messages)}
+        self._lock = threading.Lock()
+
+    def _chat(self, user_id: str, chat_id: str) -> Optional[tuple]:
+        return self.chats.get(user_id, {}).get(chat_id)
+
+    def create(self, user_id: str, chat_data: dict, messages: list) -> str:
+        chat_id = str(uuid.uuid4())
+        with self._lock:
+            self.chats.setdefault(user_id, {})[chat_id] = (dict(chat_data), list(messages))
+        return chat_id
+
+    def get(self, user_id: str, chat_id: str) -> Optional[dict]:
+        with self._lock:
+            chat = self._chat(user_id, chat_id)
+            return copy.deepcopy(chat[0]) if chat is not None else None
+
+    def latest_messages(self, user_id: str, chat_id: str, limit: int, before: Optional[int] = None) -> list:
+        with self._lock:
+            chat = self._chat(user_id, chat_id)
+            if chat is None:
+                return []
+            messages = chat[1]
+            end = len(messages) if before is None else max(0, min(before, len(messages)))
+            return messages[max(0, end - limit):end]
+
+    def messages_between(self, user_id: str, chat_id: str, start: int, end: int) -> list:
+        with self._lock:
+            chat = self._chat(user_id, chat_id)
+            return chat[1][max(0, start):max(0, end)] if chat is not None else []
+
+    def find_message(self, user_id: str, chat_id: str, idempotency_key: str) -> Optional[dict]:
+        with self._lock:
+            chat = self._chat(user_id, chat_id)
+            messages = chat[1] if chat is not None else []
+            return next((message for message in reversed(messages)
+                         if message.get('idempotency_key') == idempotency_key), None)
+
+    def append_messages(self, user_id: str, chat_id: str, chat_data: dict, new_messages: list,
+                        timestamp: int) -> list:
+        with self._lock:
+            metadata, messages = self._chat(user_id, chat_id)
+            seq = len(messages)
+            stamped = [dict(message, seq=seq + i) for i, message in enumerate(new_messages)]
+            messages.extend(stamped)
+            metadata.update({
+                'message_count': len(messages),
+                'last_message': message_preview(stamped[-1]),
+                'updated_at': timestamp
+            })
+        return stamped
+
+    def update(self, user_id: str, chat_id: str, fields: dict):
+        with self._lock:
+            chat = self._chat(user_id, chat_id)
+            if chat is not None:
+                chat[0].update(fields)
+
+    def list(self, user_id: str, limit: int, after: Optional[tuple] = None) -> list:
+        with self._lock:
+            chats = [
+                dict({field: metadata.get(field) for field in CHAT_LIST_FIELDS}, id=chat_id)
+                for chat_id, (metadata, _) in self.chats.get(user_id, {}).items()
+            ]
+        chats.sort(key=lambda chat: (chat.get('updated_at') or 0, chat['id']), reverse=True)
+        if after:
+            chats = [chat for chat in chats if (chat.get('updated_at') or 0, chat['id']) < tuple(after)]
+        return chats[:limit]
+
+    def delete(self, user_id: str, chat_id: str) -> bool:
+        with self._lock:
+            return self.chats.get(user_id, {}).pop(chat_id, None) is not None
+
+def _quote_key(quote: dict) -> tuple:
+    return quote.get('created_at') or 0, quote['id']
+
+class MemoryQuotes:
+    def __init__(self):
+        self.quotes = {}  # user_id -> [quote]
+        self._lock = threading.Lock()
+
+    def add(self, user_id: str, quote_data: dict) -> dict:
+        quote = dict(quote_data, id=str(uuid.uuid4()))
+        with self._lock:
+            self.quotes.setdefault(user_id, []).append(quote)
+        return quote
+
+    def delete(self, user_id: str, quote_id: str):
+        with self._lock:
+            self.quotes[user_id] = [quote for quote in self.quotes.get(user_id, []) if quote['id'] != quote_id]
+
+    def all_for_user(self, user_id: str) -> list:
+        with self._lock:
+            return list(self.quotes.get(user_id, []))
+
+    def page(self, user_id: str, limit: int, category: Optional[str] = None,
+             after: Optional[tuple] = None, offset: int = 0) -> list:
+        quotes = [quote for quote in self.all_for_user(user_id) if not category or quote.get('category') == category]
+        quotes.sort(key=_quote_key, reverse=True)
+        if after is not None:
+            quotes = [quote for quote in quotes if _quote_key(quote) < tuple(after)]
+        return quotes[offset:offset + limit]
+
+    def count(self, user_id: str, category: Optional[str] = None) -> Optional[int]:
+        return sum(1 for quote in self.all_for_user(user_id) if not category or quote.get('category') == category)
+
+def memory_storage() -> Storage:
+    return Storage(
+        backend='in-memory',
+        users=MemoryUsers(),
+        mood_entries=MemoryMoodEntries(),
+        chat_emotions=MemoryChatEmotions(),
+        chats=MemoryChats(),
+        quotes=MemoryQuotes()
+    )
@@ -0,0 +1,64 @@
+"""
+One-time migration of chats to the messages subcollection layout.
+
+Chats written before chat_store.ChatStore embed every message in a `messages`
+array on the chat document. This moves each chat's messages into
+`users/{user}/chats/{chat}/messages` (one document per message, keyed by
+position) and leaves only metadata on the chat document. Already migrated
+chats are skipped, so the migration can be re-run or interrupted safely.
+The app also migrates a legacy chat on its own the first time a message is
+added to it.
+
+    python migrate_chats.py                 # all users
+    python migrate_chats.py --user <uid>    # a single user
+    python migrate_chats.py --dry-run       # report what would be migrated
+"""
+import argparse
+
+from chat_store import is_legacy_chat
+from firestore_storage import FirestoreChats
+from rescore_emotions import init_firestore
+
+def migrate_user(store: FirestoreChats, user_ref, dry_run: bool) -> tuple:
+    """
+    Returns:
+        tuple: (chats migrated, messages moved) for one user
+    """
+    chats = 0
+    messages = 0
+    for chat_doc in user_ref.collection('chats').stream():
+        chat_data = chat_doc.to_dict()
+        if not is_legacy_chat(chat_data):
+            continue
+        count = len(chat_data.get('messages', []))
+        if not dry_run:
+            count = store.migrate(chat_doc.reference, chat_data)
+        print(f"  {user_ref.id}/{chat_doc.id}: {count} messages")
+        chats += 1
+        messages += count
+    return chats, messages
+
+def main():
+    parser = argparse.ArgumentParser(description="Move embedded chat messages into per-chat subcollections")
+    parser.add_argument('--user', help="Only migrate this user's chats")
+    parser.add_argument('--dry-run', action='store_true', help="Report legacy chats without writing")
+    args = parser.parse_args()
+
+    db = init_firestore()
+    store = FirestoreChats(db)
+
+    users_ref = db.collection('users')
+    user_refs = [users_ref.document(args.user)] if args.user else users_ref.list_documents()
+
+    total_chats = 0
+    total_messages = 0
+    for user_ref in user_refs:
+        chats, messages = migrate_user(store, user_ref, args.dry_run)
+        total_chats += chats
+        total_messages += messages
+
+    action = "Would migrate" if args.dry_run else "Migrated"
+    print(f"{action} {total_chats} chats ({total_messages} messages)")
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,25 @@
 from datetime import datetime
 from typing import Optional, Dict, List
-from firebase_admin import firestore
 from dataclasses import dataclass
 
+from memory_storage import MemoryMoodEntries
+
+# Convert detected emotions to the mood tracker's mood format
+DETECTED_EMOTION_TO_MOOD = {
+    'happy': 'happy',
+    'excited': 'happy',
+    'neutral': 'neutral',
+    'anxious': 'anxious',
+    'sad': 'sad',
+    'angry': 'angry'
+}
+
+# Notes of mood entries logged automatically from chat messages start with this
+AUTO_DETECTED_NOTE_PREFIX = "Auto-detected during therapy session"
+
+# Characters of the chat message kept in an auto-detected entry's note
+AUTO_DETECTED_NOTE_MAX_CHARS = 50
+
 @dataclass
 class MoodEntry:
     user_id: str
@@ -28,117 +45,65 @@ class MoodEntry:
         }
 
 class MoodTracker:
-    def __init__(self, db: Optional[firestore.Client] = None):
-        self.db = db
-        self.in_memory_storage = {}  # Fallback storage when db is None
-        if db is not None:
-            self.collection = self.db.collection('mood_entries')
-        else:
-            print("Using in-memory storage for mood tracking")
+    """
+    Stores mood entries through a MoodEntryRepository (see storage.py),
+    in memory by default.
+
+    Entries are returned newest first: by date, then most recently added
+    first within a day, in every backend.
+    """
+
+    def __init__(self, entries=None):
+        self.entries = entries if entries is not None else MemoryMoodEntries()
 
     def add_mood_entry(self, entry: MoodEntry) -> str:
         """
-        Add a new mood entry to Firestore.
-        Returns the document ID of the created entry.
+        Add a new mood entry.
+        Returns the ID of the created entry.
         """
-        if self.db is not None:
-            doc_ref = self.collection.document()
-            doc_ref.set(entry.to_dict())
-            return doc_ref.id
-        else:
-            # Use in-memory storage
-            entry_id = str(len(self.in_memory_storage) + 1)
-            self.in_memory_storage[entry_id] = entry.to_dict()
-            return entry_id
+        return self.entries.add(entry.to_dict())
 
     def get_mood_entry(self, entry_id: str) -> Optional[MoodEntry]:
         """
         Retrieve a specific mood entry by its ID.
         Returns None if not found.
         """
-        if self.db is not None:
-            doc = self.collection.document(entry_id).get()
-            if doc.exists:
-                return MoodEntry.from_dict(doc.to_dict())
-        else:
-            # Use in-memory storage
-            if entry_id in self.in_memory_storage:
-                return MoodEntry.from_dict(self.in_memory_storage[entry_id])
-        return None
-
-    def get_user_mood_entries(self, user_id: str, start_date: str = None, end_date: str = None) -> List[MoodEntry]:
+        data = self.entries.get(entry_id)
+        return MoodEntry.from_dict(data) if data is not None else None
+
+    def get_user_mood_entries(self, user_id: str, start_date: str = None, end_date: str = None,
+                              limit: int = None) -> List[MoodEntry]:
+        """
+        Get all mood entries for a specific user within an optional date range, newest first.
+        `limit` caps the number of entries returned.
+        """
+        return [MoodEntry.from_dict(data) for data in self.entries.list_for_user(user_id, start_date, end_date, limit)]
+
+    def get_latest_mood_entry(self, user_id: str, start_date: str = None, end_date: str = None) -> Optional[MoodEntry]:
         """
-        Get all mood entries for a specific user within an optional date range.
+        The user's most recent mood entry within an optional date range, or None.
         """
-        if self.db is not None:
-            query = self.collection.where('user_id', '==', user_id)
-            
-            if start_date:
-                query = query.where('date', '>=', start_date)
-            if end_date:
-                query = query.where('date', '<=', end_date)
-            
-            query = query.order_by('date', direction=firestore.Query.DESCENDING)
-            
-            return [MoodEntry.from_dict(doc.to_dict()) for doc in query.stream()]
-        else:
-            # Use in-memory storage
-            entries = []
-            for entry_data in self.in_memory_storage.values():
-                if entry_data['user_id'] == user_id:
-                    if start_date and entry_data['date'] < start_date:
-                        continue
-                    if end_date and entry_data['date'] > end_date:
-                        continue
-                    entries.append(MoodEntry.from_dict(entry_data))
-            return sorted(entries, key=lambda x: x.date, reverse=True)
+        if not start_date and not end_date:
+            data = self.entries.latest(user_id)
+            return MoodEntry.from_dict(data) if data is not None else None
+        entries = self.get_user_mood_entries(user_id, start_date=start_date, end_date=end_date, limit=1)
+        return entries[0] if entries else None
 
     def update_mood_entry(self, entry_id: str, mood: str = None, note: str = None) -> bool:
         """
         Update an existing mood entry.
         Returns True if successful, False if entry not found.
         """
-        if self.db is not None:
-            doc_ref = self.collection.document(entry_id)
-            doc = doc_ref.get()
-            
-            if not doc.exists:
-                return False
-            
-            update_data = {}
-            if mood is not None:
-                update_data['mood'] = mood
-            if note is not None:
-                update_data['note'] = note
-            
-            if update_data:
-                doc_ref.update(update_data)
-        else:
-            # Use in-memory storage
-            if entry_id not in self.in_memory_storage:
-                return False
-            if mood is not None:
-                self.in_memory_storage[entry_id]['mood'] = mood
-            if note is not None:
-                self.in_memory_storage[entry_id]['note'] = note
-        return True
+        fields = {}
+        if mood is not None:
+            fields['mood'] = mood
+        if note is not None:
+            fields['note'] = note
+        return self.entries.update(entry_id, fields)
 
     def delete_mood_entry(self, entry_id: str) -> bool:
         """
         Delete a mood entry.
         Returns True if successful, False if entry not found.
         """
-        if self.db is not None:
-            doc_ref = self.collection.document(entry_id)
-            doc = doc_ref.get()
-            
-            if not doc.exists:
-                return False
-            
-            doc_ref.delete()
-        else:
-            # Use in-memory storage
-            if entry_id not in self.in_memory_storage:
-                return False
-            del self.in_memory_storage[entry_id]
-        return True 
\ No newline at end of file
+        return self.entries.delete(entry_id)
@@ -0,0 +1,216 @@
+import os
+import bisect
+import threading
+from string import Formatter
+from typing import Optional
+
+# Prompts estimated above this many tokens are trimmed (registry prompts) or refused (llm_client)
+PROMPT_MAX_TOKENS = int(os.getenv("PROMPT_MAX_TOKENS", "4000"))
+
+# Upper bounds of the token histogram buckets (a final bucket catches anything larger)
+TOKEN_HISTOGRAM_BOUNDS = (32, 64, 128, 256, 512, 1024, 2048, 4096)
+
+TRIM_MARKER = " [...]"
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count for English text (about 4 characters per token).
+    """
+    return len(text) // 4 + 1 if text else 0
+
+class PromptTemplate:
+    """
+    A prompt with {named} fields, parsed once at registration.
+
+    Rendering joins the precompiled literal segments with the field values,
+    and the literal segments' token estimate is computed up front. Values are
+    inserted as-is, so braces in user text are safe. If the rendered prompt
+    would exceed `max_tokens`, the value of `trim_field` (usually the user's
+    message) is shortened to fit.
+    """
+
+    def __init__(self, name: str, template: str, trim_field: Optional[str] = None,
+                 max_tokens: int = PROMPT_MAX_TOKENS):
+        self.name = name
+        self.template = template
+        self.trim_field = trim_field
+        self.max_tokens = max_tokens
+        self._segments = []  # (literal text, field name or None)
+        for literal, field, spec, conversion in Formatter().parse(template):
+            if spec or conversion:
+                raise ValueError(f"Prompt '{name}': format specs aren't supported ({{{field}}})")
+            self._segments.append((literal, field))
+        self.fields = tuple(dict.fromkeys(field for _, field in self._segments if field))
+        self.static_tokens = estimate_tokens(''.join(literal for literal, _ in self._segments))
+        if trim_field is not None and trim_field not in self.fields:
+            raise ValueError(f"Prompt '{name}' has no field '{trim_field}' to trim")
+
+    def _trim(self, values: dict) -> dict:
+        used = self.static_tokens + sum(
+            estimate_tokens(value) for field, value in values.items() if field != self.trim_field
+        )
+        allowed_chars = max(0, (self.max_tokens - used) * 4 - len(TRIM_MARKER))
+        values = dict(values)
+        values[self.trim_field] = values[self.trim_field][:allowed_chars] + TRIM_MARKER
+        return values
+
+    def render(self, **values) -> str:
+        """
+        Fills in the template.
+
+        Raises:
+            KeyError: A field has no value
+        """
+        values = {field: str(values[field]) for field in self.fields}
+        if self.trim_field is not None:
+            total = self.static_tokens + sum(estimate_tokens(value) for value in values.values())
+            if total > self.max_tokens:
+                print(f"Prompt '{self.name}' is about {total} tokens, trimming '{self.trim_field}'")
+                values = self._trim(values)
+        return ''.join(literal + (values[field] if field else '') for literal, field in self._segments)
+
+_registry = {}
+
+def register_prompt(name: str, template: str, trim_field: Optional[str] = None) -> PromptTemplate:
+    """Compiles a template and adds it to the registry under `name`"""
+    prompt = PromptTemplate(name, template, trim_field=trim_field)
+    _registry[name] = prompt
+    return prompt
+
+def get_prompt(name: str) -> PromptTemplate:
+    return _registry[name]
+
+def render_prompt(name: str, **values) -> str:
+    """Renders a registered prompt"""
+    return _registry[name].render(**values)
+
+def list_prompts() -> dict:
+    """Registered prompts with their fields and static token estimate"""
+    return {
+        name: {'fields': list(prompt.fields), 'static_tokens': prompt.static_tokens}
+        for name, prompt in _registry.items()
+    }
+
+class TokenHistogram:
+    """Counts of token sizes in fixed power-of-two buckets."""
+
+    def __init__(self, bounds: tuple = TOKEN_HISTOGRAM_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.max = 0
+
+    def observe(self, tokens: int):
+        # Caller serializes access (llm_client holds its stats lock)
+        self.counts[bisect.bisect_left(self.bounds, tokens)] += 1
+        self.total += tokens
+        self.max = max(self.max, tokens)
+
+    def to_dict(self) -> dict:
+        count = sum(self.counts)
+        buckets = {f"<={bound}": n for bound, n in zip(self.bounds, self.counts)}
+        buckets[f">{self.bounds[-1]}"] = self.counts[-1]
+        return {
+            'count': count,
+            'total': self.total,
+            'avg': self.total / count if count else 0.0,
+            'max': self.max,
+            'buckets': buckets
+        }
+
+# --- Therapist replies ---
+
+THERAPIST_REPLY = register_prompt(
+    'therapist_reply',
+    "You are a compassionate AI therapist. The user is feeling {emotion}. Respond with empathy in 2-3 sentences."
+    "{context}\n\nUser: {user_message}\nYour response:",
+    trim_field='user_message'
+)
+
+GENERAL_CHAT = register_prompt(
+    'general_chat',
+    "You are a helpful and compassionate AI therapist. User: {user_message}\nYour response:",
+    trim_field='user_message'
+)
+
+THERAPY = register_prompt(
+    'therapy',
+    """You are a compassionate AI therapist. Your responses should be:
+- Warm and supportive
+- Non-judgmental and validating
+- Brief but thoughtful (2-3 sentences)
+- Focused on the user's feelings
+{emotion_context}
+User: {user_message}
+Therapist:""",
+    trim_field='user_message'
+)
+
+# --- Conversation summaries ---
+
+CHAT_SUMMARY = register_prompt(
+    'chat_summary',
+    """You maintain a running summary of a therapy conversation for the therapist's reference.
+Update the summary with the new turns below. Keep what matters for continuing the conversation:
+the user's concerns, feelings, important facts they shared and any coping strategies discussed.
+Write at most {max_words} words in plain prose.
+
+Current summary:
+{summary}
+
+New turns:
+{turns}
+
+Return only the updated summary.""",
+    trim_field='turns'
+)
+
+# --- Affirmations and quotes ---
+
+AFFIRMATION = register_prompt(
+    'affirmation',
+    """As an empathetic AI therapist, {instruction}.
+The affirmation should be:
+- Short (one sentence, max 100 characters)
+- Personal (using "I" or "my")
+- Present tense
+- Positive and empowering
+- Specific to someone feeling {emotion}
+
+Return only the affirmation text, nothing else."""
+)
+
+AFFIRMATION_BATCH = register_prompt(
+    'affirmation_batch',
+    """As an empathetic AI therapist, write affirmations for people feeling each emotion below.
+{wanted}
+
+Every affirmation should be:
+- Short (one sentence, max 100 characters)
+- Personal (using "I" or "my")
+- Present tense
+- Positive and empowering
+- Different from the others
+
+Return only a JSON object mapping each emotion to a list of affirmation strings, with no other text."""
+)
+
+QUOTE = register_prompt(
+    'quote',
+    "{instruction}\n\nGenerate something completely unique. Current timestamp: {nonce}"
+)
+
+QUOTE_BATCH = register_prompt(
+    'quote_batch',
+    """Write short therapeutic quotes for each theme below.
+{wanted}
+
+Every quote should be:
+- Brief (under 150 characters)
+- Uplifting and meaningful
+- Without explanation, attribution or quotation marks, unless it's from a specific person
+- Different from the others
+
+Return only a JSON object mapping each theme's key to a list of quote strings, with no other text.
+Current timestamp: {nonce}"""
+)
@@ -0,0 +1,213 @@
+import os
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Optional
+
+from chat_store import encode_cursor, decode_cursor
+
+# Default quotes per page of GET /api/quotes
+QUOTE_PAGE_SIZE = int(os.getenv("QUOTE_PAGE_SIZE", "12"))
+
+# Users whose search index is kept per worker (least recently searched are dropped)
+QUOTE_INDEX_USERS = int(os.getenv("QUOTE_INDEX_USERS", "256"))
+
+_TERM_RE = re.compile(r"[\w']+")
+
+def tokenize(text: str) -> list:
+    """Lowercased words of a text, in order"""
+    return _TERM_RE.findall((text or '').lower())
+
+def _sort_key(quote: dict) -> tuple:
+    return quote.get('created_at', 0), quote['id']
+
+class QuoteSearchIndex:
+    """
+    Inverted index over one user's quotes: term -> IDs of the quotes containing it.
+
+    A query matches quotes whose text contains it, ignoring case, anywhere
+    ("ness" matches "happiness"). Each query word must then be part of one
+    of the quote's words, so candidates are found by checking the query
+    words against the vocabulary (each distinct word once) rather than every
+    quote's text; only the candidates' text is checked for the whole query.
+    """
+
+    def __init__(self, quotes: list):
+        self._quotes = {}
+        self._postings = defaultdict(set)
+        self._lock = threading.Lock()
+        for quote in quotes:
+            self._add(quote)
+
+    def _add(self, quote: dict):
+        self._quotes[quote['id']] = quote
+        for term in set(tokenize(quote.get('text'))):
+            self._postings[term].add(quote['id'])
+
+    def add(self, quote: dict):
+        with self._lock:
+            self._add(quote)
+
+    def remove(self, quote_id: str):
+        with self._lock:
+            quote = self._quotes.pop(quote_id, None)
+            if quote is None:
+                return
+            for term in set(tokenize(quote.get('text'))):
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.discard(quote_id)
+                    if not postings:
+                        del self._postings[term]
+
+    def signature(self) -> tuple:
+        """(number of quotes, sort key of the newest), to compare with the stored quotes"""
+        with self._lock:
+            newest = max(map(_sort_key, self._quotes.values()), default=None)
+            return len(self._quotes), newest
+
+    def _matching_ids(self, fragment: str) -> set:
+        # Caller holds self._lock
+        ids = set()
+        for term, postings in self._postings.items():
+            if fragment in term:
+                ids |= postings
+        return ids
+
+    def search(self, query: Optional[str] = None, category: Optional[str] = None) -> list:
+        """
+        Returns the quotes whose text contains `query` (all of them if it's empty), newest first.
+        """
+        needle = (query or '').lower()
+        with self._lock:
+            terms = tokenize(needle)
+            if terms:
+                ids = None
+                # Rarest-looking (longest) words first keeps the intersection small
+                for term in sorted(set(terms), key=len, reverse=True):
+                    matches = self._matching_ids(term)
+                    ids = matches if ids is None else ids & matches
+                    if not ids:
+                        break
+                quotes = [self._quotes[quote_id] for quote_id in ids]
+            else:
+                quotes = list(self._quotes.values())
+
+        if needle:
+            quotes = [quote for quote in quotes if needle in (quote.get('text') or '').lower()]
+        if category:
+            quotes = [quote for quote in quotes if quote.get('category') == category]
+        quotes.sort(key=_sort_key, reverse=True)
+        return quotes
+
+class QuoteStore:
+    """
+    Users' saved quotes, stored through a QuoteRepository (see storage.py).
+
+    Listing pages are keyed on (created_at, ID) with a limit and a cursor, so
+    a page costs the same however many quotes a user has saved; the total
+    comes from the repository's count. Searches run against a per-user
+    inverted index kept in this worker, built from the quotes' text (see
+    QuoteSearchIndex). Writes through this worker update the index; before a
+    search, the quote count and the newest quote are read from storage, and
+    the index is rebuilt if other workers have saved or deleted quotes since.
+    """
+
+    def __init__(self, quotes):
+        self.quotes = quotes
+        self._indexes = OrderedDict()  # user_id -> QuoteSearchIndex
+        self._lock = threading.Lock()
+
+    def _cached_index(self, user_id: str) -> Optional[QuoteSearchIndex]:
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None:
+                self._indexes.move_to_end(user_id)
+            return index
+
+    def _stored_signature(self, user_id: str) -> tuple:
+        """The QuoteSearchIndex.signature() of the user's stored quotes"""
+        newest = self.quotes.page(user_id, 1)
+        return self.quotes.count(user_id), _sort_key(newest[0]) if newest else None
+
+    def _search_index(self, user_id: str) -> QuoteSearchIndex:
+        """The user's search index, built on demand and rebuilt when it no longer matches storage"""
+        index = self._cached_index(user_id)
+        if index is not None:
+            count, newest = self._stored_signature(user_id)
+            index_count, index_newest = index.signature()
+            # Without a count (old Firestore client libraries) only new quotes are noticed
+            if newest == index_newest and count in (None, index_count):
+                return index
+
+        index = QuoteSearchIndex(self.quotes.all_for_user(user_id))
+        with self._lock:
+            self._indexes[user_id] = index
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > QUOTE_INDEX_USERS:
+                self._indexes.popitem(last=False)
+        return index
+
+    def add_quote(self, user_id: str, quote_data: dict) -> dict:
+        """
+        Saves a quote.
+
+        Returns:
+            dict: The quote with its new `id`
+        """
+        quote = self.quotes.add(user_id, quote_data)
+        index = self._cached_index(user_id)
+        if index is not None:
+            index.add(quote)
+        return quote
+
+    def delete_quote(self, user_id: str, quote_id: str):
+        self.quotes.delete(user_id, quote_id)
+        index = self._cached_index(user_id)
+        if index is not None:
+            index.remove(quote_id)
+
+    def list_quotes(self, user_id: str, category: Optional[str] = None, search: Optional[str] = None,
+                    limit: int = QUOTE_PAGE_SIZE, cursor: Optional[str] = None, page: int = 1) -> tuple:
+        """
+        Returns a page of a user's quotes, newest first.
+
+        Args:
+            category (str, optional): Only quotes in this category
+            search (str, optional): Text the quotes must contain (case-insensitive)
+            limit (int): Quotes per page
+            cursor (str, optional): `next_cursor` of the previous page
+            page (int): Page number (from 1), used when there is no cursor; pages
+                after the first skip over the earlier quotes, so cursors are cheaper
+
+        Returns:
+            tuple: (quotes, next_cursor, total) - next_cursor is None on the last
+                page; total (matching quotes) is only computed for the first page
+                and is None otherwise
+
+        Raises:
+            ValueError: The cursor is malformed
+        """
+        after = None
+        if cursor:
+            after = tuple(decode_cursor(cursor))
+            if len(after) != 2:
+                raise ValueError("Invalid cursor")
+
+        offset = (max(1, page) - 1) * limit if after is None else 0
+
+        if search:
+            quotes = self._search_index(user_id).search(search, category)
+            total = len(quotes) if after is None else None
+            if after is not None:
+                quotes = [quote for quote in quotes if _sort_key(quote) < after]
+            quotes = quotes[offset:offset + limit + 1]
+        else:
+            total = self.quotes.count(user_id, category) if after is None else None
+            quotes = self.quotes.page(user_id, limit + 1, category, after, offset)
+
+        next_cursor = None
+        if len(quotes) > limit:
+            quotes = quotes[:limit]
+            next_cursor = encode_cursor(list(_sort_key(quotes[-1])))
+        return quotes, next_cursor, total
@@ -0,0 +1,243 @@
+import os
+import time
+import random
+from itertools import count
+from typing import Dict, List, Optional
+
+from llm_client import generate_content
+from content_pool import ContentPool, chunk_counts, parse_batch
+from prompts import render_prompt
+
+# Generation parameters tuned for variety
+generation_config = {
+    "temperature": 1.0,  # Increased temperature for more randomness
+    "top_p": 1.0,
+    "top_k": 40,
+    "max_output_tokens": 256,
+}
+
+# Category-specific quote prompts
+QUOTE_CATEGORY_PROMPTS = {
+    'inspiration': """
+        Generate a single, inspiring therapeutic quote that motivates action and positive change.
+        The quote should be brief (under 150 characters), uplifting, and focused on motivation.
+        Do not include any explanation, attribution, or quotation marks unless it's from a specific person.
+    """,
+    'mindfulness': """
+        Provide a single mindfulness quote that helps ground someone in the present moment.
+        Keep it brief (under 150 characters), insightful, and focused on awareness and presence.
+        Just the quote text with no additional formatting.
+    """,
+    'growth': """
+        Create a single therapeutic quote about personal growth, learning, and self-improvement.
+        Make it concise (under 150 characters), affirming, and focused on the journey of becoming better.
+        Only provide the quote itself without any additional context.
+    """,
+    'resilience': """
+        Generate one unique quote about resilience, overcoming challenges, and inner strength.
+        It should be short (under 150 characters), empowering, and focused on bouncing back from difficulty.
+        Just the quote text with no additional formatting or context.
+    """
+}
+
+# List of quote prompt variations to ensure diversity
+QUOTE_PROMPTS = [
+    """
+    Generate a single, inspiring therapeutic quote about self-compassion and personal growth.
+    The quote should be brief (under 150 characters), uplifting, and meaningful.
+    Do not include any explanation, attribution, or quotation marks unless it's from a specific person.
+    """,
+    
+    """
+    Create one short, powerful quote about resilience and overcoming challenges.
+    Make it inspirational, concise (under 150 characters), and focused on inner strength.
+    Only provide the quote itself without any additional context or formatting.
+    """,
+    
+    """
+    Provide a single mindfulness quote that offers perspective on being present.
+    Keep it brief (under 150 characters), insightful, and calming.
+    No explanation or context needed, just the quote itself.
+    """,
+    
+    """
+    Generate one unique quote about healing and emotional well-being.
+    It should be short (under 150 characters), hopeful, and emotionally resonant.
+    Just the quote text with no additional formatting or context.
+    """,
+    
+    """
+    Create a single motivational quote about self-acceptance and personal value.
+    Keep it concise (under 150 characters), affirming, and positive.
+    Only the quote text is needed, no attribution unless it's from someone specific.
+    """
+]
+
+# Pool used for requests without a (valid) category
+RANDOM_CATEGORY = 'random'
+
+# Most quotes requested in one batched Gemini call
+QUOTE_BATCH_MAX_ITEMS = int(os.getenv("QUOTE_BATCH_MAX_ITEMS", "40"))
+
+# Quotes longer than this are discarded
+QUOTE_MAX_CHARS = 200
+
+# Output tokens budgeted per quote in a batch (text plus JSON syntax)
+BATCH_TOKENS_PER_QUOTE = 60
+
+# What each pool's quotes are about, for batch prompts
+QUOTE_BATCH_THEMES = {
+    'inspiration': "motivating action and positive change",
+    'mindfulness': "being grounded in the present moment",
+    'growth': "personal growth, learning and self-improvement",
+    'resilience': "resilience, overcoming challenges and inner strength",
+    RANDOM_CATEGORY: "any of self-compassion, healing, self-acceptance, resilience or mindfulness"
+}
+
+# Default quotes as fallback
+DEFAULT_QUOTES = {
+    'inspiration': "Small steps every day add up to big changes.",
+    'mindfulness': "This breath, this moment, is enough.",
+    'growth': "Every mistake is a lesson on the way to who I am becoming.",
+    'resilience': "Every moment is a fresh beginning."
+}
+
+_prompt_counter = count()
+
+def generate_quote(category: str) -> Optional[dict]:
+    """
+    Generates a therapeutic quote for a category using Gemini API.
+    
+    Args:
+        category (str): One of QUOTE_CATEGORY_PROMPTS, or RANDOM_CATEGORY to pick
+            from every prompt (the quote is then assigned a random category)
+        
+    Returns:
+        dict: {'text': str, 'category': str}, or None if generation fails
+    """
+    try:
+        if category in QUOTE_CATEGORY_PROMPTS:
+            selected_prompt = QUOTE_CATEGORY_PROMPTS[category]
+        else:
+            # Choose randomly from all prompts and randomly assign a category
+            selected_prompt = random.choice(list(QUOTE_CATEGORY_PROMPTS.values()) + QUOTE_PROMPTS)
+            category = random.choice(list(QUOTE_CATEGORY_PROMPTS))
+        
+        # Vary the prompt so consecutive pool items differ
+        prompt = render_prompt('quote', instruction=selected_prompt, nonce=f"{int(time.time())}-{next(_prompt_counter)}")
+        
+        response = generate_content(
+            prompt,
+            generation_config=generation_config,
+            route='quote'
+        )
+        
+        if not response or not response.text.strip():
+            return None
+        
+        # Remove extra quotes if present
+        quote_text = response.text.strip()
+        if quote_text.startswith('"') and quote_text.endswith('"'):
+            quote_text = quote_text[1:-1]
+        return {'text': quote_text, 'category': category}
+        
+    except Exception as e:
+        print(f"Error generating quote: {str(e)}")
+        return None
+
+def clean_quote(text) -> Optional[str]:
+    """
+    Validates one generated quote.
+
+    Returns:
+        str: The quote without surrounding quotation marks, or None if it isn't short, single-line text
+    """
+    if not isinstance(text, str):
+        return None
+    text = text.strip().strip('"').strip()
+    if not text or '\n' in text or len(text) > QUOTE_MAX_CHARS:
+        return None
+    return text
+
+def _request_quote_batch(counts: Dict[str, int]) -> Dict[str, List[str]]:
+    """One Gemini call returning {category: [quote texts]} as JSON"""
+    wanted = '\n'.join(
+        f'- "{category}": {count} quotes about {QUOTE_BATCH_THEMES[category]}.'
+        for category, count in counts.items()
+    )
+    prompt = render_prompt('quote_batch', wanted=wanted, nonce=f"{int(time.time())}-{next(_prompt_counter)}")
+
+    batch_config = dict(generation_config)
+    batch_config["max_output_tokens"] = BATCH_TOKENS_PER_QUOTE * sum(counts.values()) + 50
+    response = generate_content(
+        prompt,
+        generation_config=batch_config,
+        route='quote_batch'
+    )
+    if not response or not hasattr(response, 'text'):
+        return {}
+    return parse_batch(response.text, counts)
+
+def generate_quote_batch(counts: Dict[str, int]) -> Dict[str, List[dict]]:
+    """
+    Generates quotes for several pools with as few Gemini calls as possible.
+
+    Up to QUOTE_BATCH_MAX_ITEMS quotes are requested per call as a JSON
+    object. Invalid entries and duplicates (within the batch, across
+    categories, or matching a default quote) are dropped. Quotes for
+    RANDOM_CATEGORY are assigned a random category, as in generate_quote.
+
+    Args:
+        counts (dict): {category: number of quotes wanted}
+
+    Returns:
+        dict: {category: [{'text': str, 'category': str}, ...]}, possibly with
+            fewer items than asked for, or none for categories whose generation failed
+    """
+    counts = {category: wanted for category, wanted in counts.items()
+              if wanted > 0 and category in QUOTE_BATCH_THEMES}
+    seen = {quote.lower() for quote in DEFAULT_QUOTES.values()}
+    results = {}
+    for chunk in chunk_counts(counts, QUOTE_BATCH_MAX_ITEMS):
+        try:
+            batch = _request_quote_batch(chunk)
+        except Exception as e:
+            print(f"Error generating quote batch: {str(e)}")
+            continue
+        for category, texts in batch.items():
+            for text in texts:
+                quote_text = clean_quote(text)
+                if quote_text is None or quote_text.lower() in seen:
+                    continue
+                seen.add(quote_text.lower())
+                quote_category = random.choice(list(QUOTE_CATEGORY_PROMPTS)) if category == RANDOM_CATEGORY else category
+                results.setdefault(category, []).append({'text': quote_text, 'category': quote_category})
+                if len(results[category]) >= chunk[category]:
+                    break
+    return results
+
+# Pre-generated quotes per category, refilled in the background with batched calls
+quote_pool = ContentPool('quote', list(QUOTE_CATEGORY_PROMPTS) + [RANDOM_CATEGORY], generate_quote,
+                         generate_batch=generate_quote_batch)
+
+def next_quote(category: str = RANDOM_CATEGORY) -> dict:
+    """
+    Gets a pre-generated quote, falling back to a default quote if the pool is
+    empty. Never waits on the LLM.
+    
+    Args:
+        category (str): A quote category, or RANDOM_CATEGORY
+        
+    Returns:
+        dict: {'text': str, 'category': str}
+    """
+    if category not in QUOTE_CATEGORY_PROMPTS:
+        category = RANDOM_CATEGORY
+    
+    quote = quote_pool.pop(category)
+    if quote:
+        return quote
+    
+    if category == RANDOM_CATEGORY:
+        category = random.choice(list(DEFAULT_QUOTES))
+    return {'text': DEFAULT_QUOTES[category], 'category': category}
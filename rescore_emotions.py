@@ -0,0 +1,297 @@
+"""
+Offline re-scoring of stored emotion labels after an emotion model change.
+
+Streams `chat_emotions` records (written by ChatEmotionLogger.log_emotion) and
+auto-detected `mood_entries` (written by log_mood_to_tracker) in pages,
+classifies them with batched inference spread across a process pool and
+writes changed labels back with bulk writes. Progress is checkpointed after
+every page so an interrupted run can be resumed.
+
+Auto-detected mood entries only keep the first AUTO_DETECTED_NOTE_MAX_CHARS
+characters of the chat message, and the full text isn't stored anywhere they
+can be linked to. Entries whose note may have been cut off are skipped and
+keep their original label, which was scored on the full message. Re-scoring
+the fragment would give a different, worse label.
+
+Firestore (uses the same credentials environment variables as app.py):
+    python rescore_emotions.py firestore --collection chat_emotions --workers 4
+
+Exported store (JSON lines, one record per line, e.g. an export of the
+in-memory storage):
+    python rescore_emotions.py file --input chat_emotions.jsonl --output rescored.jsonl \
+        --collection chat_emotions
+"""
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from dotenv import load_dotenv
+from mood_tracker import DETECTED_EMOTION_TO_MOOD, AUTO_DETECTED_NOTE_PREFIX, AUTO_DETECTED_NOTE_MAX_CHARS
+
+# Firestore allows at most 500 operations per write batch
+FIRESTORE_MAX_BATCH_WRITES = 500
+
+# Per collection: the field holding the text and the field holding the label
+COLLECTIONS = {
+    'chat_emotions': {'text_field': 'message', 'label_field': 'emotion'},
+    'mood_entries': {'text_field': 'note', 'label_field': 'mood'}
+}
+
+def _init_worker(workers: int):
+    """
+    Loads the model once per pool process, splitting the CPU cores between workers.
+    """
+    import torch
+    from emotion_detector import get_emotion_pipeline
+
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // workers))
+    get_emotion_pipeline()
+
+def _classify_chunk(texts: list[str]) -> list[str]:
+    from emotion_detector import batch_analyze_emotions
+    moods, _ = batch_analyze_emotions(texts)
+    return moods
+
+def extract_text(collection: str, record: dict):
+    """
+    Returns the text to re-score for a record, or None if it should be skipped.
+    """
+    text = record.get(COLLECTIONS[collection]['text_field'])
+    if not text or not isinstance(text, str):
+        return None
+
+    if collection == 'mood_entries':
+        # Only entries logged automatically from chat messages carry a detected label
+        if not text.startswith(f"{AUTO_DETECTED_NOTE_PREFIX}: "):
+            return None
+        text = text[len(AUTO_DETECTED_NOTE_PREFIX) + 2:]
+        if text.endswith('...'):
+            text = text[:-3]
+        # A note at the length limit may be a truncated message; its label came from the full text
+        if len(text) >= AUTO_DETECTED_NOTE_MAX_CHARS:
+            return None
+
+    return text or None
+
+def to_label(collection: str, mood: str) -> str:
+    if collection == 'mood_entries':
+        return DETECTED_EMOTION_TO_MOOD.get(mood, 'neutral')
+    return mood
+
+class Rescorer:
+    """
+    Classifies pages of records across a process pool and tracks throughput.
+    """
+
+    def __init__(self, collection: str, workers: int, chunk_size: int):
+        self.collection = collection
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.executor = None
+        if workers > 1:
+            self.executor = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(workers,)
+            )
+        self.started_at = time.monotonic()
+        self.processed = 0
+        self.changed = 0
+        self.skipped = 0
+        self.resumed_from = 0
+
+    def classify(self, texts: list[str]) -> list[str]:
+        chunks = [texts[i:i + self.chunk_size] for i in range(0, len(texts), self.chunk_size)]
+        if self.executor is None:
+            results = map(_classify_chunk, chunks)
+        else:
+            results = self.executor.map(_classify_chunk, chunks)
+        return [mood for chunk_moods in results for mood in chunk_moods]
+
+    def rescore_page(self, records: list[dict]) -> list[tuple[int, str]]:
+        """
+        Re-scores a page of records.
+
+        Returns:
+            list[tuple[int, str]]: (record index, new label) for every record whose label changed
+        """
+        label_field = COLLECTIONS[self.collection]['label_field']
+        indices, texts = [], []
+        for i, record in enumerate(records):
+            text = extract_text(self.collection, record)
+            if text is None:
+                self.skipped += 1
+                continue
+            indices.append(i)
+            texts.append(text)
+
+        updates = []
+        for i, mood in zip(indices, self.classify(texts) if texts else []):
+            label = to_label(self.collection, mood)
+            if records[i].get(label_field) != label:
+                updates.append((i, label))
+
+        self.processed += len(records)
+        self.changed += len(updates)
+        return updates
+
+    def report(self, prefix: str = "Progress"):
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        rate = (self.processed - self.resumed_from) / elapsed
+        print(f"{prefix}: {self.processed} records, {self.changed} relabeled, {self.skipped} skipped, "
+              f"{rate:.1f} records/s")
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+def load_checkpoint(path: str) -> dict:
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+def save_checkpoint(path: str, checkpoint: dict):
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+def init_firestore():
+    """
+    Initializes the Firebase Admin SDK from the same environment variables as app.py.
+    """
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    load_dotenv()
+    firebase_credentials_path = os.getenv("FIREBASE_CREDENTIALS_PATH")
+    if firebase_credentials_path and os.path.exists(firebase_credentials_path):
+        cred = credentials.Certificate(firebase_credentials_path)
+    elif os.getenv("FIREBASE_CREDENTIALS"):
+        cred = credentials.Certificate(json.loads(os.getenv("FIREBASE_CREDENTIALS")))
+    else:
+        raise SystemExit("No Firebase credentials found (FIREBASE_CREDENTIALS_PATH or FIREBASE_CREDENTIALS)")
+
+    firebase_admin.initialize_app(cred)
+    return firestore.client()
+
+def rescore_firestore(rescorer: Rescorer, page_size: int, checkpoint_path: str, dry_run: bool):
+    db = init_firestore()
+    collection_ref = db.collection(rescorer.collection)
+    label_field = COLLECTIONS[rescorer.collection]['label_field']
+
+    checkpoint = load_checkpoint(checkpoint_path)
+    last_doc_id = checkpoint.get('last_doc_id')
+    if last_doc_id:
+        print(f"Resuming {rescorer.collection} after document {last_doc_id}")
+        rescorer.processed = rescorer.resumed_from = checkpoint.get('processed', 0)
+        rescorer.changed = checkpoint.get('changed', 0)
+        rescorer.skipped = checkpoint.get('skipped', 0)
+
+    while True:
+        query = collection_ref.order_by('__name__').limit(page_size)
+        if last_doc_id:
+            query = query.start_after(collection_ref.document(last_doc_id).get())
+        docs = list(query.stream())
+        if not docs:
+            break
+
+        updates = rescorer.rescore_page([doc.to_dict() for doc in docs])
+
+        if not dry_run:
+            for start in range(0, len(updates), FIRESTORE_MAX_BATCH_WRITES):
+                batch = db.batch()
+                for i, label in updates[start:start + FIRESTORE_MAX_BATCH_WRITES]:
+                    batch.update(docs[i].reference, {label_field: label})
+                batch.commit()
+
+        last_doc_id = docs[-1].id
+        save_checkpoint(checkpoint_path, {
+            'collection': rescorer.collection,
+            'last_doc_id': last_doc_id,
+            'processed': rescorer.processed,
+            'changed': rescorer.changed,
+            'skipped': rescorer.skipped
+        })
+        rescorer.report()
+
+def rescore_file(rescorer: Rescorer, input_path: str, output_path: str, page_size: int,
+                 checkpoint_path: str, dry_run: bool):
+    label_field = COLLECTIONS[rescorer.collection]['label_field']
+
+    checkpoint = load_checkpoint(checkpoint_path)
+    skip_lines = checkpoint.get('lines', 0)
+    if skip_lines:
+        print(f"Resuming {input_path} after line {skip_lines}")
+        rescorer.processed = rescorer.resumed_from = checkpoint.get('processed', 0)
+        rescorer.changed = checkpoint.get('changed', 0)
+        rescorer.skipped = checkpoint.get('skipped', 0)
+
+    def write_page(out, records, lines_done):
+        updates = rescorer.rescore_page(records)
+        for i, label in updates:
+            records[i][label_field] = label
+        if out is not None:
+            for record in records:
+                out.write(json.dumps(record) + '\n')
+            out.flush()
+        save_checkpoint(checkpoint_path, {
+            'collection': rescorer.collection,
+            'lines': lines_done,
+            'processed': rescorer.processed,
+            'changed': rescorer.changed,
+            'skipped': rescorer.skipped
+        })
+        rescorer.report()
+
+    out = None if dry_run else open(output_path, 'a' if skip_lines else 'w')
+    try:
+        with open(input_path) as f:
+            records, line_number = [], 0
+            for line_number, line in enumerate(f, start=1):
+                if line_number <= skip_lines or not line.strip():
+                    continue
+                records.append(json.loads(line))
+                if len(records) >= page_size:
+                    write_page(out, records, line_number)
+                    records = []
+            if records:
+                write_page(out, records, line_number)
+    finally:
+        if out is not None:
+            out.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score stored emotion labels with the current model")
+    parser.add_argument('source', choices=['firestore', 'file'], help="Where the records are stored")
+    parser.add_argument('--collection', choices=sorted(COLLECTIONS), required=True)
+    parser.add_argument('--input', help="JSON lines export to read (file source)")
+    parser.add_argument('--output', help="JSON lines file to write (file source)")
+    parser.add_argument('--page-size', type=int, default=500, help="Records per page")
+    parser.add_argument('--chunk-size', type=int, default=64, help="Texts per worker task")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Inference processes")
+    parser.add_argument('--checkpoint', default='', help="Checkpoint file for resuming")
+    parser.add_argument('--dry-run', action='store_true', help="Classify and report without writing")
+    args = parser.parse_args()
+
+    if args.source == 'file' and (not args.input or (not args.output and not args.dry_run)):
+        parser.error("file source requires --input and --output")
+
+    rescorer = Rescorer(args.collection, args.workers, args.chunk_size)
+    try:
+        if args.source == 'firestore':
+            rescore_firestore(rescorer, args.page_size, args.checkpoint, args.dry_run)
+        else:
+            rescore_file(rescorer, args.input, args.output, args.page_size, args.checkpoint, args.dry_run)
+    finally:
+        rescorer.close()
+
+    rescorer.report(prefix="Done")
+
+if __name__ == '__main__':
+    main()
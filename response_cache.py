@@ -0,0 +1,195 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+
+from emotion_cache import cache_key
+
+# Opt-in: replies are only cached when this is enabled
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+
+# Cache parameters (overridable via environment variables)
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_TTL_S = float(os.getenv("RESPONSE_CACHE_TTL_S", str(6 * 60 * 60)))
+RESPONSE_CACHE_MAX_WORDS = int(os.getenv("RESPONSE_CACHE_MAX_WORDS", "8"))
+
+# Minimum cosine similarity between message embeddings for a semantic hit
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.9"))
+
+# Sentence embedding model for similar-message hits; without sentence-transformers
+# only exact (normalized) matches are served
+RESPONSE_CACHE_EMBEDDING_MODEL = os.getenv("RESPONSE_CACHE_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+
+# Words that flip a message's meaning; messages must agree on these for a similar-message hit
+NEGATION_WORDS = {
+    'not', 'no', 'never', 'nothing', 'nobody', 'none', 'nowhere', 'neither', 'nor', 'cannot',
+    'dont', 'doesnt', 'didnt', 'isnt', 'arent', 'wasnt', 'werent', 'cant', 'wont', 'wouldnt',
+    'shouldnt', 'couldnt', 'havent', 'hasnt', 'hadnt', 'aint'
+}
+
+_NON_WORD_RE = re.compile(r"[^\w\s']+")
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# Messages that may carry personal details (numbers, emails, links) are never cached
+_PERSONAL_DETAILS_RE = re.compile(r"\d|@|https?://|www\.", re.IGNORECASE)
+
+def normalize_message(text: str) -> str:
+    """Lowercases, drops punctuation and collapses whitespace"""
+    return _WHITESPACE_RE.sub(' ', _NON_WORD_RE.sub(' ', text.lower())).strip()
+
+def is_cacheable_message(text: str) -> bool:
+    """
+    Only short, generic messages (greetings, small talk) are eligible.
+    """
+    if not text or not isinstance(text, str) or _PERSONAL_DETAILS_RE.search(text):
+        return False
+    words = normalize_message(text).split()
+    return 0 < len(words) <= RESPONSE_CACHE_MAX_WORDS
+
+@lru_cache(maxsize=1)
+def get_sentence_encoder():
+    """
+    Loads the sentence embedding model once, or returns None if
+    sentence-transformers isn't installed.
+    """
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        print("sentence-transformers not installed, response cache only serves exact matches")
+        return None
+    return SentenceTransformer(RESPONSE_CACHE_EMBEDDING_MODEL, device='cpu')
+
+def polarity_signature(normalized: str) -> frozenset:
+    """
+    The negation words ("not", "don't", "never") and un- words ("unhappy") of a normalized message.
+
+    Embeddings barely register negation ("I'm doing okay" and "I'm not doing
+    okay" score as near-duplicates), so similar messages only share a reply
+    when their signatures are equal.
+    """
+    signature = set()
+    for word in normalized.split():
+        bare = word.replace("'", '')
+        if bare in NEGATION_WORDS or word.endswith("n't") or (bare.startswith('un') and len(bare) > 4):
+            signature.add(bare)
+    return frozenset(signature)
+
+def embed_message(normalized: str) -> Optional[np.ndarray]:
+    """
+    Embeds a normalized message as a unit vector, locally, or returns None
+    when no sentence encoder is available.
+    """
+    encoder = get_sentence_encoder()
+    if encoder is None:
+        return None
+    return encoder.encode(normalized, normalize_embeddings=True).astype(np.float32)
+
+class ResponseCache:
+    """
+    Bounded LRU cache with TTL for therapist replies to short, generic messages.
+
+    Entries are grouped by detected emotion and keyed by a hash of the
+    normalized message; the message text itself is never stored. A lookup
+    first tries the exact key, then (when a sentence encoder is available) the
+    most similar cached message with the same emotion and the same negations
+    (see polarity_signature) whose embedding reaches `similarity`.
+
+    Callers must not look up or store crisis-flagged turns.
+    """
+
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL_S,
+                 similarity: float = RESPONSE_CACHE_SIMILARITY, enabled: bool = RESPONSE_CACHE_ENABLED):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.similarity = similarity
+        self.enabled = enabled
+        self._entries = OrderedDict()  # key -> (emotion, embedding, response, expires_at, polarity)
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'semantic_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'expirations': 0
+        }
+
+    @staticmethod
+    def _key(emotion: str, normalized: str) -> str:
+        return cache_key(f"{emotion}\n{normalized}")
+
+    def get(self, emotion: str, text: str) -> Optional[str]:
+        """
+        Returns a cached reply for this emotion and message, or None.
+        """
+        if not self.enabled or not is_cacheable_message(text):
+            return None
+
+        normalized = normalize_message(text)
+        key = self._key(emotion, normalized)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[3] > now:
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return entry[2]
+                del self._entries[key]
+                self.stats['expirations'] += 1
+            # Expired entries are skipped here and aged out by the LRU bound
+            polarity = polarity_signature(normalized)
+            candidates = [
+                (k, e) for k, e in self._entries.items()
+                if e[0] == emotion and e[3] > now and e[1] is not None and e[4] == polarity
+            ]
+
+        embedding = embed_message(normalized) if candidates else None
+        if embedding is not None:
+            scores = np.stack([entry[1] for _, entry in candidates]) @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] >= self.similarity:
+                best_key, best_entry = candidates[best]
+                with self._lock:
+                    if best_key in self._entries:
+                        self._entries.move_to_end(best_key)
+                    self.stats['semantic_hits'] += 1
+                return best_entry[2]
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, emotion: str, text: str, response: str):
+        """
+        Caches a reply if the message is eligible.
+        """
+        if not self.enabled or not response or not is_cacheable_message(text):
+            return
+
+        normalized = normalize_message(text)
+        key = self._key(emotion, normalized)
+        embedding = embed_message(normalized)
+        with self._lock:
+            self._entries[key] = (emotion, embedding, response, time.time() + self.ttl, polarity_signature(normalized))
+            self._entries.move_to_end(key)
+            self.stats['stores'] += 1
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats['size'] = len(self._entries)
+        stats['enabled'] = self.enabled
+        lookups = stats['hits'] + stats['semantic_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['semantic_hits']) / lookups if lookups else 0.0
+        return stats
+
+response_cache = ResponseCache()
@@ -0,0 +1,117 @@
+import os
+import heapq
+import time
+import threading
+from concurrent.futures import Future
+from typing import Callable, Hashable
+
+# Seconds an Idempotency-Key's result is replayed to retries
+IDEMPOTENCY_TTL_S = float(os.getenv("IDEMPOTENCY_TTL_S", str(10 * 60)))
+
+# Seconds a result is replayed to identical messages sent without a key (double-clicks)
+DUPLICATE_WINDOW_S = float(os.getenv("DUPLICATE_WINDOW_S", "2"))
+
+# Seconds a duplicate waits for the original request to finish
+SINGLE_FLIGHT_WAIT_S = float(os.getenv("SINGLE_FLIGHT_WAIT_S", "60"))
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one.
+
+    The first caller for a key becomes the leader and does the work; callers
+    arriving while it runs get the leader's Future and wait on the same
+    result. A successful result is kept for the key's replay TTL so retries
+    that arrive just after the leader finished get it too. Failures are not
+    kept: the next call for the key runs again.
+    """
+
+    def __init__(self):
+        self._calls = {}     # key -> (Future, expires_at or None while in flight)
+        self._expiries = []  # heap of (expires_at, key)
+        self._lock = threading.Lock()
+        self.stats = {
+            'leaders': 0,
+            'coalesced': 0,
+            'replayed': 0
+        }
+
+    def _purge(self, now: float):
+        # Caller holds self._lock
+        while self._expiries and self._expiries[0][0] <= now:
+            expires_at, key = heapq.heappop(self._expiries)
+            entry = self._calls.get(key)
+            if entry is not None and entry[1] == expires_at:
+                del self._calls[key]
+
+    def begin(self, key: Hashable) -> tuple[bool, Future]:
+        """
+        Joins the call for a key, or starts one.
+
+        Returns:
+            tuple: (True, Future) for the leader, which must call `finish`;
+                (False, Future) for a caller that should wait on the leader's result
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            entry = self._calls.get(key)
+            if entry is not None:
+                future, expires_at = entry
+                self.stats['coalesced' if expires_at is None else 'replayed'] += 1
+                return False, future
+
+            future = Future()
+            self._calls[key] = (future, None)
+            self.stats['leaders'] += 1
+            return True, future
+
+    def finish(self, key: Hashable, future: Future, result=None, error: BaseException = None,
+               ttl: float = 0.0):
+        """
+        Resolves the leader's Future and keeps a successful result for `ttl` seconds.
+        """
+        with self._lock:
+            if error is not None or ttl <= 0:
+                self._calls.pop(key, None)
+            else:
+                expires_at = time.monotonic() + ttl
+                self._calls[key] = (future, expires_at)
+                heapq.heappush(self._expiries, (expires_at, key))
+
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: Hashable, fn: Callable, ttl: float = 0.0, timeout: float = SINGLE_FLIGHT_WAIT_S):
+        """
+        Runs fn() once for all concurrent callers with the same key.
+
+        Args:
+            key: Identifies duplicate calls
+            fn (callable): The work; its exceptions propagate to every waiting caller
+            ttl (float): Seconds to replay a successful result to later callers
+            timeout (float): Seconds a duplicate waits for the leader
+
+        Returns:
+            fn's result
+        """
+        leader, future = self.begin(key)
+        if not leader:
+            return future.result(timeout=timeout)
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, future, error=e)
+            raise
+        self.finish(key, future, result=result, ttl=ttl)
+        return result
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats['tracked_keys'] = len(self._calls)
+        return stats
+
+message_flights = SingleFlight()
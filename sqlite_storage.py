@@ -0,0 +1,428 @@
+import os
+import json
+import uuid
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+from chat_store import CHAT_LIST_FIELDS, message_preview
+from storage import Storage
+
+# Storage used when Firestore isn't configured: "memory" keeps data in each
+# worker process (lost on restart), "sqlite" shares one database file between
+# the workers of a node
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "memory").lower()
+
+# Database file for STORAGE_BACKEND=sqlite
+SQLITE_PATH = os.getenv("SQLITE_PATH", "instance/therapist.db")
+
+# How long a write waits for another worker's write to finish before failing
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS mood_entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    mood TEXT NOT NULL,
+    note TEXT
+);
+CREATE INDEX IF NOT EXISTS mood_entries_user_date ON mood_entries (user_id, date);
+
+CREATE TABLE IF NOT EXISTS chat_emotions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    message TEXT,
+    emotion TEXT,
+    timestamp INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chat_emotions_user_timestamp ON chat_emotions (user_id, timestamp);
+
+CREATE TABLE IF NOT EXISTS chats (
+    user_id TEXT NOT NULL,
+    chat_id TEXT NOT NULL,
+    updated_at INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL,
+    PRIMARY KEY (user_id, chat_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS chats_user_updated ON chats (user_id, updated_at, chat_id);
+
+CREATE TABLE IF NOT EXISTS chat_messages (
+    user_id TEXT NOT NULL,
+    chat_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (user_id, chat_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS chat_messages_idempotency_key
+    ON chat_messages (user_id, chat_id, json_extract(data, '$.idempotency_key'))
+    WHERE json_extract(data, '$.idempotency_key') IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS quotes (
+    quote_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    category TEXT,
+    created_at INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS quotes_user_created ON quotes (user_id, created_at, quote_id);
+CREATE INDEX IF NOT EXISTS quotes_user_category_created ON quotes (user_id, category, created_at, quote_id);
+"""
+
+class SQLiteStorage:
+    """
+    An SQLite database file shared by the worker processes of one node.
+
+    The database runs in WAL mode, so readers don't block the writer and the
+    writer doesn't block readers. Concurrent writers from other workers are
+    queued for up to SQLITE_BUSY_TIMEOUT_MS. Each thread gets its own
+    connection (in autocommit mode; use transaction() to group writes).
+    Connections are reopened after a fork, because an SQLite connection must
+    not be used from a child process.
+    """
+
+    def __init__(self, path: str = SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self.stats = {
+            'connections': 0,
+            'transactions': 0
+        }
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._connect()
+        try:
+            # WAL mode is stored in the database file, so later connections inherit it
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+        print(f"Using SQLite storage at {path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+                               isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        # With WAL, NORMAL only syncs at checkpoints: a power loss can drop the
+        # last transactions but never corrupts the database
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """This thread's connection"""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._local = threading.local()
+                    self._pid = os.getpid()
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._lock:
+                self.stats['connections'] += 1
+        return conn
+
+    def execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        return self.connection().execute(sql, params)
+
+    def query(self, sql: str, params: tuple = ()) -> list:
+        """All rows of a query"""
+        return self.connection().execute(sql, params).fetchall()
+
+    def query_one(self, sql: str, params: tuple = ()) -> Optional[sqlite3.Row]:
+        """The first row of a query, or None"""
+        return self.connection().execute(sql, params).fetchone()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs the block's statements as one transaction, committed on success and rolled back on error.
+
+        The write lock is taken up front (BEGIN IMMEDIATE), so read-modify-write
+        blocks can't interleave with another worker's.
+        """
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        with self._lock:
+            self.stats['transactions'] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self.stats, path=self.path)
+
+def open_local_storage() -> Optional[SQLiteStorage]:
+    """
+    The storage configured by STORAGE_BACKEND for running without Firestore.
+
+    Returns:
+        SQLiteStorage: For STORAGE_BACKEND=sqlite, or None to use in-memory storage
+    """
+    if STORAGE_BACKEND == 'sqlite':
+        return SQLiteStorage(SQLITE_PATH)
+    if STORAGE_BACKEND != 'memory':
+        print(f"Unknown STORAGE_BACKEND '{STORAGE_BACKEND}', using in-memory storage")
+    return None
+
+class SQLiteUsers:
+    """Profiles are JSON rows in `users`"""
+
+    def __init__(self, sql: SQLiteStorage):
+        self.sql = sql
+
+    def get(self, user_id: str) -> Optional[dict]:
+        row = self.sql.query_one("SELECT data FROM users WHERE user_id = ?", (user_id,))
+        return json.loads(row['data']) if row is not None else None
+
+    def create(self, user_id: str, data: dict) -> bool:
+        cursor = self.sql.execute("INSERT OR IGNORE INTO users (user_id, data) VALUES (?, ?)",
+                                  (user_id, json.dumps(data)))
+        return cursor.rowcount > 0
+
+    def update(self, user_id: str, fields: dict):
+        with self.sql.transaction() as conn:
+            row = conn.execute("SELECT data FROM users WHERE user_id = ?", (user_id,)).fetchone()
+            data = dict(json.loads(row['data']) if row is not None else {}, **fields)
+            conn.execute("INSERT OR REPLACE INTO users (user_id, data) VALUES (?, ?)", (user_id, json.dumps(data)))
+
+class SQLiteMoodEntries:
+    """Entry IDs are the rows' integer IDs, which also order same-day entries"""
+
+    def __init__(self, sql: SQLiteStorage):
+        self.sql = sql
+
+    def add(self, entry: dict) -> str:
+        cursor = self.sql.execute(
+            "INSERT INTO mood_entries (user_id, date, mood, note) VALUES (?, ?, ?, ?)",
+            (entry['user_id'], entry['date'], entry['mood'], entry.get('note'))
+        )
+        return str(cursor.lastrowid)
+
+    def get(self, entry_id: str) -> Optional[dict]:
+        if not entry_id.isdigit():
+            return None
+        row = self.sql.query_one("SELECT user_id, date, mood, note FROM mood_entries WHERE id = ?", (int(entry_id),))
+        return dict(row) if row is not None else None
+
+    def list_for_user(self, user_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                      limit: Optional[int] = None) -> list:
+        # Served by the (user_id, date) index
+        sql = "SELECT user_id, date, mood, note FROM mood_entries WHERE user_id = ?"
+        params = [user_id]
+        if start_date:
+            sql += " AND date >= ?"
+            params.append(start_date)
+        if end_date:
+            sql += " AND date <= ?"
+            params.append(end_date)
+        sql += " ORDER BY date DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [dict(row) for row in self.sql.query(sql, tuple(params))]
+
+    def latest(self, user_id: str) -> Optional[dict]:
+        entries = self.list_for_user(user_id, limit=1)
+        return entries[0] if entries else None
+
+    def update(self, entry_id: str, fields: dict) -> bool:
+        if not entry_id.isdigit():
+            return False
+        # Only known columns are written
+        fields = {column: fields[column] for column in ('mood', 'note') if column in fields}
+        if not fields:
+            return self.sql.query_one("SELECT 1 FROM mood_entries WHERE id = ?", (int(entry_id),)) is not None
+        assignments = ', '.join(f"{column} = ?" for column in fields)
+        cursor = self.sql.execute(f"UPDATE mood_entries SET {assignments} WHERE id = ?",
+                                  tuple(fields.values()) + (int(entry_id),))
+        return cursor.rowcount > 0
+
+    def delete(self, entry_id: str) -> bool:
+        if not entry_id.isdigit():
+            return False
+        return self.sql.execute("DELETE FROM mood_entries WHERE id = ?", (int(entry_id),)).rowcount > 0
+
+class SQLiteChatEmotions:
+    def __init__(self, sql: SQLiteStorage):
+        self.sql = sql
+
+    def add(self, entry: dict) -> str:
+        cursor = self.sql.execute(
+            "INSERT INTO chat_emotions (user_id, message, emotion, timestamp) VALUES (?, ?, ?, ?)",
+            (entry['user_id'], entry.get('message'), entry.get('emotion'), entry['timestamp'])
+        )
+        return str(cursor.lastrowid)
+
+class SQLiteChats:
+    """
+    Chat metadata is a JSON row in `chats` and each message a row in
+    `chat_messages` keyed by (user, chat, seq).
+    """
+
+    def __init__(self, sql: SQLiteStorage):
+        self.sql = sql
+
+    def create(self, user_id: str, chat_data: dict, messages: list) -> str:
+        chat_id = str(uuid.uuid4())
+        with self.sql.transaction() as conn:
+            conn.execute("INSERT INTO chats (user_id, chat_id, updated_at, data) VALUES (?, ?, ?, ?)",
+                         (user_id, chat_id, chat_data.get('updated_at') or 0, json.dumps(chat_data)))
+            conn.executemany(
+                "INSERT INTO chat_messages (user_id, chat_id, seq, data) VALUES (?, ?, ?, ?)",
+                [(user_id, chat_id, message['seq'], json.dumps(message)) for message in messages]
+            )
+        return chat_id
+
+    def get(self, user_id: str, chat_id: str) -> Optional[dict]:
+        row = self.sql.query_one("SELECT data FROM chats WHERE user_id = ? AND chat_id = ?", (user_id, chat_id))
+        return json.loads(row['data']) if row is not None else None
+
+    def latest_messages(self, user_id: str, chat_id: str, limit: int, before: Optional[int] = None) -> list:
+        sql = "SELECT data FROM chat_messages WHERE user_id = ? AND chat_id = ?"
+        params = (user_id, chat_id)
+        if before is not None:
+            sql += " AND seq < ?"
+            params += (before,)
+        rows = self.sql.query(sql + " ORDER BY seq DESC LIMIT ?", params + (limit,))
+        return [json.loads(row['data']) for row in reversed(rows)]
+
+    def messages_between(self, user_id: str, chat_id: str, start: int, end: int) -> list:
+        rows = self.sql.query(
+            "SELECT data FROM chat_messages WHERE user_id = ? AND chat_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+            (user_id, chat_id, start, end)
+        )
+        return [json.loads(row['data']) for row in rows]
+
+    def find_message(self, user_id: str, chat_id: str, idempotency_key: str) -> Optional[dict]:
+        # Served by the partial chat_messages_idempotency_key index
+        row = self.sql.query_one(
+            "SELECT data FROM chat_messages WHERE user_id = ? AND chat_id = ? "
+            "AND json_extract(data, '$.idempotency_key') = ? LIMIT 1",
+            (user_id, chat_id, idempotency_key)
+        )
+        return json.loads(row['data']) if row is not None else None
+
+    def append_messages(self, user_id: str, chat_id: str, chat_data: dict, new_messages: list,
+                        timestamp: int) -> list:
+        with self.sql.transaction() as conn:
+            row = conn.execute("SELECT data FROM chats WHERE user_id = ? AND chat_id = ?",
+                               (user_id, chat_id)).fetchone()
+            stored = json.loads(row['data'])
+            seq = stored.get('message_count', 0)
+            stamped = [dict(message, seq=seq + i) for i, message in enumerate(new_messages)]
+            conn.executemany(
+                "INSERT INTO chat_messages (user_id, chat_id, seq, data) VALUES (?, ?, ?, ?)",
+                [(user_id, chat_id, message['seq'], json.dumps(message)) for message in stamped]
+            )
+            stored.update({
+                'message_count': seq + len(stamped),
+                'last_message': message_preview(stamped[-1]),
+                'updated_at': timestamp
+            })
+            conn.execute("UPDATE chats SET data = ?, updated_at = ? WHERE user_id = ? AND chat_id = ?",
+                         (json.dumps(stored), timestamp, user_id, chat_id))
+        return stamped
+
+    def update(self, user_id: str, chat_id: str, fields: dict):
+        with self.sql.transaction() as conn:
+            row = conn.execute("SELECT data FROM chats WHERE user_id = ? AND chat_id = ?",
+                               (user_id, chat_id)).fetchone()
+            if row is None:
+                return
+            chat_data = dict(json.loads(row['data']), **fields)
+            conn.execute("UPDATE chats SET data = ?, updated_at = ? WHERE user_id = ? AND chat_id = ?",
+                         (json.dumps(chat_data), chat_data.get('updated_at') or 0, user_id, chat_id))
+
+    def list(self, user_id: str, limit: int, after: Optional[tuple] = None) -> list:
+        # Served by the (user_id, updated_at, chat_id) index
+        sql = "SELECT chat_id, data FROM chats WHERE user_id = ?"
+        params = (user_id,)
+        if after:
+            sql += " AND (updated_at < ? OR (updated_at = ? AND chat_id < ?))"
+            params += (after[0] or 0, after[0] or 0, str(after[1]))
+        rows = self.sql.query(sql + " ORDER BY updated_at DESC, chat_id DESC LIMIT ?", params + (limit,))
+        page = []
+        for row in rows:
+            chat_data = json.loads(row['data'])
+            page.append(dict({field: chat_data.get(field) for field in CHAT_LIST_FIELDS}, id=row['chat_id']))
+        return page
+
+    def delete(self, user_id: str, chat_id: str) -> bool:
+        with self.sql.transaction() as conn:
+            conn.execute("DELETE FROM chat_messages WHERE user_id = ? AND chat_id = ?", (user_id, chat_id))
+            deleted = conn.execute("DELETE FROM chats WHERE user_id = ? AND chat_id = ?", (user_id, chat_id))
+        return deleted.rowcount > 0
+
+class SQLiteQuotes:
+    """Pages are served by the (user_id, created_at) and (user_id, category, created_at) indexes"""
+
+    def __init__(self, sql: SQLiteStorage):
+        self.sql = sql
+
+    def add(self, user_id: str, quote_data: dict) -> dict:
+        quote = dict(quote_data, id=str(uuid.uuid4()))
+        self.sql.execute(
+            "INSERT INTO quotes (quote_id, user_id, text, category, created_at) VALUES (?, ?, ?, ?, ?)",
+            (quote['id'], user_id, quote.get('text', ''), quote.get('category'), quote.get('created_at') or 0)
+        )
+        return quote
+
+    def delete(self, user_id: str, quote_id: str):
+        self.sql.execute("DELETE FROM quotes WHERE user_id = ? AND quote_id = ?", (user_id, quote_id))
+
+    def all_for_user(self, user_id: str) -> list:
+        rows = self.sql.query("SELECT quote_id AS id, text, category, created_at FROM quotes WHERE user_id = ?",
+                              (user_id,))
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def _where(user_id: str, category: Optional[str]) -> tuple:
+        if category:
+            return "user_id = ? AND category = ?", (user_id, category)
+        return "user_id = ?", (user_id,)
+
+    def page(self, user_id: str, limit: int, category: Optional[str] = None,
+             after: Optional[tuple] = None, offset: int = 0) -> list:
+        where, params = self._where(user_id, category)
+        if after is not None:
+            where += " AND (created_at < ? OR (created_at = ? AND quote_id < ?))"
+            params += (after[0] or 0, after[0] or 0, str(after[1]))
+        rows = self.sql.query(
+            f"SELECT quote_id AS id, text, category, created_at FROM quotes WHERE {where} "
+            "ORDER BY created_at DESC, quote_id DESC LIMIT ? OFFSET ?",
+            params + (limit, offset)
+        )
+        return [dict(row) for row in rows]
+
+    def count(self, user_id: str, category: Optional[str] = None) -> Optional[int]:
+        where, params = self._where(user_id, category)
+        return self.sql.query_one(f"SELECT COUNT(*) FROM quotes WHERE {where}", params)[0]
+
+def sqlite_storage(sql: SQLiteStorage) -> Storage:
+    return Storage(
+        backend='SQLite',
+        users=SQLiteUsers(sql),
+        mood_entries=SQLiteMoodEntries(sql),
+        chat_emotions=SQLiteChatEmotions(sql),
+        chats=SQLiteChats(sql),
+        quotes=SQLiteQuotes(sql)
+    )
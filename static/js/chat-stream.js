@@ -0,0 +1,126 @@
+/**
+ * Streaming chat replies over Server-Sent Events
+ *
+ * POSTs a message to one of the `/messages/stream` endpoints and reads the
+ * text/event-stream body with fetch, calling back as events arrive:
+ *   meta  - screening result (detected emotion, crisis flag, ...)
+ *   token - a chunk of the reply text
+ *   done  - the full payload, same shape as the non-streaming endpoint
+ *   error - generation failed ({error, message})
+ *
+ * Resolves with the `done` payload. If the browser can't read response
+ * streams, or the stream endpoint fails or drops before the reply is done,
+ * the message is sent to `fallbackUrl` instead and its JSON response is
+ * returned.
+ *
+ * Every send carries one Idempotency-Key, reused by the fallback request, so
+ * the server answers and saves a message once however often it is retried.
+ */
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}${Math.random().toString(36).slice(2)}`;
+}
+
+async function streamChatMessage(url, fallbackUrl, body, handlers = {}) {
+    const idempotencyKey = newIdempotencyKey();
+    const postJson = (target, accept) => fetch(target, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': accept,
+            'Idempotency-Key': idempotencyKey
+        },
+        body: JSON.stringify(body)
+    });
+
+    const fallback = async () => {
+        const response = await postJson(fallbackUrl, 'application/json');
+        if (!response.ok) {
+            throw new Error(`Server responded with status: ${response.status}`);
+        }
+        return response.json();
+    };
+
+    if (!window.ReadableStream || !window.TextDecoder) {
+        return fallback();
+    }
+
+    let response;
+    try {
+        response = await postJson(url, 'text/event-stream');
+    } catch (error) {
+        console.warn('Streaming request failed, falling back:', error);
+        return fallback();
+    }
+
+    const contentType = response.headers.get('Content-Type') || '';
+    if (!response.ok || !contentType.startsWith('text/event-stream') || !response.body) {
+        // Validation errors (missing chat, empty message) come back as JSON
+        if (response.status >= 400 && response.status < 500) {
+            const data = await response.json().catch(() => ({}));
+            throw new Error(data.error || `Server responded with status: ${response.status}`);
+        }
+        return fallback();
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let result = null;
+
+    const dispatch = (rawEvent) => {
+        let event = 'message';
+        const dataLines = [];
+        rawEvent.split('\n').forEach(line => {
+            if (line.startsWith('event:')) {
+                event = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                dataLines.push(line.slice(5).trim());
+            }
+        });
+        if (!dataLines.length) return;
+
+        const data = JSON.parse(dataLines.join('\n'));
+        if (event === 'meta' && handlers.onMeta) {
+            handlers.onMeta(data);
+        } else if (event === 'token' && handlers.onToken) {
+            handlers.onToken(data.text);
+        } else if (event === 'done') {
+            result = data;
+        } else if (event === 'error') {
+            const error = new Error(data.error || 'Failed to generate a response');
+            error.payload = data;
+            throw error;
+        }
+    };
+
+    while (true) {
+        let chunk;
+        try {
+            chunk = await reader.read();
+        } catch (error) {
+            // The connection dropped mid-reply; the same key makes the retry safe
+            console.warn('Response stream interrupted, falling back:', error);
+            return fallback();
+        }
+        const { value, done } = chunk;
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            dispatch(buffer.slice(0, boundary));
+            buffer = buffer.slice(boundary + 2);
+        }
+    }
+    if (buffer.trim()) {
+        dispatch(buffer);
+    }
+
+    if (!result) {
+        throw new Error('The response stream ended unexpectedly');
+    }
+    return result;
+}
@@ -0,0 +1,146 @@
+"""
+Storage interface shared by the app's stores.
+
+Each collection is reached through a small repository with one
+implementation per backend: Firestore (firestore_storage.py), SQLite
+(sqlite_storage.py) and per-process memory (memory_storage.py). The stores
+(MoodTracker, ChatEmotionLogger, ChatStore, QuoteStore) hold the app logic
+and are given the repositories of whichever backend is configured, so they
+never branch on it.
+"""
+from dataclasses import dataclass
+from typing import Optional, Protocol
+
+class UserRepository(Protocol):
+    """User profiles and preferences, keyed by user ID"""
+
+    def get(self, user_id: str) -> Optional[dict]:
+        """The user's profile, or None if there is none"""
+
+    def create(self, user_id: str, data: dict) -> bool:
+        """Stores a profile unless the user already has one; returns whether it was created"""
+
+    def update(self, user_id: str, fields: dict):
+        """Merges fields into the user's profile, creating it if needed"""
+
+class MoodEntryRepository(Protocol):
+    """Mood entries (see mood_tracker.MoodEntry.to_dict), keyed by entry ID"""
+
+    def add(self, entry: dict) -> str:
+        """Stores an entry and returns its ID"""
+
+    def get(self, entry_id: str) -> Optional[dict]:
+        ...
+
+    def list_for_user(self, user_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                      limit: Optional[int] = None) -> list:
+        """A user's entries within an optional date range: newest date first, then most recently added first"""
+
+    def latest(self, user_id: str) -> Optional[dict]:
+        """The user's newest entry (the first of list_for_user), or None"""
+
+    def update(self, entry_id: str, fields: dict) -> bool:
+        """Returns False if the entry doesn't exist"""
+
+    def delete(self, entry_id: str) -> bool:
+        """Returns False if the entry doesn't exist"""
+
+class ChatEmotionRepository(Protocol):
+    """The emotion detected for each chat message (read back by rescore_emotions.py)"""
+
+    def add(self, entry: dict) -> str:
+        """Stores an entry and returns its ID"""
+
+class ChatRepository(Protocol):
+    """
+    Chats and their messages. Each message carries its position in the chat
+    as `seq`; a chat's metadata holds `message_count` and a `last_message`
+    preview.
+    """
+
+    def create(self, user_id: str, chat_data: dict, messages: list) -> str:
+        """Stores a chat's metadata and first messages (already numbered); returns the chat's ID"""
+
+    def get(self, user_id: str, chat_id: str) -> Optional[dict]:
+        """A chat's metadata, or None if it doesn't exist"""
+
+    def latest_messages(self, user_id: str, chat_id: str, limit: int, before: Optional[int] = None) -> list:
+        """Up to `limit` messages before position `before` (the latest ones if None), oldest first"""
+
+    def messages_between(self, user_id: str, chat_id: str, start: int, end: int) -> list:
+        """Messages at positions [start, end), oldest first"""
+
+    def find_message(self, user_id: str, chat_id: str, idempotency_key: str) -> Optional[dict]:
+        """The message stored with this `idempotency_key`, or None"""
+
+    def append_messages(self, user_id: str, chat_id: str, chat_data: dict, new_messages: list,
+                        timestamp: int) -> list:
+        """
+        Numbers and stores messages after the chat's current last one, updating
+        its count, preview and `updated_at` atomically. chat_data is the
+        chat's metadata as read by get(). Returns the numbered messages.
+        """
+
+    def update(self, user_id: str, chat_id: str, fields: dict):
+        """Merges fields into a chat's metadata"""
+
+    def list(self, user_id: str, limit: int, after: Optional[tuple] = None) -> list:
+        """
+        Up to `limit` chats (the chat_store.CHAT_LIST_FIELDS and `id`), by
+        (updated_at, id) descending, starting after the `after` key.
+        """
+
+    def delete(self, user_id: str, chat_id: str) -> bool:
+        """Deletes a chat and its messages; returns False if it doesn't exist"""
+
+class QuoteRepository(Protocol):
+    """A user's saved quotes"""
+
+    def add(self, user_id: str, quote_data: dict) -> dict:
+        """Stores a quote and returns it with its new `id`"""
+
+    def delete(self, user_id: str, quote_id: str):
+        ...
+
+    def all_for_user(self, user_id: str) -> list:
+        """Every quote's `id`, `text`, `category` and `created_at`, in no particular order"""
+
+    def page(self, user_id: str, limit: int, category: Optional[str] = None,
+             after: Optional[tuple] = None, offset: int = 0) -> list:
+        """Up to `limit` quotes by (created_at, id) descending, starting after the `after` key and skipping `offset`"""
+
+    def count(self, user_id: str, category: Optional[str] = None) -> Optional[int]:
+        """The number of quotes (in a category), or None if the backend can't count cheaply"""
+
+@dataclass
+class Storage:
+    """The repositories of one backend"""
+    backend: str
+    users: UserRepository
+    mood_entries: MoodEntryRepository
+    chat_emotions: ChatEmotionRepository
+    chats: ChatRepository
+    quotes: QuoteRepository
+
+def open_storage(db=None, sql=None) -> Storage:
+    """
+    The repositories of the configured backend.
+
+    Args:
+        db (firestore.Client, optional): Use Firestore
+        sql (SQLiteStorage, optional): Use this SQLite database when db is None
+
+    Returns:
+        Storage: Firestore, SQLite or (when neither is given) in-memory repositories
+    """
+    if db is not None:
+        from firestore_storage import firestore_storage
+        storage = firestore_storage(db)
+    elif sql is not None:
+        from sqlite_storage import sqlite_storage
+        storage = sqlite_storage(sql)
+    else:
+        from memory_storage import memory_storage
+        storage = memory_storage()
+    print(f"Using {storage.backend} storage")
+    return storage
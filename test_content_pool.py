@@ -0,0 +1,33 @@
+import threading
+
+import pytest
+
+from content_pool import ContentPool, chunk_counts, parse_batch
+
+def test_chunk_counts_respects_max_items():
+    assert chunk_counts({'a': 5, 'b': 5, 'c': 5}, 10) == [{'a': 5, 'b': 5}, {'c': 5}]
+    assert chunk_counts({'a': 30}, 10) == [{'a': 10}]
+
+def test_parse_batch_reads_fenced_json():
+    reply = '```json\n{"growth": ["Keep going"], "calm": "not a list", "extra": ["x"]}\n```'
+    assert parse_batch(reply, ['growth', 'calm']) == {'growth': ["Keep going"]}
+    with pytest.raises(ValueError):
+        parse_batch("Sure! Here are some quotes", ['growth'])
+
+def test_startup_fill_is_one_batch_call():
+    calls = []
+    filled = threading.Event()
+
+    def generate_batch(counts):
+        calls.append(dict(counts))
+        filled.set()
+        return {category: [f"{category} {i}" for i in range(count)] for category, count in counts.items()}
+
+    def generate(category):
+        raise AssertionError("single-item generation shouldn't be used")
+
+    pool = ContentPool('test', ['a', 'b', 'c'], generate, low_watermark=1, target_size=3,
+                       refill=True, generate_batch=generate_batch)
+    pool.start()
+    assert filled.wait(5)
+    assert calls[0] == {'a': 3, 'b': 3, 'c': 3}
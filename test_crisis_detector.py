@@ -0,0 +1,40 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from crisis_detector import screen_message
+
+CALM = {'joy': 0.6, 'neutral': 0.3, 'sadness': 0.1}
+DISTRESSED = {'fear': 0.5, 'sadness': 0.4, 'neutral': 0.1}
+
+def calm_model(text):
+    return CALM
+
+def distressed_model(text):
+    return DISTRESSED
+
+@pytest.mark.parametrize('text', [
+    "I'm going to jump off the bridge tonight",
+    "I've saved up enough pills",
+    "I bought a gun",
+    "I will take all my pills",
+    "pills and a bridge",
+])
+def test_danger_words_with_intent_or_together_are_crises_without_the_model(text):
+    screening = screen_message(text, need_emotion=False, analyze=calm_model)
+    assert screening.is_crisis
+    assert not screening.verified_by_model
+
+@pytest.mark.parametrize('text', ["I feel hopeless", "I'm saying goodbye", "I want to die"])
+def test_unambiguous_keywords_ignore_the_model(text):
+    assert screen_message(text, analyze=calm_model).is_crisis
+
+def test_single_bare_danger_word_is_confirmed_by_the_model():
+    text = "The bridge was closed for repairs"
+    calm = screen_message(text, analyze=calm_model)
+    assert not calm.is_crisis and calm.verified_by_model
+    assert screen_message(text, analyze=distressed_model).is_crisis
+
+def test_model_unavailable_counts_as_crisis():
+    assert screen_message("The bridge was closed", analyze=lambda text: None).is_crisis
@@ -0,0 +1,21 @@
+from crisis_matcher import crisis_keyword_matcher, has_intent_context
+
+def intent_around(text):
+    return [has_intent_context(text, match) for match in crisis_keyword_matcher.find(text)]
+
+def test_intent_phrasing_around_danger_words():
+    assert intent_around("I'm going to jump off the bridge tonight") == [True, True]
+    assert intent_around("I've saved up enough pills") == [True]
+    assert intent_around("I bought a gun") == [True]
+    assert intent_around("I will take all my pills") == [True]
+
+def test_bare_danger_words_have_no_intent():
+    assert intent_around("The bridge was closed for repairs") == [False]
+    assert intent_around("My kid loves to jump on the trampoline") == [False]
+
+def test_inflected_forms_match():
+    for text in ["I'm jumping off", "I overdosed", "I feel hopelessness", "guns"]:
+        assert crisis_keyword_matcher.matches(text), text
+
+def test_keywords_need_a_leading_word_boundary():
+    assert not crisis_keyword_matcher.matches("Oil spills are terrible")
@@ -0,0 +1,40 @@
+from quote_store import QuoteStore
+from sqlite_storage import SQLiteStorage, sqlite_storage
+
+def shared_quotes(tmp_path):
+    """The quote repository of an SQLite database shared by two workers"""
+    return sqlite_storage(SQLiteStorage(str(tmp_path / 'therapist.db'))).quotes
+
+def texts(result):
+    return [quote['text'] for quote in result[0]]
+
+def test_search_matches_substrings(tmp_path):
+    store = QuoteStore(shared_quotes(tmp_path))
+    store.add_quote('u1', {'text': "Happiness is a direction", 'created_at': 1})
+    store.add_quote('u1', {'text': "Kindness costs nothing", 'created_at': 2})
+    store.add_quote('u1', {'text': "Rest is productive", 'created_at': 3})
+
+    assert texts(store.list_quotes('u1', search='ness')) == ["Kindness costs nothing", "Happiness is a direction"]
+    assert texts(store.list_quotes('u1', search='PINESS IS')) == ["Happiness is a direction"]
+    assert texts(store.list_quotes('u1', search='is a dir')) == ["Happiness is a direction"]
+    assert texts(store.list_quotes('u1', search='is productive rest')) == []
+
+def test_search_sees_other_workers_writes(tmp_path):
+    repository = shared_quotes(tmp_path)
+    worker_a, worker_b = QuoteStore(repository), QuoteStore(repository)
+    worker_a.add_quote('u1', {'text': "Hope is a thing with feathers", 'created_at': 1})
+    assert texts(worker_b.list_quotes('u1', search='hope')) == ["Hope is a thing with feathers"]
+
+    added = worker_a.add_quote('u1', {'text': "Hope anchors the soul", 'created_at': 2})
+    assert texts(worker_b.list_quotes('u1', search='hope')) == ["Hope anchors the soul", "Hope is a thing with feathers"]
+
+    worker_a.delete_quote('u1', added['id'])
+    assert texts(worker_b.list_quotes('u1', search='hope')) == ["Hope is a thing with feathers"]
+
+def test_page_numbers_without_cursor(tmp_path):
+    store = QuoteStore(shared_quotes(tmp_path))
+    for i in range(5):
+        store.add_quote('u1', {'text': f"quote {i}", 'created_at': i})
+
+    assert texts(store.list_quotes('u1', limit=2, page=2)) == ["quote 2", "quote 1"]
+    assert texts(store.list_quotes('u1', search='quote', limit=2, page=3)) == ["quote 0"]
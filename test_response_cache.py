@@ -0,0 +1,43 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import response_cache
+from response_cache import ResponseCache, polarity_signature, normalize_message
+
+NEGATED_PAIRS = [
+    ("i think i am doing okay now", "i think i am not doing okay now"),
+    ("i'm happy with my life right now", "i'm unhappy with my life right now"),
+    ("i want to talk about it", "i don't want to talk about it"),
+]
+
+@pytest.fixture
+def same_embedding(monkeypatch):
+    """Every message embeds identically, as if the encoder scored them all as near-duplicates"""
+    vector = np.ones(4, dtype=np.float32) / 2
+    monkeypatch.setattr(response_cache, 'embed_message', lambda normalized: vector)
+
+@pytest.mark.parametrize("cached, asked", NEGATED_PAIRS)
+def test_polarity_signatures_differ(cached, asked):
+    assert polarity_signature(normalize_message(cached)) != polarity_signature(normalize_message(asked))
+
+@pytest.mark.parametrize("cached, asked", NEGATED_PAIRS)
+def test_negated_message_is_not_a_semantic_hit(same_embedding, cached, asked):
+    cache = ResponseCache(enabled=True)
+    cache.put('neutral', cached, "reply")
+    assert cache.get('neutral', asked) is None
+    assert cache.get('neutral', cached) == "reply"
+
+def test_similar_message_with_same_polarity_hits(same_embedding):
+    cache = ResponseCache(enabled=True)
+    cache.put('neutral', "thanks that helps", "reply")
+    assert cache.get('neutral', "thank you that really helps") == "reply"
+    assert cache.get_stats()['semantic_hits'] == 1
+
+def test_without_encoder_only_exact_matches_hit(monkeypatch):
+    monkeypatch.setattr(response_cache, 'get_sentence_encoder', lambda: None)
+    cache = ResponseCache(enabled=True)
+    cache.put('neutral', "I think I am doing okay now", "reply")
+    assert cache.get('neutral', "i think i am doing okay now!") == "reply"
+    assert cache.get('neutral', "i think i am not doing okay now") is None
+    assert cache.get('neutral', "i think i'm doing okay now") is None
@@ -0,0 +1,110 @@
+import pytest
+
+from chat_store import ChatStore
+from memory_storage import memory_storage
+from mood_tracker import MoodTracker, MoodEntry
+from quote_store import QuoteStore
+from sqlite_storage import SQLiteStorage, sqlite_storage
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def storage(request, tmp_path):
+    if request.param == 'memory':
+        return memory_storage()
+    return sqlite_storage(SQLiteStorage(str(tmp_path / 'therapist.db')))
+
+def test_users(storage):
+    assert storage.users.get('u1') is None
+    assert storage.users.create('u1', {'name': 'Test User'})
+    assert not storage.users.create('u1', {'name': 'Someone else'})
+    storage.users.update('u1', {'response_cache_opt_out': True})
+    assert storage.users.get('u1') == {'name': 'Test User', 'response_cache_opt_out': True}
+
+    storage.users.update('u2', {'response_cache_opt_out': False})
+    assert storage.users.get('u2') == {'response_cache_opt_out': False}
+
+def test_mood_entries_newest_first(storage):
+    tracker = MoodTracker(storage.mood_entries)
+    first = tracker.add_mood_entry(MoodEntry('u1', '2024-01-01', 'sad'))
+    tracker.add_mood_entry(MoodEntry('u1', '2024-01-02', 'happy'))
+    tracker.add_mood_entry(MoodEntry('u1', '2024-01-02', 'angry'))
+    tracker.add_mood_entry(MoodEntry('u2', '2024-01-03', 'neutral'))
+
+    assert [entry.mood for entry in tracker.get_user_mood_entries('u1')] == ['angry', 'happy', 'sad']
+    assert [entry.mood for entry in tracker.get_user_mood_entries('u1', '2024-01-02', '2024-01-02')] == ['angry', 'happy']
+    assert tracker.get_latest_mood_entry('u1').mood == 'angry'
+    assert tracker.get_latest_mood_entry('u1', end_date='2024-01-01').mood == 'sad'
+    assert tracker.get_latest_mood_entry('u3') is None
+
+    assert tracker.update_mood_entry(first, note="rough day")
+    assert tracker.get_mood_entry(first).note == "rough day"
+    assert tracker.delete_mood_entry(first)
+    assert not tracker.delete_mood_entry(first)
+    assert tracker.get_mood_entry(first) is None
+
+def test_chat_append_and_windows(storage):
+    store = ChatStore(storage.chats)
+    chat_id = store.create_chat('u1', {'title': 'Chat', 'updated_at': 1}, [{'sender': 'system', 'text': 'Hello'}])
+
+    chat_ref, chat_data = store.load_chat('u1', chat_id, window=2)
+    for i in range(3):
+        store.append_messages(chat_ref, chat_data, [{'sender': 'user', 'text': f"m{i}"}], timestamp=10 + i)
+
+    chat_ref, chat_data = store.load_chat('u1', chat_id, window=2)
+    assert [message['text'] for message in chat_data['messages']] == ['m1', 'm2']
+    assert chat_data['messages_offset'] == 2
+    assert [message['text'] for message in store.get_messages(chat_ref, chat_data, 0, 2)] == ['Hello', 'm0']
+
+    chat = store.get_chat('u1', chat_id, limit=3)
+    assert [message['seq'] for message in chat['messages']] == [1, 2, 3]
+    assert chat['has_more'] and chat['next_before'] == 1
+    assert chat['message_count'] == 4 and chat['last_message']['text'] == 'm2'
+
+    store.update_chat(chat_ref, {'summary': 'short'})
+    assert store.get_chat('u1', chat_id)['summary'] == 'short'
+
+    assert store.delete_chat('u1', chat_id)
+    assert store.get_chat('u1', chat_id) is None
+
+def test_chat_idempotent_exchange(storage):
+    store = ChatStore(storage.chats)
+    chat_id = store.create_chat('u1', {'title': 'Chat', 'updated_at': 1}, [])
+    chat_ref, chat_data = store.load_chat('u1', chat_id)
+    store.append_messages(chat_ref, chat_data, [{'sender': 'user', 'text': 'Hi', 'idempotency_key': 'k1'},
+                                                {'sender': 'bot', 'text': 'Hello'}], timestamp=2)
+    for i in range(5):
+        store.append_messages(chat_ref, chat_data, [{'sender': 'user', 'text': f"m{i}"}], timestamp=3 + i)
+    store.append_messages(chat_ref, chat_data, [{'sender': 'user', 'text': 'Again', 'idempotency_key': 'k2'}],
+                          timestamp=9)
+
+    # The keyed message is older than the loaded window
+    chat_ref, chat_data = store.load_chat('u1', chat_id, window=2)
+    message, reply = store.find_idempotent_exchange(chat_ref, chat_data, 'k1')
+    assert message['text'] == 'Hi' and reply['text'] == 'Hello'
+    assert store.find_idempotent_exchange(chat_ref, chat_data, 'k2')[1] is None
+    assert store.find_idempotent_exchange(chat_ref, chat_data, 'k3') is None
+
+def test_chat_list_pages(storage):
+    store = ChatStore(storage.chats)
+    chat_ids = [store.create_chat('u1', {'title': f"Chat {i}", 'updated_at': i}, []) for i in range(5)]
+
+    page, cursor = store.list_chats('u1', limit=3)
+    assert [chat['id'] for chat in page] == chat_ids[:1:-1]
+    page, cursor = store.list_chats('u1', limit=3, cursor=cursor)
+    assert [chat['id'] for chat in page] == chat_ids[1::-1]
+    assert cursor is None
+
+def test_quote_pages_and_search(storage):
+    store = QuoteStore(storage.quotes)
+    for i, text in enumerate(["Gratitude turns what we have into enough", "Breathe", "Be grateful today"]):
+        store.add_quote('u1', {'text': text, 'category': 'gratitude' if i != 1 else 'calm', 'created_at': i})
+
+    quotes, cursor, total = store.list_quotes('u1', limit=2)
+    assert [quote['text'] for quote in quotes] == ["Be grateful today", "Breathe"] and total == 3
+    quotes, cursor, total = store.list_quotes('u1', limit=2, cursor=cursor)
+    assert [quote['text'] for quote in quotes] == ["Gratitude turns what we have into enough"]
+    assert cursor is None and total is None
+
+    quotes, _, total = store.list_quotes('u1', category='gratitude', search='grat')
+    assert total == 2
+    store.delete_quote('u1', quotes[0]['id'])
+    assert store.list_quotes('u1', search='grat')[2] == 1